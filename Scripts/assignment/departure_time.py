@@ -1,10 +1,13 @@
 from __future__ import annotations
-from typing import Any, Callable, Dict, List, Optional, Tuple, Union, cast
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple, Union, cast
 import numpy # type: ignore
+if TYPE_CHECKING:
+    from datatypes.population import TourTable
 from datatypes.demand import Demand
 from datatypes.tour import Tour
 
 import utils.log as log
+from utils.memory import float_dtype
 import parameters.departure_time as param
 from parameters.assignment import transport_classes, assignment_classes
 
@@ -26,6 +29,9 @@ class DepartureTimeModel:
         self.time_periods = time_periods
         self.demand: Optional[Union[int,Dict[str,Dict[str,numpy.ndarray]]]] = None
         self.old_car_demand: Union[int,numpy.ndarray] = 0
+        # Demand of agent tours, kept over iterations when simulating
+        # agents incrementally
+        self.agent_demand: Optional[Dict[str,Dict[str,numpy.ndarray]]] = None
         self.init_demand()
 
     def init_demand(self) -> Dict[str,float]:
@@ -60,7 +66,7 @@ class DepartureTimeModel:
 
         # Init demand
         n = self.nr_zones
-        self.demand = {tp: {tc: numpy.zeros((n, n), numpy.float32)
+        self.demand = {tp: {tc: numpy.zeros((n, n), float_dtype())
                 for tc in transport_classes}
             for tp in self.time_periods}
 
@@ -76,11 +82,7 @@ class DepartureTimeModel:
         """
         demand.purpose.name = cast(str,demand.purpose.name) #type checker hint
         if demand.mode != "walk" and not demand.is_car_passenger:
-            if demand.mode in param.divided_classes:
-                ass_class = "{}_{}".format(
-                    demand.mode, assignment_classes[demand.purpose.name])
-            else:
-                ass_class = demand.mode
+            ass_class = self._assignment_class(demand)
             if len(demand.position) == 2:
                 position2 = cast(Tuple[int,int], demand.position) #type checker hint
                 share: Dict[str, Any] = param.demand_share[demand.purpose.name][demand.mode]
@@ -94,6 +96,131 @@ class DepartureTimeModel:
             else:
                 raise IndexError("Tuple position has wrong dimensions.")
 
+    def add_sec_dest_demand(self, demand: Demand, orig_demand: Demand):
+        """Add secondary destination demand for a block of origins.
+
+        Equivalent to adding the three-way demand of each origin
+        separately with `add_demand`.
+        
+        Parameters
+        ----------
+        demand : Demand
+            Destination -> secondary destination matrix,
+            summed over origins in block
+        orig_demand : Demand
+            Origin -> secondary destination matrix,
+            the first origin in block as `orig`
+        """
+        if demand.mode != "walk":
+            ass_class = self._assignment_class(demand)
+            d = demand.purpose.bounds.start
+            o = cast(int, orig_demand.orig) #type checker hint
+            name = cast(str, demand.purpose.name) #type checker hint
+            for tp in self.time_periods:
+                share = param.demand_share[name][demand.mode][tp]
+                self._add_2d_demand(
+                    share[0], ass_class, tp, demand.matrix, (d, d))
+                self._add_2d_demand(
+                    share[1], ass_class, tp, orig_demand.matrix.T, (d, o))
+
+    def add_tours_bulk(self, tours: TourTable):
+        """Add demand of all tours in agent simulation.
+
+        Equivalent to adding each tour separately with `add_demand`.
+
+        Parameters
+        ----------
+        tours : datatypes.population.TourTable
+            Tours with chosen modes and destinations
+        """
+        self.demand = cast(Dict[str, Dict[str, Any]], self.demand) #type checker help
+        self._add_tours_bulk(self.demand, tours)
+
+    def update_agent_demand(self,
+                            tours: TourTable,
+                            simulated: Optional[numpy.ndarray] = None,
+                            previous: Optional[TourTable] = None,
+                            removed: Optional[numpy.ndarray] = None):
+        """Update agent demand kept over iterations, and add it to demand.
+
+        Only demand of simulated tours is added to agent demand,
+        and demand of removed tours from previous iteration subtracted,
+        so tours recycled from previous iteration are not handled again.
+        If there is no previous tour table, agent demand is started over.
+
+        Parameters
+        ----------
+        tours : datatypes.population.TourTable
+            Tours with chosen modes and destinations
+        simulated : numpy.ndarray (optional)
+            Boolean array telling which tours have been simulated,
+            by default all tours
+        previous : datatypes.population.TourTable (optional)
+            Snapshot of tour table from previous iteration
+        removed : numpy.ndarray (optional)
+            Boolean array telling which tours in `previous`
+            were not recycled
+        """
+        if previous is None or self.agent_demand is None:
+            n = self.nr_zones
+            self.agent_demand = {tp: {tc: numpy.zeros((n, n), float_dtype())
+                    for tc in transport_classes}
+                for tp in self.time_periods}
+        else:
+            self._add_tours_bulk(self.agent_demand, previous, removed, -1)
+        self._add_tours_bulk(self.agent_demand, tours, simulated)
+        self.demand = cast(Dict[str, Dict[str, Any]], self.demand) #type checker help
+        for tp in self.agent_demand:
+            for ass_class in self.agent_demand[tp]:
+                self.demand[tp][ass_class] += self.agent_demand[tp][ass_class]
+
+    def _add_tours_bulk(self,
+                        demand: Dict[str, Dict[str, numpy.ndarray]],
+                        tours: TourTable,
+                        subset: Optional[numpy.ndarray] = None,
+                        sign: int = 1):
+        """Scatter-add (or subtract) tours to demand matrices."""
+        weight = sign * Tour.matrix[0, 0]
+        # Car passengers do not add to car demand
+        is_excluded = tours.is_car_passenger()
+        if subset is not None:
+            is_excluded |= ~subset
+        for i, purpose in enumerate(tours.purposes):
+            name = cast(str, purpose.name) #type checker hint
+            for j, mode in enumerate(purpose.modes):
+                if mode == "walk":
+                    continue
+                rows = numpy.flatnonzero(
+                    (tours.purpose == i) & (tours.mode == j)
+                    & ~is_excluded)
+                if len(rows) == 0:
+                    continue
+                ass_class = self._assignment_class(tours[rows[0]])
+                orig = tours.orig[rows]
+                dest = tours.dest[rows]
+                has_sec_dest = tours.sec_dest[rows] >= 0
+                sec_dest = tours.sec_dest[rows[has_sec_dest]]
+                for tp in self.time_periods:
+                    mtx = demand[tp][ass_class]
+                    share = param.demand_share[name][mode][tp]
+                    self._add_tours(share, mtx, weight, orig, dest)
+                    if len(sec_dest) > 0:
+                        share = param.demand_share[
+                            purpose.sec_dest_purpose.name][mode][tp]
+                        self._add_tours(
+                            share[0], mtx, weight,
+                            dest[has_sec_dest], sec_dest)
+                        self._add_tours(
+                            share[1], mtx, weight,
+                            sec_dest, orig[has_sec_dest])
+
+    def _assignment_class(self, demand: Union[Demand, Tour]) -> str:
+        if demand.mode in param.divided_classes:
+            name = cast(str, demand.purpose.name) #type checker hint
+            return "{}_{}".format(demand.mode, assignment_classes[name])
+        else:
+            return demand.mode
+
     def _add_2d_demand(self, 
                        demand_share: Any, 
                        ass_class: str, 
@@ -117,6 +244,20 @@ class DepartureTimeModel:
             log.warn("{} {} matrix not matching {} demand shares. Resorted to backup demand shares.".format(
                 mtx.shape, ass_class, len(demand_share[0])))
 
+    def _add_tours(self,
+                   demand_share: Tuple[float, float],
+                   mtx: numpy.ndarray,
+                   weight: float,
+                   origs: numpy.ndarray,
+                   dests: numpy.ndarray):
+        """Scatter-add tours (and their return trips) to matrix."""
+        n = self.nr_zones
+        flat_mtx = mtx.reshape(-1)
+        ods, counts = numpy.unique(
+            origs.astype(numpy.int64)*n + dests, return_counts=True)
+        flat_mtx[ods] += demand_share[0] * weight * counts
+        flat_mtx[(ods%n)*n + ods//n] += demand_share[1] * weight * counts
+
     def _add_3d_demand(self, 
                        demand: Union[Demand, Tour], 
                        ass_class: str, 
@@ -19,20 +19,24 @@ class MockAssignmentModel(AssignmentModel):
         self.time_periods = time_periods
         self.assignment_periods = [MockPeriod(tp, matrices)
                                    for tp in time_periods]
+        self._zone_numbers = None
+        self._mapping = None
 
     @property
     def zone_numbers(self) -> numpy.array:
         """Numpy array of all zone numbers.""" 
-        with self.matrices.open("time", "aht") as mtx:
-            zone_numbers = mtx.zone_numbers
-        return zone_numbers
+        if self._zone_numbers is None:
+            with self.matrices.open("time", "aht") as mtx:
+                self._zone_numbers = mtx.zone_numbers
+        return self._zone_numbers
 
     @property
     def mapping(self):
         """dict: Dictionary of zone numbers and corresponding indices."""
-        with self.matrices.open("time", "aht") as mtx:
-            mapping = mtx.mapping
-        return mapping
+        if self._mapping is None:
+            with self.matrices.open("time", "aht") as mtx:
+                self._mapping = mtx.mapping
+        return self._mapping
 
     @property
     def nr_zones(self) -> int:
@@ -59,13 +63,15 @@ class MockPeriod(Period):
     def __init__(self, name: str, matrices: MatrixData):
         self.name = name
         self.matrices = matrices
+        self._zone_numbers = None
 
     @property
     def zone_numbers(self):
         """Numpy array of all zone numbers.""" 
-        with self.matrices.open("time", self.name) as mtx:
-            zone_numbers = mtx.zone_numbers
-        return zone_numbers
+        if self._zone_numbers is None:
+            with self.matrices.open("time", self.name) as mtx:
+                self._zone_numbers = mtx.zone_numbers
+        return self._zone_numbers
 
     def assign(self, 
                matrices: Dict[str, numpy.ndarray], 
@@ -1,6 +1,9 @@
 from __future__ import annotations
 import os
-from typing import TYPE_CHECKING, Optional
+import atexit
+import weakref
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, Optional, Set, Tuple
 import openmatrix as omx # type: ignore
 import numpy # type: ignore
 import pandas
@@ -9,17 +12,47 @@ if TYPE_CHECKING:
     from datahandling.zonedata import BaseZoneData
 
 import utils.log as log
+from utils.memory import float_dtype
 from utils.read_csv_file import read_csv_file
 from utils.zone_interval import zone_interval
 import parameters.assignment as param
 import parameters.zone as zone_param
 
 
+# Number of matrix rows checked at a time in validation
+VALIDATION_ROWS = 256
+# Matrices that have passed validation,
+# key : (file path, modification time, file size, matrix name)
+_validated: Set[Tuple[str, int, int, str]] = set()
+# Max number of files kept open for reading in one MatrixData
+MAX_OPEN_FILES = 16
+# MatrixData objects whose files are closed at exit
+_instances: weakref.WeakSet = weakref.WeakSet()
+
+
 class MatrixData:
+    """Reader and writer of OMX matrix files in one directory.
+
+    Files opened for reading are kept open in a pool (at most
+    `MAX_OPEN_FILES`, least recently used are closed first), so that
+    repeated reads of the same file share one handle. A pooled file
+    is reopened if it has been modified on disk.
+    Files opened for writing are flushed and closed when leaving the
+    `open` context.
+
+    Parameters
+    ----------
+    path : str
+        Directory path where matrix files are read from and written to
+    """
+
     def __init__(self, path: str):
         self.path = path
         if not os.path.exists(self.path):
             os.makedirs(self.path)
+        self._open_files: OrderedDict = OrderedDict()
+        self._external: Dict[str, pandas.DataFrame] = {}
+        _instances.add(self)
     
     @contextmanager
     def open(self, 
@@ -28,12 +61,81 @@ class MatrixData:
              zone_numbers: Optional[numpy.ndarray] = None, 
              m: str = 'r'):
         file_name = os.path.join(self.path, mtx_type+'_'+time_period+".omx")
-        mtxfile = MatrixFile(omx.open_file(file_name, m), zone_numbers)
-        yield mtxfile
-        mtxfile.close()
+        if m == 'r':
+            yield MatrixFile(self._get_file(file_name), zone_numbers)
+        else:
+            # File cannot be written while open for reading
+            for matrix_data in list(_instances):
+                matrix_data._close_file(file_name)
+            mtxfile = MatrixFile(omx.open_file(file_name, m), zone_numbers)
+            try:
+                yield mtxfile
+            finally:
+                mtxfile.close()
+
+    def close(self):
+        """Close all files kept open for reading."""
+        while self._open_files:
+            _, (omx_file, _) = self._open_files.popitem()
+            omx_file.close()
+
+    def __del__(self):
+        self.close()
+
+    def _get_file(self, file_name: str) -> omx.File:
+        """Get pooled read handle, open file if needed."""
+        try:
+            stat = os.stat(file_name)
+            file_key = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            # Let omx raise the error for missing file
+            file_key = None
+        try:
+            omx_file, old_key = self._open_files.pop(file_name)
+        except KeyError:
+            pass
+        else:
+            if old_key == file_key and omx_file.isopen:
+                self._open_files[file_name] = (omx_file, file_key)
+                return omx_file
+            omx_file.close()
+        omx_file = omx.open_file(file_name, 'r')
+        self._open_files[file_name] = (omx_file, file_key)
+        while len(self._open_files) > MAX_OPEN_FILES:
+            _, (old_file, _) = self._open_files.popitem(last=False)
+            old_file.close()
+        return omx_file
 
-    def get_external(self, transport_mode: str):
-        return read_csv_file(self.path, "external_"+transport_mode+".txt")
+    def _close_file(self, file_name: str):
+        path = os.path.realpath(file_name)
+        for name in list(self._open_files):
+            if os.path.realpath(name) == path:
+                omx_file, _ = self._open_files.pop(name)
+                omx_file.close()
+
+    def get_external(self, transport_mode: str) -> pandas.DataFrame:
+        """Get aggregated base matrix for external traffic.
+
+        File is read only once, as the matrix is needed in every
+        iteration. The returned data frame should not be modified.
+
+        Parameters
+        ----------
+        transport_mode : str
+            Travel mode (car/transit/truck/trailer_truck)
+
+        Returns
+        -------
+        pandas.DataFrame
+            Base demand from municipalities and external zones (rows)
+            to external zones (columns)
+        """
+        try:
+            return self._external[transport_mode]
+        except KeyError:
+            mtx = read_csv_file(self.path, "external_"+transport_mode+".txt")
+            self._external[transport_mode] = mtx
+            return mtx
 
     def peripheral_transit_cost(self, zonedata: BaseZoneData):
         filename = "transit_cost_peripheral.txt"
@@ -59,34 +161,50 @@ class MatrixData:
             return mtx.values
 
 
+@atexit.register
+def _close_all():
+    for matrix_data in list(_instances):
+        matrix_data.close()
+
+
 class MatrixFile:
-    def __init__(self, omx_file: omx.File, zone_numbers: numpy.ndarray):
+    def __init__(self, omx_file: omx.File, zone_numbers: Optional[numpy.ndarray]):
         self._file = omx_file
+        self._zone_numbers = None
+        # Positions of file zones in network zones, if they differ
+        self._zone_index: Optional[numpy.ndarray] = None
         self.missing_zones = []
+        if omx_file.mode == 'r':
+            stat = os.stat(omx_file.filename)
+            self._file_key = (os.path.realpath(omx_file.filename),
+                              stat.st_mtime_ns, stat.st_size)
         if zone_numbers is None:
             pass
         elif omx_file.mode == 'r':
             path = omx_file.filename
-            mtx_numbers = self.zone_numbers
+            mtx_numbers = numpy.array(self.zone_numbers)
             if (numpy.diff(mtx_numbers) <= 0).any():
                 msg = "Zone numbers not in strictly ascending order in file {}".format(
                     path)
                 log.error(msg)
                 raise IndexError(msg)
-            if mtx_numbers != zone_numbers:
-                for i in mtx_numbers:
-                    if i not in zone_numbers:
-                        msg = "Zone number {} from file {} not found in network".format(
-                            i, path)
-                        log.error(msg)
-                        raise IndexError(msg)
-                for i in zone_numbers:
-                    if i not in mtx_numbers:
-                        self.missing_zones.append(i)
+            zone_numbers = numpy.array(zone_numbers)
+            if not numpy.array_equal(mtx_numbers, zone_numbers):
+                not_found = mtx_numbers[~numpy.isin(mtx_numbers, zone_numbers)]
+                if not_found.size > 0:
+                    msg = "Zone number {} from file {} not found in network".format(
+                        not_found[0], path)
+                    log.error(msg)
+                    raise IndexError(msg)
+                self.missing_zones = list(
+                    zone_numbers[~numpy.isin(zone_numbers, mtx_numbers)])
                 log.warn("Zone number(s) {} missing from file {}{}".format(
                              self.missing_zones, path,
                              ", adding zero row(s) and column(s)"))
                 self.new_zone_numbers = zone_numbers
+                sorter = numpy.argsort(zone_numbers)
+                self._zone_index = sorter[zone_numbers.searchsorted(
+                    mtx_numbers, sorter=sorter)]
             ass_classes = self.matrix_list
             transport_classes = (("truck", "trailer_truck") 
                                  if "freight" in path
@@ -104,38 +222,52 @@ class MatrixFile:
         self._file.close()
     
     def __getitem__(self, mode: str):
-        mtx = numpy.array(self._file[mode])
+        node = self._file[mode]
         nr_zones = len(self.zone_numbers)
         dim = (nr_zones, nr_zones)
-        if mtx.shape != dim:
+        if tuple(node.shape) != dim:
             msg = "Matrix {} in file {} has dimensions {}, should be {}".format(
-                mode, self._file.filename, mtx.shape, dim)
+                mode, self._file.filename, tuple(node.shape), dim)
             log.error(msg)
             raise IndexError(msg)
-        if numpy.isnan(mtx).any():
-            msg = "Matrix {} in file {} contains NA values".format(
-                mode, self._file.filename)
-            log.error(msg)
-            raise ValueError(msg)
-        if (mtx < 0).any():
-            msg = "Matrix {} in file {} contains negative values".format(
-                mode, self._file.filename)
-            log.error(msg)
-            raise ValueError(msg)
-        if self.missing_zones:
-            mtx = pandas.DataFrame(mtx, self.zone_numbers, self.zone_numbers)
-            mtx = mtx.reindex(
-                index=self.new_zone_numbers, columns=self.new_zone_numbers,
-                fill_value=0)
-            mtx = mtx.values
+        mtx = node.read()
+        key = self._file_key + (mode,)
+        if key not in _validated:
+            self._validate(mode, mtx)
+            _validated.add(key)
+        if mtx.dtype != float_dtype():
+            mtx = mtx.astype(float_dtype())
+        if self._zone_index is not None:
+            # Add zero rows and columns for missing zones
+            n = len(self.new_zone_numbers)
+            padded = numpy.zeros((n, n), mtx.dtype)
+            padded[numpy.ix_(self._zone_index, self._zone_index)] = mtx
+            mtx = padded
         return mtx
 
+    def _validate(self, mode: str, mtx: numpy.ndarray):
+        """Check matrix for NA and negative values, block of rows at a time."""
+        for start in range(0, mtx.shape[0], VALIDATION_ROWS):
+            block = mtx[start:start+VALIDATION_ROWS]
+            if numpy.isnan(block).any():
+                msg = "Matrix {} in file {} contains NA values".format(
+                    mode, self._file.filename)
+                log.error(msg)
+                raise ValueError(msg)
+            if (block < 0).any():
+                msg = "Matrix {} in file {} contains negative values".format(
+                    mode, self._file.filename)
+                log.error(msg)
+                raise ValueError(msg)
+
     def __setitem__(self, mode, data):
         self._file[mode] = data
 
     @property
     def zone_numbers(self):
-        return self._file.mapentries("zone_number")
+        if self._zone_numbers is None:
+            self._zone_numbers = self._file.mapentries("zone_number")
+        return self._zone_numbers
 
     @property
     def mapping(self):
@@ -144,7 +276,10 @@ class MatrixFile:
     @mapping.setter
     def mapping(self, zone_numbers):
         self._file.create_mapping("zone_number", zone_numbers)
+        self._zone_numbers = None
 
     @property
     def matrix_list(self):
-        return self._file.list_matrices()
+        # Also contiguous (non-chunked) datasets, not only CArrays
+        return [node.name for node in self._file.list_nodes(
+            self._file.root.data, "Array")]
@@ -1,36 +1,124 @@
 from __future__ import annotations
 import os
-from typing import Any, Dict
+from importlib.util import find_spec
+from typing import Any, Dict, List
 import pandas
 try:
     from openpyxl import Workbook, load_workbook
     _use_txt = False
 except ImportError:
     _use_txt = True
+try:
+    import pyarrow # type: ignore
+    import pyarrow.parquet # type: ignore
+    _use_pyarrow = True
+except ImportError:
+    _use_pyarrow = False
+
+import utils.log as log
+
+
+# File extensions of columnar result formats
+COLUMNAR_FORMATS = {
+    "parquet": ".parquet",
+    "feather": ".feather",
+    "hdf5": ".h5",
+}
+# Python packages of which at least one is needed for each format
+_FORMAT_ENGINES = {
+    "parquet": ("pyarrow", "fastparquet"),
+    "feather": ("pyarrow",),
+    "hdf5": ("tables",),
+}
+# Columns of matrix data stored in long format
+MATRIX_COLUMNS = ["sheet", "row", "column", "value"]
+
+
+def format_available(result_format: str) -> bool:
+    """Check if packages needed for result format are installed.
+
+    Parameters
+    ----------
+    result_format : str
+        txt/parquet/feather/hdf5
+
+    Returns
+    -------
+    bool
+        True if format can be written
+    """
+    if result_format == "txt":
+        return True
+    return any(find_spec(engine) is not None
+               for engine in _FORMAT_ENGINES[result_format])
 
 
 class ResultsData:
     """
     Saves all result data to same folder.
+
+    Parameters
+    ----------
+    results_directory_path : str
+        Directory where results are saved
+    result_format : str (optional)
+        txt (default): Column data as tab-separated text files,
+            matrix data as Excel workbooks and text files
+        parquet/feather/hdf5: Column and matrix data as binary tables,
+            which can be converted to text with `export_results`
     """
-    def __init__(self, results_directory_path: str):
+    def __init__(self, results_directory_path: str, result_format: str = "txt"):
+        if result_format != "txt" and result_format not in COLUMNAR_FORMATS:
+            raise ValueError(
+                "Unknown result format: {}".format(result_format))
+        if not format_available(result_format):
+            log.warn("Packages for {} output not found, using txt".format(
+                result_format))
+            result_format = "txt"
         if not os.path.exists(results_directory_path):
             os.makedirs(results_directory_path)
         self.path = results_directory_path
+        self.result_format = result_format
         self._line_buffer: Dict[str, Any] = {}
         self._df_buffer: Dict[str, Any] = {}
+        self._column_buffer: Dict[str, Dict[str, pandas.Series]] = {}
+        self._matrix_buffer: Dict[str, Dict[str, pandas.DataFrame]] = {}
         self._xlsx_buffer: Dict[str, Any] = {}
+        self._table_writers: Dict[str, Any] = {}
+        self._chunk_buffer: Dict[str, List[pandas.DataFrame]] = {}
 
     def flush(self):
         """Save to files and empty buffers."""
         for filename in self._line_buffer:
             self._line_buffer[filename].close()
         self._line_buffer = {}
+        for filename in self._table_writers:
+            self._table_writers[filename].close()
+        self._table_writers = {}
+        for filename in self._chunk_buffer:
+            self._write_table(
+                pandas.concat(self._chunk_buffer[filename]), filename)
+        self._chunk_buffer = {}
+        for filename in self._column_buffer:
+            self._df_buffer[filename] = self._build_frame(
+                self._column_buffer[filename])
+        self._column_buffer = {}
         for filename in self._df_buffer:
-            self._df_buffer[filename].to_csv(
-                os.path.join(self.path, filename),
-                sep='\t', float_format="%1.5f")
+            if self.result_format == "txt":
+                self._df_buffer[filename].to_csv(
+                    os.path.join(self.path, filename),
+                    sep='\t', float_format="%1.5f")
+            else:
+                self._write_table(
+                    self._df_buffer[filename], os.path.splitext(filename)[0])
         self._df_buffer = {}
+        for filename in self._matrix_buffer:
+            sheets = self._matrix_buffer[filename]
+            self._write_table(pandas.concat(
+                [self._long_format(sheets[sheetname], sheetname)
+                    for sheetname in sheets],
+                ignore_index=True), filename)
+        self._matrix_buffer = {}
         for filename in self._xlsx_buffer:
             self._xlsx_buffer[filename].save(
                 os.path.join(self.path, "{}.xlsx".format(filename)))
@@ -48,13 +136,12 @@ class ResultsData:
         colname : str
             Desired name of this column
         """
-        if filename not in self._df_buffer:
-            self._df_buffer[filename] = pandas.DataFrame(data, columns=[colname])
-        else:
-            df = self._df_buffer[filename]
-            self._df_buffer[filename] = df.reindex(
-                df.index.union(data.index), copy=False)
-            self._df_buffer[filename][colname] = data
+        try:
+            columns = self._column_buffer[filename]
+        except KeyError:
+            columns = {}
+            self._column_buffer[filename] = columns
+        columns[colname] = data
 
     def print_line(self, line: str, filename: str):
         """Write text to line in file (closed when flushing).
@@ -66,18 +153,57 @@ class ResultsData:
         filename : str
             Name of file where text is pushed (can contain other text)
         """
+        self._get_line_buffer(filename).write(line + "\n")
+
+    def print_table(self, data: pandas.DataFrame, filename: str):
+        """Append rows to table (file closed when flushing).
+
+        Meant for large tables produced in chunks. Rows are streamed
+        to file if using txt format, or parquet format with pyarrow,
+        so that only one chunk at a time is kept in memory.
+
+        Parameters
+        ----------
+        data : pandas.DataFrame
+            Rows to add, with same columns and index name in all chunks
+        filename : str
+            Name of file where data is pushed (without file extension)
+        """
+        if self.result_format == "txt":
+            is_new = filename not in self._line_buffer
+            data.to_csv(
+                self._get_line_buffer(filename), sep='\t', header=is_new,
+                float_format="%1.5f", line_terminator="\n")
+        elif self.result_format == "parquet" and _use_pyarrow:
+            table = pyarrow.Table.from_pandas(data, preserve_index=True)
+            try:
+                writer = self._table_writers[filename]
+            except KeyError:
+                writer = pyarrow.parquet.ParquetWriter(
+                    os.path.join(self.path, filename + ".parquet"),
+                    table.schema)
+                self._table_writers[filename] = writer
+            writer.write_table(table)
+        else:
+            try:
+                self._chunk_buffer[filename].append(data)
+            except KeyError:
+                self._chunk_buffer[filename] = [data]
+
+    def _get_line_buffer(self, filename: str):
         try:
-            buffer = self._line_buffer[filename]
+            return self._line_buffer[filename]
         except KeyError:
             buffer = open(
                 os.path.join(self.path, "{}.txt".format(filename)), 'w')
             self._line_buffer[filename] = buffer
-        buffer.write(line + "\n")
+            return buffer
 
     def print_matrix(self, data: pandas.DataFrame, filename: str, sheetname: str):
         """Save 2-d matrix data to buffer (printed to file when flushing).
 
-        Saves matrix both in Excel format and as list in text file.
+        Saves matrix both in Excel format and as list in text file,
+        or as one long-format table per file if using columnar format.
 
         Parameters
         ----------
@@ -88,30 +214,133 @@ class ResultsData:
         sheetname : str
             Desired name of excel sheet
         """
+        if self.result_format != "txt":
+            try:
+                self._matrix_buffer[filename][sheetname] = data
+            except KeyError:
+                self._matrix_buffer[filename] = {sheetname: data}
+            return
         if _use_txt:
             # If no Workbook module available (= _use_txt), save data to csv
             data.to_csv(
                 os.path.join(self.path, "{}_{}.txt".format(filename, sheetname)),
                 sep='\t', float_format="%8.1f")
         else:
-            # Get/create new worksheet
-            if filename in self._xlsx_buffer:
-                ws = self._xlsx_buffer[filename].create_sheet(sheetname)
-            else:
-                self._xlsx_buffer[filename] = Workbook()
-                ws = self._xlsx_buffer[filename].active
-                ws.title = sheetname
-            # Write data to each cell
-            for j in range(0, data.shape[1]):
-                ws.cell(row=1, column=j+2).value = data.columns[j]
-            for i in range(0, data.shape[0]):
-                ws.cell(row=i+2, column=1).value = data.index[i]
-                for j in range(0, data.shape[1]):
-                    ws.cell(row=i+2, column=j+2).value = data.iloc[i, j]
-        # Create text file
-        sheetname = sheetname.replace("_", "\t")
-        for j in data.columns:
-            for i in data.index:
-                self.print_line(
-                    "{}\t{}\t{}\t{}".format(i, j, sheetname, str(data[j][i])),
-                    filename)
+            # Get/create new worksheet, written row by row
+            if filename not in self._xlsx_buffer:
+                self._xlsx_buffer[filename] = Workbook(write_only=True)
+            ws = self._xlsx_buffer[filename].create_sheet(sheetname)
+            ws.append([None] + list(data.columns))
+            for row in data.itertuples(name=None):
+                ws.append(row)
+        # Create text file, one line per cell in column-major order
+        cells = data.unstack()
+        lines = pandas.DataFrame({
+            "row": cells.index.get_level_values(1),
+            "column": cells.index.get_level_values(0),
+        })
+        for k, part in enumerate(sheetname.split("_")):
+            lines["sheet{}".format(k)] = part
+        lines["value"] = cells.values
+        lines.to_csv(
+            self._get_line_buffer(filename), sep='\t', header=False,
+            index=False, na_rep="nan", line_terminator="\n")
+
+    def _build_frame(self, columns: Dict[str, pandas.Series]
+                    ) -> pandas.DataFrame:
+        """Join columns into one DataFrame with union of their indices."""
+        index = None
+        for data in columns.values():
+            if index is None:
+                index = data.index
+            elif not index.equals(data.index):
+                index = index.union(data.index)
+        return pandas.DataFrame(
+            {colname: columns[colname].reindex(index) for colname in columns},
+            index=index, columns=list(columns))
+
+    def _long_format(self, data: pandas.DataFrame, sheetname: str
+                    ) -> pandas.DataFrame:
+        """Get matrix as table with one row per cell."""
+        nr_rows, nr_cols = data.shape
+        return pandas.DataFrame({
+            "sheet": sheetname,
+            "row": data.index.astype(str).repeat(nr_cols),
+            "column": list(data.columns.astype(str)) * nr_rows,
+            "value": data.values.ravel(),
+        }, columns=MATRIX_COLUMNS)
+
+    def _write_table(self, df: pandas.DataFrame, name: str):
+        path = os.path.join(
+            self.path, name + COLUMNAR_FORMATS[self.result_format])
+        df = df.rename(columns=str)
+        if self.result_format == "parquet":
+            df.to_parquet(path)
+        elif self.result_format == "feather":
+            # Feather supports only default index
+            df.reset_index().to_feather(path)
+        else:
+            df.to_hdf(path, "data", mode='w')
+
+
+def read_table(path: str) -> pandas.DataFrame:
+    """Read table written by `ResultsData` in columnar format.
+
+    Parameters
+    ----------
+    path : str
+        Path to .parquet, .feather or .h5 file
+
+    Returns
+    -------
+    pandas.DataFrame
+        Column data, or matrix data in long format
+        (with columns `MATRIX_COLUMNS`)
+    """
+    ext = os.path.splitext(path)[1]
+    if ext == COLUMNAR_FORMATS["parquet"]:
+        return pandas.read_parquet(path)
+    elif ext == COLUMNAR_FORMATS["feather"]:
+        df = pandas.read_feather(path)
+        if list(df.columns[1:]) == MATRIX_COLUMNS:
+            return df.iloc[:, 1:]
+        df = df.set_index(df.columns[0])
+        if df.index.name == "index":
+            df.index.name = None
+        return df
+    elif ext == COLUMNAR_FORMATS["hdf5"]:
+        return pandas.read_hdf(path, "data")
+    else:
+        raise ValueError("Unknown result file type: {}".format(path))
+
+
+def export_results(results_directory_path: str):
+    """Convert columnar result files to txt and xlsx output.
+
+    Produces the same files as `ResultsData` would have
+    produced using txt format.
+
+    Parameters
+    ----------
+    results_directory_path : str
+        Directory where columnar result files are found
+    """
+    resultdata = ResultsData(results_directory_path)
+    for file in sorted(os.listdir(results_directory_path)):
+        name, ext = os.path.splitext(file)
+        if ext not in COLUMNAR_FORMATS.values():
+            continue
+        df = read_table(os.path.join(results_directory_path, file))
+        if list(df.columns) == MATRIX_COLUMNS:
+            for sheetname in pandas.unique(df["sheet"]):
+                sheet = df[df["sheet"] == sheetname]
+                rows = pandas.unique(sheet["row"])
+                cols = pandas.unique(sheet["column"])
+                resultdata.print_matrix(
+                    pandas.DataFrame(
+                        sheet["value"].values.reshape(len(rows), len(cols)),
+                        rows, cols),
+                    name, sheetname)
+        else:
+            resultdata._df_buffer[name + ".txt"] = df
+    resultdata.flush()
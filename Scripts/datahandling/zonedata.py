@@ -1,21 +1,131 @@
 from __future__ import annotations
-from typing import Any, Dict, List, Tuple, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
+import hashlib
+import os
 import numpy # type: ignore
 import pandas
 
 import parameters.zone as param
-from utils.read_csv_file import read_csv_file
+from utils.read_csv_file import read_csv_file, file_digest
 from utils.zone_interval import ZoneIntervals, zone_interval
 import utils.log as log
+from utils.memory import float_dtype
 from datatypes.zone import Zone
+from datatypes.block_matrix import BlockDiagonalMatrix
 from assignment.datatypes.transit_fare import TransitFareZoneSpecification
 
 
+# Subdirectory of zone data cache where digests of validated data are stored
+VALIDATED_DIR = "validated"
+
+
+class ZoneDataError(ValueError):
+    """Zone data has invalid values.
+
+    All offending zones are collected in one error,
+    grouped by the kind of problem.
+
+    Parameters
+    ----------
+    key : str
+        Name of zone data variable (e.g., "population")
+    problems : dict
+        key : str
+            Description of problem (e.g., "is negative")
+        value : pandas.Series
+            Offending values, with zone numbers as index
+    """
+
+    # Max number of zones listed in message for each problem
+    max_listed = 10
+
+    def __init__(self, key: str, problems: Dict[str, pandas.Series]):
+        self.key = key
+        self.problems = problems
+        descriptions = []
+        for problem, values in problems.items():
+            zones = ", ".join("{} ({})".format(i, val)
+                for i, val in values[:self.max_listed].items())
+            if values.size > self.max_listed:
+                zones += " and {} other zones".format(
+                    values.size - self.max_listed)
+            descriptions.append("{} for zones {}".format(problem, zones))
+        ValueError.__init__(self, "{} {}".format(
+            key, "; ".join(descriptions)).capitalize())
+
+    @property
+    def zones(self) -> numpy.ndarray:
+        """Numbers of all offending zones."""
+        return numpy.unique(numpy.concatenate(
+            [values.index.values for values in self.problems.values()]))
+
+
+class ZoneDataTypeError(ZoneDataError, TypeError):
+    """Zone data has values that are not numbers."""
+    pass
+
+
 class ZoneData:
-    def __init__(self, data_dir: str, zone_numbers: numpy.array):
+    """Container for zone data read from input files.
+
+    Parameters
+    ----------
+    data_dir : str
+        Directory where scenario input data files are found
+    zone_numbers : numpy.ndarray
+        Zone numbers of assignment network
+    validation : str (optional)
+        Validation level:
+        "strict" = data values are always checked,
+        "lenient" = checks are skipped if exactly the same input files
+        have already been validated for the same zones
+        (requires `zone_data_cache_dir` in `parameters.zone`)
+    """
+
+    def __init__(self,
+                 data_dir: str,
+                 zone_numbers: numpy.array,
+                 validation: str = "strict"):
+        if validation not in ("strict", "lenient"):
+            msg = "Zone data validation level {} not valid".format(validation)
+            log.error(msg)
+            raise ValueError(msg)
         self._values: Dict[str,Any]= {}
+        # Results of `get_data`, with the data objects they were built from
+        self._cache: Dict[Tuple[Any, ...], Tuple[Dict[str, Any], numpy.ndarray]] = {}
         self.share = ShareChecker(self)
         all_zone_numbers = numpy.array(zone_numbers)
+        self._validate = True
+        # Subclasses read and check more data from same files
+        kind = type(self).__name__
+        validated = (validated_path(data_dir, kind)
+            if validation == "lenient" else None)
+        if validated is not None:
+            digest = input_digest(data_dir, all_zone_numbers, kind)
+            try:
+                with open(validated) as f:
+                    self._validate = f.read().strip() != digest
+            except OSError:
+                pass
+            if not self._validate:
+                log.info(
+                    "Zone data in {} already validated, checks skipped".format(
+                        data_dir))
+        elif validation == "lenient":
+            log.warn("Zone data cache directory not set (--zone-data-cache-dir), "
+                     + "lenient validation not available")
+        self._read_data(data_dir, all_zone_numbers)
+        if validated is not None and self._validate:
+            try:
+                os.makedirs(os.path.dirname(validated), exist_ok=True)
+                with open(validated, 'w') as f:
+                    f.write(digest)
+            except OSError:
+                log.warn("Could not store validation of zone data in {}".format(
+                    data_dir))
+        self._validate = True
+
+    def _read_data(self, data_dir: str, all_zone_numbers: numpy.ndarray):
         self.all_zone_numbers = all_zone_numbers
         surrounding = param.areas["surrounding"]
         peripheral = param.areas["peripheral"]
@@ -25,7 +135,7 @@ class ZoneData:
         Zone.counter = 0
         self.zones = {number: Zone(number) for number in self.zone_numbers}
         first_peripheral = self.zone_numbers.searchsorted(peripheral[0])
-        dtype = numpy.float32
+        dtype = float_dtype()
         popdata = read_csv_file(data_dir, ".pop", self.zone_numbers, dtype)
         workdata = read_csv_file(data_dir, ".wrk", self.zone_numbers, dtype)
         schooldata = read_csv_file(data_dir, ".edu", self.zone_numbers, dtype)
@@ -94,19 +204,24 @@ class ZoneData:
         self["shops_cbd"] = self["cbd"] * self["shops"]
         self["shops_elsewhere"] = (1-self["cbd"]) * self["shops"]
         # Create diagonal matrix with zone area
-        self["own_zone"] = numpy.full((self.nr_zones, self.nr_zones), False)
-        self["own_zone"][numpy.diag_indices(self.nr_zones)] = True
-        self["own_zone_area"] = self["own_zone"] * self["zone_area"].values
-        self["own_zone_area_sqrt"] = numpy.sqrt(self["own_zone_area"])
+        # (structured matrices are built from already validated data)
+        zone_index = numpy.arange(self.nr_zones)
+        own_zone = BlockDiagonalMatrix(zone_index, zone_index, True, False)
+        area = self["zone_area"].values
+        self._values["own_zone"] = own_zone
+        self._values["own_zone_area"] = own_zone * area
+        self._values["own_zone_area_sqrt"] = own_zone * numpy.sqrt(area)
         # Create matrix where value is 1 if origin and destination is in
         # same municipality
-        own_municipality = pandas.DataFrame(
-            False, self.zone_numbers, self.zone_numbers)
+        municipality = pandas.Series(-1, self.zone_numbers)
         intervals = ZoneIntervals("municipalities")
-        for i in intervals:
-            own_municipality.loc[intervals[i], intervals[i]] = True
-        self["own"] = own_municipality.values
-        self["other"] = ~own_municipality.values
+        for i, name in enumerate(intervals):
+            municipality.loc[intervals[name]] = i
+        municipality = municipality.values
+        self._values["own"] = BlockDiagonalMatrix(
+            municipality, municipality, True, False)
+        self._values["other"] = BlockDiagonalMatrix(
+            municipality, municipality, False, True)
 
     def dummy(self, division_type, name, bounds=slice(None)):
         dummy = pandas.Series(False, self.zone_numbers[bounds])
@@ -117,34 +232,52 @@ class ZoneData:
         return self._values[key]
 
     def __setitem__(self, key: str, data: Any):
-        try:
-            if not numpy.isfinite(data).all():
-                for (i, val) in data.iteritems():
-                    if not numpy.isfinite(val):
-                        msg = "{} for zone {} is not a finite number".format(
-                            key, i).capitalize()
-                        log.error(msg)
-                        raise ValueError(msg)
-        except TypeError:
-            for (i, val) in data.iteritems():
-                try:
-                    float(val)
-                except ValueError:
-                    msg = "{} for zone {} is not a number".format(
-                        key, i).capitalize()
+        self._set(key, data)
+
+    def _set(self, key: str, data: Any, upper_limit: Optional[float] = None):
+        """Check data values for all zones and store data.
+
+        Parameters
+        ----------
+        key : str
+            Name of zone data variable (e.g., "population")
+        data : pandas.Series
+            Values with zone numbers as index
+        upper_limit : float (optional)
+            Max allowed value
+
+        Raises
+        ------
+        ZoneDataTypeError
+            If some values are not numbers
+        ZoneDataError
+            If some values are not finite, negative or above upper limit
+        """
+        if self._validate:
+            try:
+                problems = {"is not a finite number": ~numpy.isfinite(data)}
+            except TypeError:
+                numbers = pandas.to_numeric(data, errors="coerce")
+                is_nan = numbers.isna() & data.notna()
+                if not is_nan.any():
+                    msg = "{} could not be read".format(key).capitalize()
                     log.error(msg)
                     raise TypeError(msg)
-            msg = "{} could not be read".format(key).capitalize()
-            log.error(msg)
-            raise TypeError(msg)
-        if (data < 0).any():
-            for (i, val) in data.iteritems():
-                if val < 0:
-                    msg = "{} ({}) for zone {} is negative".format(
-                        key, val, i).capitalize()
-                    log.error(msg)
-                    raise ValueError(msg)
+                error: ZoneDataError = ZoneDataTypeError(
+                    key, {"is not a number": data[is_nan]})
+                log.error(str(error))
+                raise error
+            problems["is negative"] = data < 0
+            if upper_limit is not None:
+                problems["is larger than one"] = data > upper_limit
+            if any(mask.any() for mask in problems.values()):
+                error = ZoneDataError(key, {problem: data[mask]
+                    for problem, mask in problems.items() if mask.any()})
+                log.error(str(error))
+                raise error
         self._values[key] = data
+        self._cache = {cache_key: entry for cache_key, entry
+            in self._cache.items() if key not in entry[0]}
 
     def zone_index(self, 
                    zone_number: int) -> int:
@@ -195,46 +328,118 @@ class ZoneData:
         
         Returns
         -------
-        pandas Series or numpy 2-d matrix
+        numpy 1-d or 2-d matrix, or datatypes.block_matrix.BlockDiagonalMatrix
+            Read-only view, cached until data is replaced
         """
+        cache_key = (key, bounds.start, bounds.stop, bounds.step, generation)
+        try:
+            sources, data = self._cache[cache_key]
+        except KeyError:
+            pass
+        else:
+            if all(self._values.get(k) is val for k, val in sources.items()):
+                return data
+        data, sources = self._get_data(key, bounds, generation)
+        if isinstance(data, numpy.ndarray):
+            data = data.view()
+            data.flags.writeable = False
+        self._cache[cache_key] = (sources, data)
+        return data
+
+    def _get_data(self, key: str, bounds: slice, generation: bool
+                 ) -> Tuple[Any, Dict[str, Any]]:
+        """Get data for `get_data`, and data objects it was built from."""
         try:
             val = self._values[key]
         except KeyError as err:
             keyl: List[str] = key.split('_')
             if keyl[1] in ("own", "other"):
                 # If parameter is only for own municipality or for all
-                # municipalities except own, array is multiplied by
+                # municipalities except own, array is masked by
                 # bool matrix
-                return (self[keyl[1]] * self._values[keyl[0]].values)[bounds, :]
+                mask = self._values[keyl[1]]
+                base = self._values[keyl[0]]
+                data = mask[bounds, :] * base.values
+                return data, {keyl[1]: mask, keyl[0]: base}
             else:
                 raise KeyError(err)
         if val.ndim == 1: # If not a compound (i.e., matrix)
             if generation:  # Return values for purpose zones
-                return val[bounds].values
+                data = val[bounds].values
             else:  # Return values for all zones
-                return val.values
+                data = val.values
         else:  # Return matrix (purpose zones -> all zones)
-            return val[bounds, :]
+            data = val[bounds, :]
+        return data, {key: val}
 
 
 class BaseZoneData(ZoneData):
-    def __init__(self, data_dir: str, zone_numbers: numpy.array):
-        ZoneData.__init__(self, data_dir, zone_numbers)
+    def _read_data(self, data_dir: str, all_zone_numbers: numpy.ndarray):
+        ZoneData._read_data(self, data_dir, all_zone_numbers)
         cardata = read_csv_file(data_dir, ".car", self.zone_numbers)
         self["car_density"] = cardata["cardens"]
         self["cars_per_1000"] = 1000 * self["car_density"]
 
 
+def input_digest(data_dir: str,
+                 zone_numbers: numpy.ndarray,
+                 kind: str) -> str:
+    """Get digest of input file contents, zone numbers and data class.
+
+    Parameters
+    ----------
+    data_dir : str
+        Directory where scenario input data files are found
+    zone_numbers : numpy.ndarray
+        Zone numbers of assignment network
+    kind : str
+        Name of zone data class (ZoneData/BaseZoneData)
+
+    Returns
+    -------
+    str
+        Hexadecimal SHA-256 digest
+    """
+    h = hashlib.sha256(kind.encode())
+    h.update(numpy.asarray(zone_numbers, numpy.int64).tobytes())
+    for file_name in sorted(os.listdir(data_dir)):
+        path = os.path.join(data_dir, file_name)
+        if os.path.isfile(path):
+            h.update(file_name.encode())
+            h.update(file_digest(path))
+    return h.hexdigest()
+
+
+def validated_path(data_dir: str, kind: str) -> Optional[str]:
+    """Get path where digest of validated zone data is stored.
+
+    Digests are stored in zone data cache directory,
+    so that input data directories are never written to.
+
+    Parameters
+    ----------
+    data_dir : str
+        Directory where scenario input data files are found
+    kind : str
+        Name of zone data class (ZoneData/BaseZoneData)
+
+    Returns
+    -------
+    str or None
+        Path to digest file, keyed by absolute path of `data_dir`
+        and data class, None if `zone_data_cache_dir` is not set
+    """
+    if param.zone_data_cache_dir is None:
+        return None
+    key = hashlib.sha256(
+        (kind + ":" + os.path.abspath(data_dir)).encode()).hexdigest()
+    return os.path.join(
+        param.zone_data_cache_dir, VALIDATED_DIR, key + ".txt")
+
+
 class ShareChecker:
     def __init__(self, data):
         self.data = data
 
     def __setitem__(self, key, data):
-        if (data > 1.005).any():
-            for (i, val) in data.iteritems():
-                if val > 1.005:
-                    msg = "{} ({}) for zone {} is larger than one".format(
-                        key, val, i).capitalize()
-                    log.error(msg)
-                    raise ValueError(msg)
-        self.data[key] = data
+        self.data._set(key, data, upper_limit=1.005)
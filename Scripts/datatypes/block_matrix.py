@@ -0,0 +1,78 @@
+from __future__ import annotations
+from typing import Any, Tuple, Union
+import numpy # type: ignore
+
+
+class BlockDiagonalMatrix:
+    """Matrix with one value inside diagonal blocks and another outside.
+
+    Element (i, j) is `inside[j]` if row i and column j belong to
+    the same group (e.g., municipality), otherwise `outside[j]`.
+    With each zone as a group of its own, this is a diagonal matrix.
+    Only group indices and column values are stored, the dense matrix
+    is produced only when converting to numpy array.
+
+    Parameters
+    ----------
+    row_groups : numpy.ndarray
+        Group index of each row (negative if not in any group)
+    col_groups : numpy.ndarray
+        Group index of each column (negative if not in any group)
+    inside : numpy.ndarray or scalar
+        Value (of each column) inside blocks
+    outside : numpy.ndarray or scalar
+        Value (of each column) outside blocks
+    """
+
+    ndim = 2
+
+    def __init__(self,
+                 row_groups: numpy.ndarray,
+                 col_groups: numpy.ndarray,
+                 inside: Any,
+                 outside: Any):
+        # Rows and columns without group must never match
+        self.row_groups = numpy.where(row_groups < 0, -1, row_groups)
+        self.col_groups = numpy.where(col_groups < 0, -2, col_groups)
+        self.inside = inside
+        self.outside = outside
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return (len(self.row_groups), len(self.col_groups))
+
+    @property
+    def dtype(self) -> numpy.dtype:
+        return numpy.result_type(self.inside, self.outside)
+
+    def __getitem__(self, key) -> Union[BlockDiagonalMatrix, numpy.ndarray]:
+        """Get sub-matrix.
+
+        Slicing both rows and columns gives a `BlockDiagonalMatrix`,
+        other indexing a dense numpy array.
+        """
+        rows, cols = key if isinstance(key, tuple) else (key, slice(None))
+        inside = self._columns(self.inside, cols)
+        outside = self._columns(self.outside, cols)
+        if isinstance(rows, slice) and isinstance(cols, slice):
+            return BlockDiagonalMatrix(
+                self.row_groups[rows], self.col_groups[cols], inside, outside)
+        row_groups = numpy.asarray(self.row_groups[rows])
+        is_inside = row_groups[..., numpy.newaxis] == self.col_groups[cols]
+        return numpy.where(is_inside, inside, outside)
+
+    def _columns(self, values: Any, cols) -> Any:
+        return values[cols] if numpy.ndim(values) > 0 else values
+
+    def __mul__(self, other: Any) -> BlockDiagonalMatrix:
+        """Multiply with scalar or with array of column values."""
+        return BlockDiagonalMatrix(
+            self.row_groups, self.col_groups,
+            self.inside * other, self.outside * other)
+
+    __rmul__ = __mul__
+
+    def __array__(self, dtype=None) -> numpy.ndarray:
+        is_inside = self.row_groups[:, numpy.newaxis] == self.col_groups
+        matrix = numpy.where(is_inside, self.inside, self.outside)
+        return matrix if dtype is None else matrix.astype(dtype)
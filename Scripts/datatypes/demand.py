@@ -5,6 +5,7 @@ import numpy # type: ignore
 if TYPE_CHECKING:
     from datatypes.purpose import Purpose
 import parameters.car as param
+from utils.memory import float_dtype
 
 
 class Demand:
@@ -31,6 +32,7 @@ class Demand:
         """
         self.purpose = purpose
         self.mode = mode
+        matrix = numpy.asarray(matrix, float_dtype())
         if mode == "car" and purpose.name in param.car_driver_share:
             self.matrix = param.car_driver_share[purpose.name] * matrix
         else:
@@ -15,5 +15,11 @@ class TourLengthHistogram:
     def add(self, dist):
         self.histogram.iat[numpy.searchsorted(self._u, dist, "right")] += 1
 
+    def add_many(self, dists):
+        """Add tours with given distances to histogram."""
+        self.histogram += numpy.bincount(
+            numpy.searchsorted(self._u, dists, "right"),
+            minlength=len(self.histogram))
+
     def count_tour_dists(self, tours, dists):
         self.histogram[:], _ = numpy.histogram(dists, intervals, weights=tours)
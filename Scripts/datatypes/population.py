@@ -0,0 +1,847 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple, cast
+import copy
+import numpy # type: ignore
+import pandas # type: ignore
+if TYPE_CHECKING:
+    from datahandling.zonedata import ZoneData
+    from datatypes.purpose import TourPurpose
+    from models.logit import ModeDestModel
+    from models.car_use import CarUseModel
+    from models.linear import IncomeModel
+    from models.tour_combinations import TourCombinationModel
+    from utils.counter_rng import CounterRNG
+
+from datatypes.person import Person
+from datatypes.tour import Tour
+import parameters.car as param
+from parameters.assignment import assignment_classes, vot_inv
+from parameters.impedance_transformation import divided_classes, transit_trips_per_month
+
+
+# Number of persons for which tour combination probabilities
+# are compared at once
+CHOICE_BLOCK_SIZE = 2**16
+# Number of persons (or tours) printed to result files at once
+TABLE_CHUNK_SIZE = 2**18
+
+
+class Population:
+    """Synthetic population for agent-based simulation.
+
+    Person attributes are stored as numpy arrays indexed by person id,
+    and tours in a `TourTable`. Iterating over the population yields
+    `Person` views to these arrays.
+
+    Parameters
+    ----------
+    zone_data : ZoneData
+        Data used for all demand calculations
+    age_groups : list
+        tuple
+            int
+                Age intervals
+    zone_index : numpy.ndarray
+        Home zone index of each person
+    age_group : numpy.ndarray
+        Index of age group (in `age_groups`) of each person
+    inhabitant : numpy.ndarray
+        Running number of each person among inhabitants of home zone
+    generation_model : models.tour_combinations.TourCombinationModel
+        Model used to create tours
+    car_use_model : models.car_use.CarUseModel
+        Model used to decide if car user
+    income_models : list of models.linear.IncomeModel
+        Income models for persons living outside and in Helsinki
+    rng : utils.counter_rng.CounterRNG
+        Random number generator for person and tour draws,
+        which are keyed by home zone number and inhabitant number
+    """
+
+    # Person attributes stored as arrays
+    columns = ("zone_index", "age_group", "inhabitant", "zone_number", "age",
+               "sex", "car_use_draw", "tour_combination_draw", "income_draw",
+               "is_car_user", "income")
+
+    def __init__(self,
+                 zone_data: ZoneData,
+                 age_groups: List[Tuple[int, int]],
+                 zone_index: numpy.ndarray,
+                 age_group: numpy.ndarray,
+                 inhabitant: numpy.ndarray,
+                 generation_model: TourCombinationModel,
+                 car_use_model: CarUseModel,
+                 income_models: List[IncomeModel],
+                 rng: CounterRNG):
+        self.zone_data = zone_data
+        self.age_groups = age_groups
+        self.age_group_names = ["age_{}-{}".format(*age_group)
+            for age_group in age_groups]
+        self.generation_model = generation_model
+        self.car_use_model = car_use_model
+        self.income_models = income_models
+        self.zone_index = numpy.asarray(zone_index, numpy.int32)
+        self.age_group = numpy.asarray(age_group, numpy.int8)
+        self.inhabitant = numpy.asarray(inhabitant, numpy.int64)
+        self.zone_number = zone_data.zone_numbers[self.zone_index]
+        self.rng = rng
+        nr_persons = len(self.zone_index)
+        intervals = numpy.array(age_groups)[self.age_group]
+        lengths = intervals[:, 1] - intervals[:, 0] + 1
+        self.age = (intervals[:, 0] + numpy.floor(
+            lengths * self.draw("age"))).astype(numpy.int16)
+        self.sex = self.draw("sex") < 0.5
+        self.car_use_draw = self.draw("car_use")
+        self.tour_combination_draw = self.draw("tour_combination")
+        self.income_draw = rng.standard_normal(
+            "income", self.zone_number, self.inhabitant)
+        self.is_car_user = numpy.zeros(nr_persons, bool)
+        self.income = numpy.full(nr_persons, numpy.nan)
+        self.tours = TourTable(self)
+
+    def __len__(self) -> int:
+        return len(self.zone_index)
+
+    def __iter__(self) -> Iterator[Person]:
+        for i in range(len(self)):
+            yield Person(self, i)
+
+    def __getitem__(self, person_id: int) -> Person:
+        return Person(self, person_id)
+
+    def zone_blocks(self, nr_blocks: int) -> List[slice]:
+        """Divide persons into blocks of home zones.
+
+        Persons are sorted by home zone, so each block is a range
+        of person ids. Blocks have roughly equal numbers of persons.
+
+        Parameters
+        ----------
+        nr_blocks : int
+            Max number of blocks
+
+        Returns
+        -------
+        list of slice
+            Person id ranges
+        """
+        zone_starts = numpy.concatenate((
+            [0], numpy.flatnonzero(numpy.diff(self.zone_index)) + 1,
+            [len(self)]))
+        targets = numpy.linspace(0, len(self), nr_blocks + 1)
+        cuts = numpy.unique(zone_starts[
+            zone_starts.searchsorted(targets).clip(max=len(zone_starts)-1)])
+        return [slice(cuts[i], cuts[i+1]) for i in range(len(cuts) - 1)]
+
+    def subset(self, persons: slice) -> Population:
+        """Get population consisting of a range of persons.
+
+        Draws are the same as in the whole population,
+        but tours are not copied.
+
+        Parameters
+        ----------
+        persons : slice
+            Person id range
+
+        Returns
+        -------
+        Population
+            New population, where person ids start from zero
+        """
+        population = copy.copy(self)
+        for column in self.columns:
+            setattr(population, column, getattr(self, column)[persons].copy())
+        population.tours = TourTable(population)
+        return population
+
+    def draw(self, kind: str, *keys) -> numpy.ndarray:
+        """Get uniform draws for persons (or their tours).
+
+        Parameters
+        ----------
+        kind : str
+            Name of draw (sex/car_use/mode/...)
+        *keys : numpy.ndarray
+            Additional keys for draws, e.g., person id and tour slot
+            if drawing for tours, otherwise one draw per person
+
+        Returns
+        -------
+        numpy.ndarray
+            Uniform draws from interval [0, 1)
+        """
+        if keys:
+            person = keys[0]
+            return self.rng.uniform(
+                kind, self.zone_number[person], self.inhabitant[person],
+                *keys[1:])
+        return self.rng.uniform(kind, self.zone_number, self.inhabitant)
+
+    def decide_car_use(self):
+        """Decide car use for all persons, based on their car use draws.
+
+        Assumes car use model has already calculated basic probabilities.
+        """
+        for i, age_group in enumerate(self.age_group_names):
+            for sex, gender in enumerate(("female", "male")):
+                persons = (self.age_group == i) & (self.sex == sex)
+                prob = self.car_use_model.calc_individual_prob(
+                    age_group, gender)
+                self.is_car_user[persons] = (self.car_use_draw[persons]
+                                             < prob[self.zone_index[persons]])
+
+    def choose_tour_combinations(self,
+                                 tour_probs: Dict[str, List[numpy.ndarray]]
+                                ) -> numpy.ndarray:
+        """Choose tour combination for all persons.
+
+        Parameters
+        ----------
+        tour_probs : dict
+            Age (age_7-17/...) : list
+                Is car user (False/True) : numpy.array
+                    Matrix with cumulative tour combination probabilities
+                    for all zones
+
+        Returns
+        -------
+        numpy.ndarray
+            Index of tour combination (in generation model) for each person
+        """
+        combinations = numpy.empty(len(self), numpy.int64)
+        for i, age_group in enumerate(self.age_group_names):
+            for is_car_user in (False, True):
+                persons = numpy.flatnonzero(
+                    (self.age_group == i) & (self.is_car_user == is_car_user))
+                cumul_probs = tour_probs[age_group][is_car_user]
+                for start in range(0, len(persons), CHOICE_BLOCK_SIZE):
+                    block = persons[start:start+CHOICE_BLOCK_SIZE]
+                    # Same as `numpy.searchsorted` for each row
+                    combinations[block] = (
+                        cumul_probs[self.zone_index[block], :]
+                        < self.tour_combination_draw[block, numpy.newaxis]
+                    ).sum(axis=1)
+        return combinations
+
+    def calc_income(self):
+        """Calculate income for all persons, based on their income draws.
+
+        Assumes income models have already predicted zone log income.
+        Persons under 17 have no income.
+        """
+        zone_data = self.zone_data
+        is_helsinki = numpy.array(
+            [zone_data.zones[number].municipality == "Helsinki"
+                for number in zone_data.zone_numbers])[self.zone_index]
+        self.income[:] = 0
+        for i, model in enumerate(self.income_models):
+            persons = numpy.flatnonzero((self.age >= 17) & (is_helsinki == i))
+            log_income = model.log_income[self.zone_number[persons]].values
+            param = model.param
+            log_income += param["car_users"] * self.is_car_user[persons]
+            for sex, gender in enumerate(("female", "male")):
+                if gender in param:
+                    log_income[self.sex[persons] == sex] += param[gender]
+            for j, age_group in enumerate(self.age_group_names):
+                if age_group in param["age_dummies"]:
+                    log_income[self.age_group[persons] == j] += (
+                        param["age_dummies"][age_group])
+            log_income += (param["standard_deviation"]
+                           * self.income_draw[persons])
+            self.income[persons] = numpy.exp(log_income)
+
+    def get_table(self, persons: slice) -> pandas.DataFrame:
+        """Get person attributes for result files.
+
+        Parameters
+        ----------
+        persons : slice
+            Person id range
+
+        Returns
+        -------
+        pandas.DataFrame
+            Table with columns `Person.attr`, indexed by person id
+        """
+        ids = range(len(self))[persons]
+        zone_data = self.zone_data
+        zones = [zone_data.zones[number] for number in zone_data.zone_numbers]
+        zone_index = self.zone_index[persons]
+        table = pandas.DataFrame({
+            "age_group": numpy.array(
+                self.age_group_names)[self.age_group[persons]],
+            "gender": numpy.where(self.sex[persons], "male", "female"),
+            "is_car_user": self.is_car_user[persons],
+            "income": self.income[persons],
+            "number": self.zone_number[persons],
+            "area": numpy.array([zone.area for zone in zones])[zone_index],
+            "municipality": numpy.array(
+                [zone.municipality for zone in zones])[zone_index],
+        }, pandas.RangeIndex(ids.start, ids.stop, name=Person.attr[0]),
+            Person.attr[1:])
+        return table
+
+
+class TourTable:
+    """Tours of synthetic population, stored as numpy arrays.
+
+    Tours are sorted by person, and each home-based tour is
+    directly followed by its non-home tour (if there is one).
+    Iterating over the table yields `Tour` views to these arrays.
+
+    Parameters
+    ----------
+    population : Population
+        Persons making the tours
+    """
+
+    # Random draws stored for each tour
+    draws = ("car_passenger", "mode", "dest", "sec_dest_gen", "sec_dest",
+             "non_home")
+    # Tour attributes stored as arrays
+    columns = ("person", "purpose", "source", "key", "orig", "dest",
+               "sec_dest", "mode", "total_access", "cost", "gen_cost",
+               "mode_bounds", "dest_bounds")
+
+    def __init__(self, population: Population):
+        self.population = population
+        self.purposes: List[TourPurpose] = []
+        # Car use of each tour's person, set only in snapshots
+        self.is_car_user: Optional[numpy.ndarray] = None
+        self._init_columns(0)
+        self._first_tour = numpy.zeros(len(population) + 1, numpy.int64)
+
+    def _init_columns(self, nr_tours: int):
+        self.person = numpy.zeros(nr_tours, numpy.int64)
+        self.purpose = numpy.zeros(nr_tours, numpy.int8)
+        self.source = numpy.full(nr_tours, -1, numpy.int64)
+        self.key = numpy.zeros(nr_tours, numpy.int64)
+        self.orig = numpy.zeros(nr_tours, numpy.int32)
+        self.dest = numpy.full(nr_tours, -1, numpy.int32)
+        self.sec_dest = numpy.full(nr_tours, -1, numpy.int32)
+        self.mode = numpy.full(nr_tours, -1, numpy.int8)
+        self.draw = {draw: numpy.zeros(nr_tours) for draw in self.draws}
+        self.total_access = numpy.full(nr_tours, numpy.nan)
+        self.cost = numpy.full(nr_tours, numpy.nan)
+        self.gen_cost = numpy.full(nr_tours, numpy.nan)
+        # Cumulative probabilities between which the mode (destination)
+        # draw fell when the choice was made
+        self.mode_bounds = numpy.full((nr_tours, 2), numpy.nan)
+        self.dest_bounds = numpy.full((nr_tours, 2), numpy.nan)
+
+    def __len__(self) -> int:
+        return len(self.person)
+
+    def get_columns(self) -> Dict[str, numpy.ndarray]:
+        """Get tour attribute arrays, with draws prefixed by "draw_"."""
+        columns = {column: getattr(self, column) for column in self.columns}
+        for name in self.draws:
+            columns["draw_" + name] = self.draw[name]
+        return columns
+
+    def merge(self,
+              purposes: Dict[str, TourPurpose],
+              parts: List[Tuple[int, Dict[str, numpy.ndarray]]]
+             ) -> numpy.ndarray:
+        """Replace tours with tours from population subsets.
+
+        Parameters
+        ----------
+        purposes : dict
+            key : str
+                Tour purpose name (hw/ho/...)
+            value : datatypes.purpose.TourPurpose
+                The tour purpose object
+        parts : list
+            tuple
+                int
+                    Id of first person in subset
+                dict
+                    Tour attribute arrays from `get_columns()`,
+                    in order of person ids
+
+        Returns
+        -------
+        numpy.ndarray
+            Index of first tour of each part in merged table
+        """
+        self.purposes = list(purposes.values())
+        first_row = numpy.cumsum([0] + [len(columns["person"])
+            for _, columns in parts])
+        for column in self.columns:
+            setattr(self, column, numpy.concatenate(
+                [columns[column] for _, columns in parts]))
+        for name in self.draws:
+            self.draw[name] = numpy.concatenate(
+                [columns["draw_" + name] for _, columns in parts])
+        for i, (first_person, columns) in enumerate(parts):
+            rows = slice(first_row[i], first_row[i+1])
+            self.person[rows] += first_person
+            source = self.source[rows]
+            source[source >= 0] += first_row[i]
+        self._first_tour = numpy.concatenate(([0], numpy.bincount(
+            self.person, minlength=len(self.population)).cumsum()))
+        return first_row[:-1]
+
+    def __iter__(self) -> Iterator[Tour]:
+        for i in range(len(self)):
+            yield Tour(self, i)
+
+    def __getitem__(self, tour_id: int) -> Tour:
+        return Tour(self, tour_id)
+
+    def person_tours(self, person_id: int) -> List[Tour]:
+        """Get tours of one person."""
+        return [Tour(self, i) for i in range(
+            self._first_tour[person_id], self._first_tour[person_id+1])]
+
+    def generate(self,
+                 purposes: Dict[str, TourPurpose],
+                 tour_probs: Dict[str, List[numpy.ndarray]]):
+        """Replace tours with new tours from tour combination choice.
+
+        A tour is identified by its person and a key made from its
+        purpose and order among the person's tours with the same purpose
+        (and source tour if non-home tour). Random draws depend only on
+        these, so a tour which existed in the previous table is recycled,
+        i.e., it keeps its random draws.
+
+        Parameters
+        ----------
+        purposes : dict
+            key : str
+                Tour purpose name (hw/ho/...)
+            value : datatypes.purpose.TourPurpose
+                The tour purpose object
+        tour_probs : dict
+            Age (age_7-17/...) : list
+                Is car user (False/True) : numpy.array
+                    Matrix with cumulative tour combination probabilities
+                    for all zones
+        """
+        population = self.population
+        if not self.purposes:
+            self.purposes = list(purposes.values())
+        purpose_idx = {purpose.name: i
+            for i, purpose in enumerate(self.purposes)}
+        nr_purposes = len(self.purposes)
+
+        # Purposes and their order numbers in each tour combination
+        combinations = population.generation_model.tour_combinations
+        purpose_list: List[int] = []
+        order_list: List[int] = []
+        for combination in combinations:
+            for j, name in enumerate(combination):
+                purpose_list.append(purpose_idx[name])
+                order_list.append(combination[:j].count(name))
+        comb_purposes = numpy.array(purpose_list, numpy.int64)
+        comb_order = numpy.array(order_list, numpy.int64)
+        max_order = comb_order.max() + 1
+        comb_len = numpy.array([len(c) for c in combinations])
+        comb_start = numpy.concatenate(([0], comb_len.cumsum()[:-1]))
+
+        # Home-based tours
+        chosen = population.choose_tour_combinations(tour_probs)
+        nr_tours = comb_len[chosen]
+        person = numpy.repeat(numpy.arange(len(population)), nr_tours)
+        first = numpy.concatenate(([0], nr_tours.cumsum()))
+        comb_pos = (comb_start[chosen[person]]
+                    + numpy.arange(len(person)) - first[person])
+        purpose = comb_purposes[comb_pos]
+        key = 2 * (purpose*max_order + comb_order[comb_pos])
+
+        # Non-home tours
+        non_home_prob = numpy.zeros(nr_purposes)
+        non_home_purpose = numpy.zeros(nr_purposes, numpy.int64)
+        for name in {name for c in combinations for name in c}:
+            source = "wo" if name == "hw" else "oo"
+            non_home_prob[purpose_idx[name]] = (
+                purposes[source].gen_model.param[name])
+            non_home_purpose[purpose_idx[name]] = purpose_idx[source]
+        has_non_home = (population.draw("non_home", person, key)
+                        < non_home_prob[purpose])
+        nr_rows = 1 + has_non_home
+        home_row = numpy.concatenate(([0], nr_rows.cumsum()[:-1]))
+        non_home_row = home_row[has_non_home] + 1
+
+        self._init_columns(len(person) + has_non_home.sum())
+        for rows, src in ((home_row, slice(None)), (non_home_row, has_non_home)):
+            self.person[rows] = person[src]
+            self.key[rows] = key[src]
+        self.purpose[home_row] = purpose
+        self.purpose[non_home_row] = non_home_purpose[purpose[has_non_home]]
+        self.source[non_home_row] = home_row[has_non_home]
+        self.key[non_home_row] += 1
+        for name in self.draws:
+            self.draw[name] = population.draw(name, self.person, self.key)
+        self.orig[:] = population.zone_index[self.person]
+        self._first_tour = numpy.concatenate(([0], numpy.bincount(
+            self.person, minlength=len(population)).cumsum()))
+
+    def snapshot(self) -> TourTable:
+        """Get copy of tour table, to be compared with next iteration.
+
+        Columns are not copied, as `generate` replaces them.
+        Car use of each tour's person is stored as `is_car_user`.
+        """
+        tours = copy.copy(self)
+        tours.draw = dict(self.draw)
+        tours.is_car_user = self.population.is_car_user[self.person]
+        return tours
+
+    def recycle_choices(self,
+                        previous: TourTable,
+                        threshold: float) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """Keep choices from previous iteration for tours in unchanged zones.
+
+        A tour is recycled if it existed in previous iteration and
+        its person is still of same car use. Its mode and destinations
+        are kept, unless its origin or destination is among the zones
+        where cumulative probabilities bounding the previous mode or
+        destination choice of some tour have changed by more than
+        `threshold`.
+
+        Assumes tour purpose models have already calculated
+        probability matrices.
+
+        Parameters
+        ----------
+        previous : TourTable
+            Snapshot of tour table from previous iteration
+        threshold : float
+            Max change in cumulative probabilities for zone to be unchanged
+
+        Returns
+        -------
+        numpy.ndarray
+            Boolean array telling which tours need to be simulated
+        numpy.ndarray
+            Boolean array telling which tours in previous table
+            were not recycled
+        """
+        nr_keys = max(self.key.max(initial=0), previous.key.max(initial=0)) + 1
+        new_id = self.person*nr_keys + self.key
+        old_id = previous.person*nr_keys + previous.key
+        order = numpy.argsort(old_id, kind="stable")
+        old_row = order[old_id[order].searchsorted(new_id).clip(
+            max=max(len(order) - 1, 0))]
+        is_car_user = self.population.is_car_user[self.person]
+        was_car_user = cast(numpy.ndarray, previous.is_car_user) #type checker help
+        recycled = ((old_id[old_row] == new_id)
+                    & (previous.mode[old_row] >= 0)
+                    & (previous.dest[old_row] >= 0)
+                    & (was_car_user[old_row] == is_car_user))
+        old_row = old_row[recycled]
+        rows = numpy.flatnonzero(recycled)
+        for column in ("mode", "dest", "sec_dest",
+                       "mode_bounds", "dest_bounds"):
+            getattr(self, column)[rows] = getattr(previous, column)[old_row]
+        change = numpy.zeros(len(rows))
+        mode_bounds = self.mode_bounds[rows]
+        dest_bounds = self.dest_bounds[rows]
+        purpose = self.purpose[rows]
+        mode = self.mode[rows]
+        orig = self.orig[rows]
+        dest = self.dest[rows]
+        for i, p in enumerate(self.purposes):
+            is_purpose = purpose == i
+            if not is_purpose.any():
+                continue
+            model = cast("ModeDestModel", p.model) #type checker help
+            for car_user in (False, True):
+                r = numpy.flatnonzero(is_purpose & (is_car_user[rows] == car_user))
+                if len(r) == 0:
+                    continue
+                zones, inverse = numpy.unique(orig[r], return_inverse=True)
+                probs, accessibility = model.calc_individual_mode_prob(
+                    car_user, zones)
+                accessibility = cast(numpy.ndarray, accessibility) #type checker help
+                self.total_access[rows[r]] = accessibility[inverse]
+                bounds = self._bounds(probs.cumsum(axis=1).T, mode[r], inverse)
+                change[r] = numpy.abs(bounds - mode_bounds[r]).max(axis=1)
+            for j, m in enumerate(p.modes):
+                r = numpy.flatnonzero(is_purpose & (mode == j))
+                if len(r) == 0:
+                    continue
+                bounds = self._bounds(model.cumul_dest_prob[m], dest[r],
+                                      orig[r] - p.bounds.start)
+                change[r] = numpy.maximum(
+                    change[r], numpy.abs(bounds - dest_bounds[r]).max(axis=1))
+            # Tours from and to changed zones are simulated again
+            is_changed = numpy.zeros(len(self.population.zone_data.zone_numbers), bool)
+            is_changed[orig[is_purpose & (change > threshold)]] = True
+            changed = is_purpose & (is_changed[orig] | is_changed[dest])
+            recycled[rows[changed]] = False
+        is_removed = numpy.ones(len(previous), bool)
+        is_removed[old_row[recycled[rows]]] = False
+        simulated = numpy.flatnonzero(~recycled)
+        self.mode[simulated] = -1
+        self.dest[simulated] = -1
+        self.sec_dest[simulated] = -1
+        return ~recycled, is_removed
+
+    @staticmethod
+    def _bounds(cumul_probs: numpy.ndarray,
+                choices: numpy.ndarray,
+                columns: numpy.ndarray) -> numpy.ndarray:
+        """Get cumulative probabilities bounding chosen alternatives.
+
+        Parameters
+        ----------
+        cumul_probs : numpy.ndarray
+            Cumulative probabilities, alternatives as rows
+        choices : numpy.ndarray
+            Index of chosen alternative for each choice
+        columns : numpy.ndarray
+            Index of probability column for each choice
+
+        Returns
+        -------
+        numpy.ndarray
+            Lower and upper bound for each choice
+        """
+        choices = choices.clip(max=len(cumul_probs) - 1)
+        upper = cumul_probs[choices, columns]
+        lower = numpy.where(
+            choices > 0, cumul_probs[(choices - 1).clip(min=0), columns], 0)
+        return numpy.stack((lower, upper), axis=1)
+
+    def choose_modes_and_destinations(
+            self,
+            sec_dest_tours: Dict[str, List[Dict[int, List[Tour]]]],
+            simulated: Optional[numpy.ndarray] = None):
+        """Choose mode and primary destination for tours.
+
+        Assumes tour purpose models have already calculated
+        probability matrices. Tour sums are added to tour purposes
+        for all tours, including recycled ones.
+
+        Parameters
+        ----------
+        sec_dest_tours : dict
+            Mode (car/transit/bike/walk) : list
+                Origin (relative to secondary destination bounds) : dict
+                    Destination (relative) : list
+                        Tours that get a secondary destination
+        simulated : numpy.ndarray (optional)
+            Boolean array telling which tours are simulated,
+            others keep their choices (see `recycle_choices`).
+            By default, all tours are simulated.
+        """
+        if simulated is None:
+            simulated = numpy.ones(len(self), bool)
+        is_car_user = self.population.is_car_user[self.person]
+        for i, purpose in enumerate(self.purposes):
+            is_purpose = self.purpose == i
+            if not is_purpose.any():
+                continue
+            for car_user in (False, True):
+                rows = numpy.flatnonzero(
+                    is_purpose & simulated & (is_car_user == car_user))
+                if len(rows) > 0:
+                    self._choose_mode(purpose, car_user, rows)
+            for j, mode in enumerate(purpose.modes):
+                rows = numpy.flatnonzero(is_purpose & (self.mode == j))
+                if len(rows) == 0:
+                    continue
+                is_simulated = simulated[rows]
+                if is_simulated.any():
+                    self._choose_destination(
+                        purpose, mode, rows[is_simulated], sec_dest_tours)
+                self._add_sums(purpose, mode, rows, ~is_simulated)
+
+    def _choose_mode(self,
+                     purpose: TourPurpose,
+                     is_car_user: bool,
+                     rows: numpy.ndarray):
+        """Choose mode for tours with same purpose and car user status.
+
+        Mode probabilities are calculated once per origin zone.
+        """
+        zones, inverse = numpy.unique(self.orig[rows], return_inverse=True)
+        model = cast("ModeDestModel", purpose.model) #type checker help
+        probs, accessibility = model.calc_individual_mode_prob(
+            is_car_user, zones)
+        accessibility = cast(numpy.ndarray, accessibility) #type checker help
+        cumul_probs = probs.cumsum(axis=1)
+        # Same as `numpy.searchsorted` for each row
+        modes = (cumul_probs[inverse, :]
+                 < self.draw["mode"][rows, numpy.newaxis]).sum(axis=1)
+        self.mode[rows] = modes
+        self.mode_bounds[rows] = self._bounds(cumul_probs.T, modes, inverse)
+        self.total_access[rows] = accessibility[inverse]
+
+    def _choose_destination(self,
+                            purpose: TourPurpose,
+                            mode: str,
+                            rows: numpy.ndarray,
+                            sec_dest_tours: Dict[str, List[Dict[int, List[Tour]]]]):
+        """Choose primary destination for tours with same purpose and mode.
+
+        All draws are resolved in one `numpy.searchsorted` over the
+        cumulative probability columns, which are laid one after another
+        and offset by their origin.
+        """
+        model = cast("ModeDestModel", purpose.model) #type checker help
+        cumul_probs = model.cumul_dest_prob[mode]
+        nr_dests, nr_origs = cumul_probs.shape
+        orig = self.orig[rows]
+        orig_rel = orig - purpose.bounds.start
+        flat_probs = (cumul_probs + numpy.arange(nr_origs)).T.ravel()
+        dest = (flat_probs.searchsorted(self.draw["dest"][rows] + orig_rel)
+                - orig_rel*nr_dests).clip(0, nr_dests - 1)
+        self.dest[rows] = dest
+        self.sec_dest[rows] = -1
+        self.dest_bounds[rows] = self._bounds(cumul_probs, dest, orig_rel)
+        if mode == "walk":
+            return
+        try:
+            bounds = purpose.sec_dest_purpose.bounds
+            sec_dest_prob = purpose.sec_dest_purpose.gen_model.param[
+                purpose.name][mode]
+        except AttributeError:
+            return
+        has_sec_dest = ((bounds.start <= orig) & (orig < bounds.stop)
+                        & (bounds.start <= dest) & (dest < bounds.stop)
+                        & (self.draw["sec_dest_gen"][rows] < sec_dest_prob))
+        for i, o, d in zip(rows[has_sec_dest].tolist(),
+                           (orig[has_sec_dest] - bounds.start).tolist(),
+                           (dest[has_sec_dest] - bounds.start).tolist()):
+            sec_dest_tours[mode][o][d].append(Tour(self, i))
+
+    def _add_sums(self,
+                  purpose: TourPurpose,
+                  mode: str,
+                  rows: numpy.ndarray,
+                  is_recycled: numpy.ndarray):
+        """Add tours with same purpose and mode to tour purpose sums.
+
+        Secondary destinations are added only for recycled tours,
+        as they are chosen later for simulated tours.
+        """
+        orig = self.orig[rows]
+        dest = self.dest[rows]
+        orig_rel = orig - purpose.bounds.start
+        generated: numpy.ndarray = purpose.generated_tours[mode]
+        generated += numpy.bincount(
+            orig, minlength=len(generated)).astype(generated.dtype)
+        attracted: numpy.ndarray = purpose.attracted_tours[mode]
+        attracted += numpy.bincount(
+            dest, minlength=len(attracted)).astype(attracted.dtype)
+        purpose.histograms[mode].add_many(purpose.dist[orig_rel, dest])
+        zone_numbers = purpose.zone_data.zone_numbers
+        purpose.aggregates[mode].add_many(zone_numbers[orig], zone_numbers[dest])
+        purpose.own_zone_aggregates[mode].add_many(
+            zone_numbers[orig[orig == dest]])
+        sec_dest = self.sec_dest[rows[is_recycled]]
+        sec_dest = sec_dest[sec_dest >= 0]
+        if len(sec_dest) > 0:
+            attracted = purpose.sec_dest_purpose.attracted_tours[mode]
+            attracted += numpy.bincount(
+                sec_dest, minlength=len(attracted)).astype(attracted.dtype)
+
+    def calc_cost(self,
+                  impedance: Dict[str, Dict[str, Dict[str, numpy.ndarray]]]):
+        """Calculate cost and generalized cost for all tours.
+
+        Parameters
+        ----------
+        impedance: dict
+            Time period (aht/pt/iht) : dict
+                Type (time/cost/dist) : dict
+                    Assignment class (car_work/transit/...) : numpy 2d matrix
+        """
+        for i, purpose in enumerate(self.purposes):
+            demand_type = assignment_classes[cast(str, purpose.name)]
+            if demand_type == "work":
+                time_periods = ("aht", "iht", "iht")
+            else:
+                time_periods = ("pt", "pt", "pt")
+            vot = 1 / vot_inv[demand_type]
+            for j, mode in enumerate(purpose.modes):
+                rows = numpy.flatnonzero((self.purpose == i) & (self.mode == j))
+                if len(rows) == 0:
+                    continue
+                ass_class = ("{}_{}".format(mode, demand_type)
+                    if mode in divided_classes else mode)
+                orig = self.orig[rows]
+                dest = self.dest[rows]
+                sec_dest = self.sec_dest[rows]
+                has_sec_dest = sec_dest >= 0
+                costs = {}
+                for mtx_type in ("time", "cost"):
+                    cost = numpy.zeros(len(rows))
+                    try:
+                        departure_imp, sec_dest_imp, return_imp = [
+                            impedance[tp][mtx_type][ass_class]
+                                for tp in time_periods]
+                    except KeyError:
+                        # bike and walk modes do not have cost matrices
+                        costs[mtx_type] = cost
+                        continue
+                    cost += departure_imp[orig, dest]
+                    cost += numpy.where(
+                        has_sec_dest,
+                        sec_dest_imp[dest, sec_dest] + return_imp[sec_dest, orig],
+                        return_imp[dest, orig])
+                    costs[mtx_type] = cost
+                # scale transit costs from month to day
+                if mode == "transit":
+                    k = purpose.sub_intervals.searchsorted(orig, side="right")
+                    costs["cost"] /= numpy.array(
+                        transit_trips_per_month[cast(str, purpose.area)][demand_type])[k]
+                self.cost[rows] = costs["cost"]
+                self.gen_cost[rows] = costs["cost"] + costs["time"] * vot
+
+    def get_table(self, tours: slice) -> pandas.DataFrame:
+        """Get tour attributes for result files.
+
+        Parameters
+        ----------
+        tours : slice
+            Tour id range
+
+        Returns
+        -------
+        pandas.DataFrame
+            Table with columns `Tour.attr`, indexed by person id
+        """
+        purpose = self.purpose[tours]
+        mode = self.mode[tours]
+        orig = self.orig[tours]
+        purpose_names = numpy.empty(len(purpose), object)
+        mode_names = numpy.empty(len(purpose), object)
+        sustainable_access = numpy.full(len(purpose), numpy.nan)
+        for i, p in enumerate(self.purposes):
+            rows = purpose == i
+            if not rows.any():
+                continue
+            purpose_names[rows] = p.name
+            mode_names[rows] = numpy.array(list(p.modes))[mode[rows]]
+            # Set by accessibility model, hence not declared in purpose
+            access = cast(pandas.Series, getattr(p, "sustainable_access"))
+            sustainable_access[rows] = -access.values[
+                orig[rows] - p.bounds.start]
+        table = pandas.DataFrame({
+            "purpose_name": purpose_names,
+            "mode": mode_names,
+            "total_access": self.total_access[tours],
+            "sustainable_access": sustainable_access,
+            "cost": self.cost[tours],
+            "gen_cost": self.gen_cost[tours],
+        }, pandas.Index(self.person[tours], name=Tour.attr[0]), Tour.attr[1:])
+        return table
+
+    def is_car_passenger(self) -> numpy.ndarray:
+        """Get boolean array telling which tours are car passenger tours."""
+        is_car_passenger = numpy.zeros(len(self), bool)
+        for i, purpose in enumerate(self.purposes):
+            if "car" in purpose.modes:
+                rows = ((self.purpose == i)
+                        & (self.mode == list(purpose.modes).index("car")))
+                if not rows.any():
+                    continue
+                is_car_passenger[rows] = (self.draw["car_passenger"][rows]
+                                          > param.car_driver_share[cast(str, purpose.name)])
+        return is_car_passenger
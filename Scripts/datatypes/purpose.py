@@ -10,6 +10,7 @@ from parameters.destination_choice import secondary_destination_threshold
 import models.logit as logit
 import models.generation as generation
 from datatypes.demand import Demand
+from utils.memory import float_dtype
 from utils.zone_interval import MatrixAggregator, ArrayAggregator
 from datatypes.histogram import TourLengthHistogram
 
@@ -181,7 +182,7 @@ class TourPurpose(Purpose):
             Mode (car/transit/bike) : dict
                 Demand matrix for whole day : Demand
         """
-        tours = self.gen_model.get_tours()
+        tours = self.gen_model.get_tours().astype(float_dtype(), copy=False)
         demand = {}
         for mode in self.modes:
             mtx = (self.prob.pop(mode) * tours).T
@@ -225,7 +226,7 @@ class SecDestPurpose(Purpose):
         Purpose.__init__(self, specification, zone_data, resultdata)
         self.gen_model = generation.SecDestGeneration(self, resultdata)
         self.model = logit.SecDestModel(zone_data, self, resultdata)
-        self.modes = self.model.dest_choice_param.keys()
+        self.modes = list(self.model.dest_choice_param)
 
     def init_sums(self):
         for mode in self.model.dest_choice_param:
@@ -269,8 +270,9 @@ class SecDestPurpose(Purpose):
             # If no o-d pairs have demand above threshold,
             # the sole destination with largest demand is picked
             dests = [generation.argmax()]
+            gen_sum = generation.sum()
             generation.fill(0)
-            generation[dests] = generation.sum()
+            generation[dests] = gen_sum
         else:
             generation[dests] *= generation.sum() / generation[dests].sum()
             generation[~dests] = 0
@@ -280,6 +282,115 @@ class SecDestPurpose(Purpose):
         self.attracted_tours[mode][self.bounds] += demand.sum(0)
         return Demand(self, mode, demand, orig_offset + orig)
 
+    def distribute_tours_batched(self, mode, impedance, origs, orig_offset=0):
+        """Decide the secondary destinations for all tours (generated
+        earlier) starting from a block of zones.
+
+        Calculation is performed for all origin-destination pairs
+        above threshold in block at once, as 2-d arrays
+        (o-d pair x secondary destination).
+        
+        Parameters
+        ----------
+        mode : str
+            Mode (car/transit/bike)
+        impedance : dict
+            Type (time/cost/dist) : numpy 2d matrix
+        origs : slice
+            The relative zone indices from which these tours origin
+        orig_offset : int (optional)
+            Absolute zone index of first orig is orig_offset + origs.start
+
+        Returns
+        -------
+        Demand
+            Matrix of destination -> secondary_destination pairs,
+            summed over origins in block
+        Demand
+            Matrix of origin -> secondary_destination pairs,
+            the first origin in block as origin
+        """
+        demand, orig_demand = self.calc_batch_demand(mode, impedance, origs)
+        return (Demand(self, mode, demand),
+                Demand(self, mode, orig_demand, orig_offset + origs.start))
+
+    def count_pairs(self, mode):
+        """Count o-d pairs for which secondary destinations are calculated.
+
+        Parameters
+        ----------
+        mode : str
+            Mode (car/transit/bike)
+
+        Returns
+        -------
+        numpy.ndarray
+            Number of destinations for each origin (at least one)
+        """
+        dests = self.tours[mode] > secondary_destination_threshold
+        return numpy.maximum(dests.sum(1), 1)
+
+    def calc_batch_demand(self, mode, impedance, origs):
+        """Calculate secondary destination tours for a block of origins.
+
+        Attracted tours are updated, but the demand matrices are
+        returned as plain arrays (without car driver share applied).
+        
+        Parameters
+        ----------
+        mode : str
+            Mode (car/transit/bike)
+        impedance : dict
+            Type (time/cost/dist) : numpy 2d matrix
+        origs : slice
+            The relative zone indices from which these tours origin
+
+        Returns
+        -------
+        numpy 2-d matrix
+            Destination -> secondary destination tours,
+            summed over origins in block
+        numpy 2-d matrix
+            Origin -> secondary destination tours
+        """
+        generation = self.tours[mode][origs, :]
+        gen_sum = generation.sum(1)
+        # All o-d pairs below threshold are neglected,
+        # total demand is increased for other pairs.
+        dests = generation > secondary_destination_threshold
+        # If no o-d pairs have demand above threshold,
+        # the sole destination with largest demand is picked
+        no_dests = (~dests.any(1)).nonzero()[0]
+        dests[no_dests, generation[no_dests].argmax(1)] = True
+        generation[~dests] = 0
+        dest_sum = generation.sum(1)
+        scale = numpy.divide(
+            gen_sum, dest_sum, out=numpy.zeros_like(gen_sum),
+            where=dest_sum > 0)
+        generation *= scale[:, numpy.newaxis]
+        # Pairs are in origin-major order
+        pair_origs, pair_dests = dests.nonzero()
+        origins = pair_origs + origs.start
+        dest_imp = {}
+        for mtx_type in impedance:
+            imp = impedance[mtx_type]
+            dest_imp[mtx_type] = (imp[pair_dests, :]
+                                  + imp[:, origins].T
+                                  - imp[pair_dests, origins][:, numpy.newaxis])
+        prob = self.model.calc_batch_prob(mode, dest_imp, origins, pair_dests)
+        prob *= generation[pair_origs, pair_dests][:, numpy.newaxis]
+        orig_demand = numpy.zeros((generation.shape[0], prob.shape[1]),
+                                  prob.dtype)
+        uniq, first = numpy.unique(pair_origs, return_index=True)
+        orig_demand[uniq] = numpy.add.reduceat(prob, first, axis=0)
+        demand = numpy.zeros((generation.shape[1], prob.shape[1]),
+                             prob.dtype)
+        order = numpy.argsort(pair_dests, kind="stable")
+        uniq, first = numpy.unique(pair_dests[order], return_index=True)
+        demand[uniq] = numpy.add.reduceat(prob[order], first, axis=0)
+        self.attracted_tours[mode][self.bounds] += orig_demand.sum(0)
+        return demand, orig_demand
+
     def calc_prob(self, mode, impedance, orig, dests):
         """Calculate secondary destination probabilites.
         
@@ -0,0 +1,248 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple
+from collections import defaultdict
+import copy
+import io
+import multiprocessing
+import pickle
+import numpy # type: ignore
+
+from datahandling.resultdata import ResultsData
+from datatypes.population import TourTable
+from datatypes.tour import Tour
+from demand.sec_dest_pool import SharedArrays, attach, _Spec, _use_shared_memory
+if TYPE_CHECKING:
+    from datatypes.population import Population
+    from datatypes.purpose import TourPurpose
+
+
+# Out-of-band pickle buffers need protocol 5 (Python 3.8 onwards)
+_use_out_of_band = _use_shared_memory and pickle.HIGHEST_PROTOCOL >= 5
+# Alignment of arrays in shared state buffer (bytes)
+ALIGNMENT = 64
+
+# Worker process state, set in `_init_worker`
+_worker: Dict[str, Any] = {}
+
+
+class _StatePickler(pickle.Pickler):
+    def persistent_id(self, obj: Any) -> Any:
+        # Result files are written in main process only
+        return "resultdata" if isinstance(obj, ResultsData) else None
+
+
+class _StateUnpickler(pickle.Unpickler):
+    def persistent_load(self, pid: Any) -> Any:
+        return None
+
+
+def share_state(state: Any, arrays: SharedArrays
+               ) -> Tuple[bytes, List[Tuple[int, int]]]:
+    """Pickle object, with contiguous numpy arrays in shared memory.
+
+    Array data is copied into one shared block "state" in `arrays`.
+    Without out-of-band pickling (Python < 3.8), everything is pickled.
+    Result writers are replaced with None.
+
+    Parameters
+    ----------
+    state : Any
+        Object to be pickled
+    arrays : SharedArrays
+        Container where shared block is created
+
+    Returns
+    -------
+    bytes
+        Pickled object without array data
+    list of tuple
+        (start, stop) positions of arrays in shared block
+    """
+    file = io.BytesIO()
+    if not _use_out_of_band:
+        _StatePickler(file, pickle.HIGHEST_PROTOCOL).dump(state)
+        return file.getvalue(), []
+    buffers: List[pickle.PickleBuffer] = []
+    _StatePickler(file, 5, buffer_callback=buffers.append).dump(state)
+    data = file.getvalue()
+    views = [buf.raw() for buf in buffers]
+    positions = []
+    start = 0
+    for view in views:
+        positions.append((start, start + view.nbytes))
+        start += -(-view.nbytes // ALIGNMENT) * ALIGNMENT
+    shared = arrays.zeros("state", (start,), numpy.uint8)
+    for view, (start, stop) in zip(views, positions):
+        shared[start:stop] = numpy.frombuffer(view, numpy.uint8)
+    return data, positions
+
+
+def load_state(data: bytes,
+               positions: List[Tuple[int, int]],
+               arrays: Dict[str, numpy.ndarray]) -> Any:
+    """Unpickle object pickled with `share_state`.
+
+    Arrays are read-only views to shared memory,
+    so they must not be modified in place.
+    """
+    file = io.BytesIO(data)
+    if not positions:
+        return _StateUnpickler(file).load()
+    shared = arrays["state"].data.toreadonly()
+    return _StateUnpickler(
+        file, buffers=[shared[start:stop] for start, stop in positions]
+    ).load()
+
+
+def _init_worker(data: bytes,
+                 positions: List[Tuple[int, int]],
+                 specs: Dict[str, _Spec]):
+    blocks, arrays = attach(specs)
+    population, purposes, tour_probs = load_state(data, positions, arrays)
+    sec_dest_purpose = purposes["hoo"]
+    _worker["blocks"] = blocks
+    _worker["population"] = population
+    _worker["purposes"] = purposes
+    _worker["tour_probs"] = tour_probs
+    _worker["nr_sec_dest_origs"] = len(sec_dest_purpose.zone_numbers)
+    _worker["sec_dest_modes"] = sec_dest_purpose.modes
+
+
+def _simulate_block(persons: slice
+                   ) -> Tuple[slice, numpy.ndarray, Dict[str, numpy.ndarray],
+                              Dict[str, Dict[str, Tuple[numpy.ndarray, ...]]],
+                              Dict[str, numpy.ndarray]]:
+    population = _worker["population"].subset(persons)
+    purposes = _worker["purposes"]
+    tours = population.tours
+    population.decide_car_use()
+    tours.generate(purposes, _worker["tour_probs"])
+    # Each block starts from zero sums, as worker is reused for several blocks
+    purpose_idx = numpy.unique(tours.purpose)
+    for i in purpose_idx:
+        tours.purposes[i].init_sums()
+    sec_dest_tours: Dict[str, List[Dict[int, List[Tour]]]] = {
+        mode: [defaultdict(list) for _ in range(_worker["nr_sec_dest_origs"])]
+        for mode in _worker["sec_dest_modes"]}
+    tours.choose_modes_and_destinations(sec_dest_tours)
+    sums: Dict[str, Dict[str, Tuple[numpy.ndarray, ...]]] = {}
+    for i in purpose_idx:
+        purpose = tours.purposes[i]
+        sums[purpose.name] = {mode: (
+                purpose.generated_tours[mode],
+                purpose.attracted_tours[mode],
+                purpose.histograms[mode].histogram.values,
+                purpose.aggregates[mode].matrix.values,
+                purpose.own_zone_aggregates[mode].array.values)
+            for mode in purpose.modes}
+    # Secondary destination tours as (tour, origin, destination) rows
+    sec_dests: Dict[str, numpy.ndarray] = {}
+    for mode, origs in sec_dest_tours.items():
+        rows = [(tour.id, orig, dest)
+            for orig, dests in enumerate(origs)
+            for dest, dest_tours in dests.items()
+            for tour in dest_tours]
+        sec_dests[mode] = numpy.array(rows, numpy.int64).reshape(-1, 3)
+    return persons, population.is_car_user, tours.get_columns(), sums, sec_dests
+
+
+class AgentPool:
+    """Process pool for agent car use, tour generation and primary choices.
+
+    Population is partitioned into blocks of home zones. Population,
+    tour purposes and tour probabilities are pickled once for each
+    worker process, with their arrays placed in shared memory
+    (only on Python 3.8 onwards, otherwise they are pickled as well),
+    so that workers can be spawned as well as forked.
+    As random draws are keyed by person and tour, the result does not
+    depend on the partitioning. Use as context manager, so that
+    processes and shared memory are released afterwards.
+
+    Parameters
+    ----------
+    population : datatypes.population.Population
+        Population with car use and tour combination models ready
+    purposes : dict
+        key : str
+            Tour purpose name (hw/ho/...)
+        value : datatypes.purpose.TourPurpose
+            The tour purpose object, with probabilities calculated
+    tour_probs : dict
+        Age (age_7-17/...) : list
+            Is car user (False/True) : numpy.array
+                Matrix with cumulative tour combination probabilities
+                for all zones
+    nr_processes : int
+        Number of worker processes
+    """
+
+    def __init__(self,
+                 population: Population,
+                 purposes: Dict[str, TourPurpose],
+                 tour_probs: Dict[str, List[numpy.ndarray]],
+                 nr_processes: int):
+        self.population = population
+        self.purposes = purposes
+        self.nr_processes = nr_processes
+        self._arrays = SharedArrays()
+        try:
+            # Tours are not passed, as workers generate their own
+            shared = copy.copy(population)
+            shared.tours = TourTable(shared)
+            data, positions = share_state(
+                (shared, purposes, tour_probs), self._arrays)
+            self._pool = multiprocessing.Pool(
+                nr_processes, _init_worker,
+                (data, positions, self._arrays.specs))
+        except Exception:
+            self._arrays.close()
+            raise
+
+    def __enter__(self) -> AgentPool:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Stop worker processes and release shared memory."""
+        self._pool.close()
+        self._pool.join()
+        self._arrays.close()
+
+    def simulate(self, sec_dest_tours: Dict[str, List[Dict[int, List[Tour]]]]):
+        """Decide car use, tours, modes and destinations for population.
+
+        Results are merged into population and its tour table,
+        and tour sums are added to tour purposes.
+
+        Parameters
+        ----------
+        sec_dest_tours : dict
+            Mode (car/transit/bike/walk) : list
+                Origin (relative to secondary destination bounds) : dict
+                    Destination (relative) : list
+                        Tours that get a secondary destination
+        """
+        population = self.population
+        blocks = population.zone_blocks(self.nr_processes)
+        results = self._pool.map(_simulate_block, blocks)
+        parts = []
+        for persons, is_car_user, columns, sums, _ in results:
+            population.is_car_user[persons] = is_car_user
+            parts.append((persons.start, columns))
+            for name, mode_sums in sums.items():
+                purpose = self.purposes[name]
+                for mode, (gen, attr, hist, agg, own) in mode_sums.items():
+                    purpose.generated_tours[mode] += gen
+                    purpose.attracted_tours[mode] += attr
+                    purpose.histograms[mode].histogram += hist
+                    purpose.aggregates[mode].matrix += agg
+                    purpose.own_zone_aggregates[mode].array += own
+        tours = population.tours
+        first_rows = tours.merge(self.purposes, parts)
+        for first_row, (_, _, _, _, sec_dests) in zip(first_rows, results):
+            for mode, rows in sec_dests.items():
+                for i, orig, dest in rows.tolist():
+                    sec_dest_tours[mode][orig][dest].append(
+                        Tour(tours, first_row + i))
@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any, Dict, Tuple
 import pandas
 import numpy # type: ignore
 if TYPE_CHECKING:
@@ -29,7 +29,7 @@ class ExternalModel:
                  zone_data: ZoneData, 
                  zone_numbers: numpy.array):
         self.base_demand = base_demand
-        self.all_zone_numbers = zone_numbers
+        self.all_zone_numbers: numpy.ndarray = numpy.array(zone_numbers)
         self.growth = zone_data.externalgrowth
         spec = {
             "name": "external",
@@ -38,6 +38,8 @@ class ExternalModel:
             "area": "external",
         }
         self.purpose = Purpose(spec, zone_data)
+        # Zone to base matrix row mapping for each set of base matrix rows
+        self._zone_rows: Dict[Tuple[Any, ...], Tuple[numpy.ndarray, numpy.ndarray]] = {}
 
     def calc_external(self, mode: str, internal_trips: pandas.Series) -> Demand:
         """Calculate external traffic.
@@ -55,20 +57,58 @@ class ExternalModel:
             Matrix of whole day trips from external to internal zones
         """
         base_mtx = self.base_demand.get_external(mode)
-        mtx = pandas.DataFrame(0, self.all_zone_numbers, self.growth.index)
-        municipalities = ZoneIntervals("municipalities")
+        targets = tuple(base_mtx.index)
+        try:
+            zone_rows, is_municipality = self._zone_rows[targets]
+        except KeyError:
+            zone_rows, is_municipality = self._map_zones(targets)
+            self._zone_rows[targets] = (zone_rows, is_municipality)
         # Base matrix is aggregated to municipality level,
-        # so we need to disaggregate it
-        for target, base_vector in base_mtx.iterrows():
+        # so we need to disaggregate it with weights from internal trips
+        is_mapped = zone_rows >= 0
+        rows = zone_rows[is_mapped]
+        weights = numpy.ones(rows.size)
+        in_municipality = is_municipality[rows]
+        zone_trips = internal_trips.reindex(
+            self.all_zone_numbers[is_mapped], fill_value=0).to_numpy()
+        zone_trips = zone_trips[in_municipality]
+        municipality_rows = rows[in_municipality]
+        trip_sums = numpy.bincount(municipality_rows, zone_trips, len(targets))
+        weights[in_municipality] = zone_trips / trip_sums[municipality_rows]
+        # Disaggregate base matrix to zone level and 
+        # multiply by growth factors
+        mtx = numpy.zeros((self.all_zone_numbers.size, self.growth.index.size))
+        mtx[is_mapped] = (self.growth[mode].to_numpy()
+                          * weights[:, numpy.newaxis]
+                          * base_mtx.to_numpy()[rows])
+        return Demand(self.purpose, mode, mtx.T)
+
+    def _map_zones(self, targets: Tuple[Any, ...]
+                  ) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """Map zones to rows of aggregated base matrix.
+
+        Parameters
+        ----------
+        targets : tuple
+            Row labels (municipality names or external zone numbers)
+            of aggregated base matrix
+
+        Returns
+        -------
+        numpy.ndarray
+            Base matrix row for each zone (-1 if none)
+        numpy.ndarray
+            Whether each base matrix row is a municipality
+        """
+        municipalities = ZoneIntervals("municipalities")
+        zone_numbers = pandas.Index(self.all_zone_numbers)
+        zone_rows = numpy.full(zone_numbers.size, -1)
+        is_municipality = numpy.zeros(len(targets), bool)
+        for row, target in enumerate(targets):
             if target in municipalities:
                 i = municipalities[target]
-                zone_trips = internal_trips.loc[i].to_numpy()
-                zone_weights = zone_trips / zone_trips.sum()
-                # Disaggregate base matrix to zone level and 
-                # multiply by growth factors
-                mtx.loc[i] = (self.growth[mode].to_numpy()
-                              * zone_weights[:, numpy.newaxis]
-                              * base_vector.to_numpy())
+                zone_rows[zone_numbers.slice_indexer(i.start, i.stop)] = row
+                is_municipality[row] = True
             else:  # External-external trips
-                mtx.loc[int(target)] = self.growth[mode] * base_vector.to_numpy()
-        return Demand(self.purpose, mode, mtx.to_numpy().T)
+                zone_rows[zone_numbers.get_loc(int(target))] = row
+        return zone_rows, is_municipality
@@ -1,5 +1,6 @@
 from __future__ import annotations
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Dict, Tuple
+import hashlib
 import numpy # type: ignore
 import pandas
 if TYPE_CHECKING:
@@ -8,13 +9,22 @@ if TYPE_CHECKING:
 
 import parameters.tour_generation as param
 from utils.freight import fratar, calibrate
+from utils.memory import float_dtype
 from datatypes.demand import Demand
 from datatypes.purpose import Purpose
 
 
+# Freight demand of latest calculation of each mode, with hash of input data
+_cache: Dict[str, Tuple[str, numpy.ndarray]] = {}
+
+
 class FreightModel:
     """Freight traffic model.
 
+    Demand is cached, so that a new model with the same input data
+    (e.g., a new model system for the same scenario) does not need to
+    calculate it again.
+
     Parameters
     ----------
     zone_data_base : datahandling.zonedata.ZoneData
@@ -55,44 +65,64 @@ class FreightModel:
         """
         zone_data_base = self.zdata_b.get_freight_data()
         zone_data_forecast = self.zdata_f.get_freight_data()
+        zone_numbers = self.zdata_b.zone_numbers
+        with self.base_demand.open("freight", "vrk", list(zone_numbers)) as mtx:
+            base_mtx = mtx[mode]
+        key = self._cache_key(
+            mode, zone_data_base, zone_data_forecast, base_mtx)
+        try:
+            cache_key, demand = _cache[mode]
+        except KeyError:
+            cache_key = None
+        if cache_key != key:
+            demand = self._calc_freight_traffic(
+                mode, zone_data_base, zone_data_forecast, base_mtx)
+            _cache[mode] = (key, demand)
+        return Demand(self.purpose, mode, demand.copy())
+
+    def _calc_freight_traffic(self,
+                              mode: str,
+                              zone_data_base: pandas.DataFrame,
+                              zone_data_forecast: pandas.DataFrame,
+                              base_mtx: numpy.ndarray) -> numpy.ndarray:
         production_base: numpy.ndarray = self._generate_trips(zone_data_base, mode)
         production_forecast: numpy.ndarray = self._generate_trips(zone_data_forecast, mode)
         zone_numbers = self.zdata_b.zone_numbers
-        with self.base_demand.open("freight", "vrk", list(zone_numbers)) as mtx:
-            # Remove zero values
-            base_mtx = mtx[mode].clip(0.000001, None)
+        # Remove zero values
+        mtx = base_mtx.clip(0.000001, None)
         production = calibrate(
-            base_mtx.sum(1), production_base, production_forecast)
-        mtx = pandas.DataFrame(base_mtx, zone_numbers, zone_numbers)
-        prod = pandas.Series(production, zone_numbers)
+            mtx.sum(1), production_base, production_forecast)
+        prod = numpy.asarray(production)
 
         # If forecast>5*base, destination choice is replaced by area average
         # For simplicity, areas are zone numbers in the same thousand
         threshold = param.vector_calibration_threshold
-        cond = production_forecast < threshold*production_base
+        is_replaced = numpy.asarray(
+            production_forecast >= threshold*production_base)
         last1000 = zone_numbers[-1] // 1000
-        for i in range(0, last1000):
-            l = i * 1000
-            u = l + 999
+        # Index bounds of each thousand
+        bounds = zone_numbers.searchsorted(numpy.arange(last1000 + 1) * 1000)
+        # Blocks are handled in order, as the destination choice vector
+        # of a block depends on columns replaced in previous blocks
+        for l, u in zip(bounds[:-1], bounds[1:]):
+            if l == u:
+                continue
             # sum1000 is a vector with the same length as one side of mtx,
             # where production for the whole thousand is summed
-            sum1000 = mtx.loc[l:u].sum().to_numpy()
+            sum1000 = mtx[l:u].sum(0)
             scaling = 1 / max(sum1000.sum(), 1)
-            # ave1 and ave2 are scaled down so the vector sum is 1
-            ave1 = sum1000 * scaling
-            ave2 = ave1[:, numpy.newaxis]
-            cond1 = cond.loc[l:u].to_numpy()
-            cond2 = cond1[:, numpy.newaxis]
-            prod1 = prod.loc[l:u].to_numpy()
-            prod2 = prod1[:, numpy.newaxis]
+            # ave is scaled down so the vector sum is 1
+            ave = sum1000 * scaling
             # Where condition is not met, mtx rows and cols are replaced by
-            # destination choice vector ave1/ave2 multiplied by production
+            # destination choice vector ave multiplied by production
             # factor for that zone
-            mtx.loc[l:u] = numpy.where(cond2, mtx.loc[l:u], ave1*prod2)
-            mtx.loc[:, l:u] = numpy.where(cond1, mtx.loc[:, l:u], ave2*prod1)
+            rows = l + numpy.flatnonzero(is_replaced[l:u])
+            mtx[rows, :] = ave * prod[rows, numpy.newaxis]
+            mtx[:, rows] = ave[:, numpy.newaxis] * prod[rows]
 
         # Matrix balancing
-        demand = fratar(production, mtx)
+        demand = fratar(
+            production, pandas.DataFrame(mtx, zone_numbers, zone_numbers))
         # Add garbage transport to/from garbage zone
         if mode == "truck":
             b = param.garbage_generation
@@ -104,7 +134,26 @@ class FreightModel:
         if mode == "trailer_truck":
             demand[self.zdata_f.trailers_prohibited] = 0
             demand.loc[self.zdata_f.trailers_prohibited] = 0
-        return Demand(self.purpose, mode, demand.values)
+        return demand.values
+
+    def _cache_key(self,
+                   mode: str,
+                   zone_data_base: pandas.DataFrame,
+                   zone_data_forecast: pandas.DataFrame,
+                   base_mtx: numpy.ndarray) -> str:
+        """Get hash of all input data of freight calculation."""
+        h = hashlib.sha256(repr((
+                mode, param.tour_generation[mode], param.garbage_generation,
+                param.vector_calibration_threshold, param.freight_balancing,
+                self.zdata_f.garbage_destination,
+                self.zdata_f.trailers_prohibited,
+                str(float_dtype()),
+            )).encode())
+        for data in (zone_data_base, zone_data_forecast):
+            h.update(data.index.values.tobytes())
+            h.update(numpy.ascontiguousarray(data.values).tobytes())
+        h.update(numpy.ascontiguousarray(base_mtx).tobytes())
+        return h.hexdigest()
 
     def _generate_trips(self, 
                         zone_data: pandas.DataFrame, 
@@ -0,0 +1,290 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple, cast
+import multiprocessing
+from multiprocessing.sharedctypes import RawArray
+import numpy # type: ignore
+try:
+    # Available from Python 3.8 onwards
+    from multiprocessing import shared_memory
+    _use_shared_memory = True
+except ImportError:
+    _use_shared_memory = False
+
+from datatypes.demand import Demand
+from datatypes.purpose import SecDestPurpose
+from utils.memory import float_dtype
+if TYPE_CHECKING:
+    from multiprocessing.shared_memory import SharedMemory
+    from models.logit import SecDestModel
+
+
+# Shared memory block name, or ctypes array if shared_memory is not available
+_Spec = Tuple[Any, Tuple[int, ...], str]
+
+
+class SharedArrays:
+    """Container for numpy arrays placed in shared memory blocks.
+
+    Arrays are passed to worker processes as block names, shapes and
+    dtypes, so that the data itself is never pickled.
+    If `multiprocessing.shared_memory` is not available (Python < 3.8),
+    ctypes arrays are used instead. These are passed to workers when
+    the processes are started.
+    """
+
+    def __init__(self):
+        self._blocks: List[SharedMemory] = []
+        self.specs: Dict[str, _Spec] = {}
+
+    def zeros(self,
+              key: str,
+              shape: Tuple[int, ...],
+              dtype: Any) -> numpy.ndarray:
+        """Create new zero-filled shared array.
+
+        Parameters
+        ----------
+        key : str
+            Name of the array in `specs`
+        shape : tuple of int
+            Shape of the array
+        dtype : numpy.dtype or str
+            Data type of the array
+
+        Returns
+        -------
+        numpy.ndarray
+            Array view to shared memory block
+        """
+        dtype = numpy.dtype(dtype)
+        nbytes = max(int(numpy.prod(shape)) * dtype.itemsize, 1)
+        if _use_shared_memory:
+            shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            self._blocks.append(shm)
+            name: Any = shm.name
+            buf: Any = shm.buf
+        else:
+            name = buf = RawArray("b", nbytes)
+        shared: numpy.ndarray = numpy.ndarray(shape, dtype, buffer=buf)
+        shared.fill(0)
+        self.specs[key] = (name, shape, dtype.str)
+        return shared
+
+    def add(self, key: str, array: Any) -> numpy.ndarray:
+        """Copy array to new shared memory block.
+
+        Parameters
+        ----------
+        key : str
+            Name of the array in `specs`
+        array : numpy.ndarray
+            Array to be copied
+
+        Returns
+        -------
+        numpy.ndarray
+            Array view to shared memory block
+        """
+        array = numpy.asarray(array)
+        shared = self.zeros(key, array.shape, array.dtype)
+        shared[...] = array
+        return shared
+
+    def close(self):
+        """Release and remove all shared memory blocks."""
+        for shm in self._blocks:
+            shm.close()
+            shm.unlink()
+        self._blocks = []
+        self.specs = {}
+
+
+def attach(specs: Dict[str, _Spec]
+          ) -> Tuple[List[SharedMemory], Dict[str, numpy.ndarray]]:
+    """Get views to shared memory arrays created in other process."""
+    blocks: List[SharedMemory] = []
+    arrays: Dict[str, numpy.ndarray] = {}
+    for key, (name, shape, dtype) in specs.items():
+        if isinstance(name, str):
+            shm = shared_memory.SharedMemory(name=name)
+            blocks.append(shm)
+            buf: Any = shm.buf
+        else:
+            buf = name
+        arrays[key] = numpy.ndarray(shape, dtype, buffer=buf)
+    return blocks, arrays
+
+
+class SharedZoneData:
+    """Zone data for secondary destination choice in worker process.
+
+    Only the data needed by `SecDestModel` is included,
+    already sliced for purpose zones.
+
+    Parameters
+    ----------
+    arrays : dict
+        key : str
+            "all_zone_numbers", "zone_numbers" or "zone_<data name>"
+        value : numpy.ndarray
+    """
+
+    def __init__(self, arrays: Dict[str, numpy.ndarray]):
+        self.all_zone_numbers = arrays["all_zone_numbers"]
+        self.zone_numbers = arrays["zone_numbers"]
+        self.nr_zones = len(self.zone_numbers)
+        self._values = {key[5:]: arrays[key] for key in arrays
+            if key.startswith("zone_") and key != "zone_numbers"}
+
+    def get_data(self, key: str, bounds: slice, generation: bool = False):
+        return self._values[key]
+
+
+# Worker process state, set in `_init_worker`
+_worker: Dict[str, Any] = {}
+
+
+def _init_worker(specification: Dict[str, Any],
+                 mode: str,
+                 specs: Dict[str, _Spec],
+                 slots: Any):
+    blocks, arrays = attach(specs)
+    purpose = SecDestPurpose(specification, SharedZoneData(arrays), None)
+    purpose.tours = {mode: arrays["tours"]}
+    _worker["blocks"] = blocks
+    _worker["arrays"] = arrays
+    _worker["slots"] = slots
+    _worker["purpose"] = purpose
+    _worker["mode"] = mode
+    _worker["impedance"] = {key[4:]: arrays[key] for key in arrays
+        if key.startswith("imp_")}
+
+
+def _distribute_block(origs: slice):
+    # Output slot is held only for the duration of one task,
+    # so slots are not lost if the pool replaces a worker
+    slots = _worker["slots"]
+    slot = slots.get()
+    try:
+        arrays = _worker["arrays"]
+        purpose = _worker["purpose"]
+        mode = _worker["mode"]
+        purpose.attracted_tours = {
+            mode: arrays["attracted_{}".format(slot)]}
+        demand, orig_demand = purpose.calc_batch_demand(
+            mode, _worker["impedance"], origs)
+        arrays["demand_{}".format(slot)] += demand
+    finally:
+        slots.put(slot)
+    # Blocks do not overlap, so origin rows can be written directly
+    arrays["orig_demand"][origs] = orig_demand
+
+
+class SecDestPool:
+    """Process pool for secondary destination choice.
+
+    Impedance matrices, source tours and zone data are placed in
+    shared memory, from which the worker processes read them.
+    Each task sums its demand into a shared output buffer that no other
+    task uses at the same time, so nothing but block bounds is passed
+    through the pool.
+    Use as context manager, so that processes and shared memory
+    are released afterwards. The buffers are summed when the pool
+    is closed, and the result is set in `demand` and `orig_demand`.
+
+    Parameters
+    ----------
+    purpose : SecDestPurpose
+        Secondary destination purpose with tours generated
+    mode : str
+        Mode (car/transit/bike)
+    impedance : dict
+        Type (time/cost/dist) : numpy 2d matrix
+    nr_processes : int
+        Number of worker processes
+    """
+
+    def __init__(self,
+                 purpose: SecDestPurpose,
+                 mode: str,
+                 impedance: Dict[str, numpy.ndarray],
+                 nr_processes: int):
+        self.purpose = purpose
+        self.mode = mode
+        self.demand: Optional[Demand] = None
+        self.orig_demand: Optional[Demand] = None
+        self._arrays = SharedArrays()
+        try:
+            self._tours = self._arrays.add("tours", purpose.tours[mode])
+            for mtx_type in impedance:
+                self._arrays.add("imp_" + mtx_type, impedance[mtx_type])
+            zone_data = purpose.zone_data
+            self._arrays.add("all_zone_numbers", zone_data.all_zone_numbers)
+            self._arrays.add("zone_numbers", zone_data.zone_numbers)
+            model = cast("SecDestModel", purpose.model)
+            b = model.dest_choice_param[mode]
+            for key in list(b["attraction"]) + list(b["size"]):
+                self._arrays.add("zone_" + key, zone_data.get_data(
+                    key, purpose.bounds, generation=True))
+            nr_zones = purpose.bounds.stop - purpose.bounds.start
+            self._orig_demand = self._arrays.zeros(
+                "orig_demand", (self._tours.shape[0], nr_zones),
+                float_dtype())
+            self._demand = []
+            self._attracted = []
+            slots: Any = multiprocessing.Queue()
+            for i in range(nr_processes):
+                self._demand.append(self._arrays.zeros(
+                    "demand_{}".format(i), (nr_zones, nr_zones),
+                    float_dtype()))
+                self._attracted.append(self._arrays.zeros(
+                    "attracted_{}".format(i),
+                    (len(zone_data.zone_numbers),), float))
+                slots.put(i)
+            specification = {
+                "name": purpose.name,
+                "orig": purpose.orig,
+                "dest": purpose.dest,
+                "area": purpose.area,
+            }
+            self._pool = multiprocessing.Pool(
+                nr_processes, _init_worker,
+                (specification, mode, self._arrays.specs, slots))
+        except Exception:
+            self._arrays.close()
+            raise
+
+    def __enter__(self) -> SecDestPool:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Stop worker processes, sum results and release shared memory."""
+        self._pool.close()
+        self._pool.join()
+        purpose = self.purpose
+        mode = self.mode
+        # Tours are thresholded in place, as in single-process calculation
+        purpose.tours[mode][...] = self._tours
+        purpose.attracted_tours[mode] += sum(self._attracted)
+        self.demand = Demand(purpose, mode, sum(self._demand))
+        self.orig_demand = Demand(
+            purpose, mode, self._orig_demand.copy(), 0)
+        del self._tours, self._demand, self._orig_demand, self._attracted
+        self._arrays.close()
+
+    def distribute(self, blocks: Iterable[slice]):
+        """Decide the secondary destinations for blocks of origins.
+
+        Results are available in `demand` and `orig_demand`
+        after the pool is closed.
+
+        Parameters
+        ----------
+        blocks : iterable of slice
+            The relative zone indices of origin blocks
+        """
+        for _ in self._pool.imap_unordered(_distribute_block, blocks):
+            pass
@@ -1,14 +1,15 @@
 from __future__ import annotations
-from typing import TYPE_CHECKING, Dict, Tuple, Union, cast
+from typing import TYPE_CHECKING, Dict, Optional, Tuple, Union, cast
 import numpy # type: ignore
 import pandas
 if TYPE_CHECKING:
     from datahandling.resultdata import ResultsData
     from datahandling.zonedata import ZoneData
     from datatypes.purpose import Purpose
-from datatypes.person import Person
+from datatypes.population import Population
 
 import utils.log as log
+from utils.counter_rng import CounterRNG
 import parameters.zone as param
 from datatypes.purpose import TourPurpose, SecDestPurpose
 from models import car_use, linear, tour_combinations
@@ -98,15 +99,27 @@ class DemandModel:
                 "no_car": (1-car_share) * age_pop,
             }
 
-    def create_population(self):
+    def create_population(self, seed: Optional[int] = None):
         """Create population for agent-based simulation.
 
-        Store list of `Person` instances in `self.population`.
+        Store `Population` in `self.population`.
+        Age groups are drawn in bulk for each zone,
+        other person attributes for the whole population.
+        Inhabitant i of zone z always gets the same draws,
+        regardless of the other zones.
+
+        Parameters
+        ----------
+        seed : int (optional)
+            Seed for population draws, by default `population_draw`
+            from zone parameters
         """
-        numpy.random.seed(param.population_draw)
-        self.population = []
+        rng = CounterRNG(param.population_draw if seed is None else seed)
         zone_numbers = self.zone_data.zone_numbers[self.bounds]
         self.zone_population = pandas.Series(0, zone_numbers)
+        zone_indices = []
+        age_groups = []
+        inhabitants = []
         # Group -1 is under-7-year-olds
         age_range = numpy.arange(-1, len(param.age_groups))
         for zone_number in zone_numbers:
@@ -121,21 +134,26 @@ class DemandModel:
                     log.error(msg)
                     raise ValueError(msg)
                 else:
-                    weights = numpy.array(weights)
                     rebalance = 1 / sum(weights)
-                    weights = rebalance * weights
+                    weights = list(rebalance * numpy.array(weights))
             zone_pop = int(round(self.zone_data["population"][zone_number]
                                  * param.agent_demand_fraction))
-            zone = self.zone_data.zones[zone_number]
-            incmod = self._income_models[zone.municipality == "Helsinki"]
-            for _ in range(zone_pop):
-                i = numpy.random.choice(a=age_range, p=weights)
-                if i != -1:
-                    self.population.append(Person(
-                        zone, param.age_groups[i], self.tour_generation_model,
-                        self.car_use_model, incmod))
-                    self.zone_population[zone_number] += 1
-        numpy.random.seed(None)
+            inhabitant = numpy.arange(zone_pop)
+            draws = rng.uniform("age_group", zone_number, inhabitant)
+            groups = age_range[numpy.searchsorted(
+                numpy.cumsum(weights), draws, "right").clip(
+                    max=len(age_range)-1)]
+            is_over_7 = groups != -1
+            zone_indices.append(numpy.full(
+                is_over_7.sum(), self.zone_data.zone_index(zone_number)))
+            age_groups.append(groups[is_over_7])
+            inhabitants.append(inhabitant[is_over_7])
+            self.zone_population[zone_number] = is_over_7.sum()
+        self.population = Population(
+            self.zone_data, param.age_groups,
+            numpy.concatenate(zone_indices), numpy.concatenate(age_groups),
+            numpy.concatenate(inhabitants), self.tour_generation_model,
+            self.car_use_model, self._income_models, rng)
 
     def predict_income(self):
         for model in self._income_models:
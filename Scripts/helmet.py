@@ -9,6 +9,7 @@ from assignment.emme_assignment import EmmeAssignmentModel
 from assignment.mock_assignment import MockAssignmentModel
 from modelsystem import ModelSystem, AgentModelSystem
 from datahandling.matrixdata import MatrixData
+import parameters.zone as zone_param
 
 
 def main(args):
@@ -72,6 +73,8 @@ def main(args):
             separate_emme_scenarios=args.separate_emme_scenarios,
             save_matrices=args.save_matrices,
             first_matrix_id=args.first_matrix_id)
+    if args.zone_data_cache_dir is not None:
+        zone_param.zone_data_cache_dir = args.zone_data_cache_dir
     # Initialize model system (wrapping Assignment-model,
     # and providing demand calculations as Python modules)
     # Read input matrices (.omx) and zonedata (.csv)
@@ -79,11 +82,13 @@ def main(args):
     if args.is_agent_model:
         model = AgentModelSystem(
             forecast_zonedata_path, base_zonedata_path, base_matrices_path,
-            results_path, ass_model, args.scenario_name)
+            results_path, ass_model, args.scenario_name,
+            args.sec_dest_backend, args.result_format, args.validation)
     else:
         model = ModelSystem(
             forecast_zonedata_path, base_zonedata_path, base_matrices_path,
-            results_path, ass_model, args.scenario_name)
+            results_path, ass_model, args.scenario_name,
+            args.sec_dest_backend, args.result_format, args.validation)
     log_extra["status"]["results"] = model.mode_share
 
     # Run traffic assignment simulation for N iterations,
@@ -92,10 +97,22 @@ def main(args):
     log.info(
         "Starting simulation with {} iterations...".format(iterations),
         extra=log_extra)
-    impedance = model.assign_base_demand(
-        args.use_fixed_transit_cost, iterations==0)
+    if args.resume is not None:
+        impedance, i = model.resume(
+            args.use_fixed_transit_cost, args.resume or None)
+        log_extra["status"]["completed"] = i
+        # Zero iterations are completed if checkpoint is of another scenario
+        if i > 0:
+            gap = model.convergence.iloc[-1, :]
+            if gap["max_gap"] < args.max_gap or gap["rel_gap"] < args.rel_gap:
+                log_extra["status"]["converged"] = 1
+                iterations = min(iterations, i + 1)
+        i += 1
+    else:
+        impedance = model.assign_base_demand(
+            args.use_fixed_transit_cost, iterations==0)
+        i = 1
     log_extra["status"]["state"] = "running"
-    i = 1
     while i <= iterations:
         log_extra["status"]["current"] = i
         try:
@@ -119,6 +136,8 @@ def main(args):
         #This is here separately because the model can converge in the last iteration as well
         if convergence_criteria_fulfilled: 
             log_extra["status"]["converged"] = 1
+        if i < iterations:
+            model.save_checkpoint(impedance, i)
         i += 1
     
     if not log_extra["status"]["converged"]: log.warn("Model has not converged")
@@ -255,6 +274,43 @@ if __name__ == "__main__":
         action="store_true",
         default=config.USE_FIXED_TRANSIT_COST,
         help="Using this flag activates use of pre-calculated (fixed) transit costs."),
+    parser.add_argument(
+        "--sec-dest-backend",
+        choices={"batch", "processes", "threads"},
+        default=config.SEC_DEST_BACKEND,
+        help="Calculation backend for secondary destination choice (default set in parameters.assignment)."),
+    parser.add_argument(
+        "--resume",
+        type=str,
+        nargs="?",
+        const="",
+        default=None,
+        help="Using this flag continues an interrupted model run from the checkpoint saved after the latest completed iteration. A path to a checkpoint file of another scenario (with same zones) can be given to start from its state."),
+    parser.add_argument(
+        "--result-format",
+        choices={"txt", "parquet", "feather", "hdf5"},
+        default=config.RESULT_FORMAT,
+        help="Format of result tables. Columnar formats (parquet/feather/hdf5) can be converted to txt and xlsx with helmet_export_results.py."),
+    validation = parser.add_mutually_exclusive_group()
+    validation.add_argument(
+        "--strict",
+        dest="validation",
+        action="store_const",
+        const="strict",
+        default=config.VALIDATION,
+        help="Using this flag checks all zone data values (default set in parameters.zone)."),
+    validation.add_argument(
+        "--lenient",
+        dest="validation",
+        action="store_const",
+        const="lenient",
+        default=config.VALIDATION,
+        help="Using this flag skips zone data checks for input files that have already been validated with this flag (recognized by content hash stored in --zone-data-cache-dir)."),
+    parser.add_argument(
+        "--zone-data-cache-dir",
+        type=str,
+        default=config.ZONE_DATA_CACHE_DIR,
+        help="Directory where parsed zone data and digests of validated zone data are stored, required by --lenient (default set in parameters.zone)."),
     args = parser.parse_args()
 
     log.initialize(args)
@@ -0,0 +1,45 @@
+from argparse import ArgumentParser
+import os
+
+import utils.config
+import utils.log as log
+from datahandling.resultdata import export_results
+
+
+def main(args):
+    results_path = os.path.join(args.results_path, args.scenario_name)
+    log.info("Exporting results in {}".format(results_path))
+    export_results(results_path)
+    log.info("Results exported to txt and xlsx files")
+
+
+if __name__ == "__main__":
+    # Initially read defaults from config file ("dev-config.json")
+    # but allow override via command-line arguments
+    config = utils.config.read_from_file()
+    parser = ArgumentParser(
+        epilog="Convert columnar HELMET result files to txt and xlsx.")
+    parser.add_argument(
+        "--log-level",
+        choices={"DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"},
+        default=config.LOG_LEVEL,
+    )
+    parser.add_argument(
+        "--log-format",
+        choices={"TEXT", "JSON"},
+        default=config.LOG_FORMAT,
+    )
+    parser.add_argument(
+        "--scenario-name",
+        type=str,
+        default=config.SCENARIO_NAME,
+        help="Name of HELMET scenario. Results are found in subfolder of the same name."),
+    parser.add_argument(
+        "--results-path",
+        type=str,
+        default=config.RESULTS_PATH,
+        help="Path to folder where result data is saved to."),
+    args = parser.parse_args()
+
+    log.initialize(args)
+    main(args)
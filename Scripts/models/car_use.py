@@ -7,7 +7,9 @@ if TYPE_CHECKING:
     from datahandling.zonedata import ZoneData
 
 from models.logit import LogitModel
+from models.utility import UtilityKernel
 from parameters.car import car_usage
+from utils.memory import float_dtype
 from utils.zone_interval import ZoneIntervals
 
 
@@ -64,11 +66,11 @@ class CarUseModel(LogitModel):
                 Choice probabilities
         """
         b = self.param
-        utility = numpy.zeros(self.bounds.stop)
-        self._add_constant(utility, b["constant"])
-        self._add_zone_util(utility, b["generation"], True)
-        self.exps = numpy.exp(utility)
-        self._add_log_zone_util(self.exps, b["log"], True)
+        kernel = UtilityKernel(numpy.empty(self.bounds.stop, float_dtype()))
+        self._add_constant(kernel, b["constant"])
+        self._add_zone_util(kernel, b["generation"], True)
+        self._add_log_zone_util(kernel, b["log"], True)
+        self.exps = kernel.evaluate()
         prob = self.exps / (self.exps+1)
         return prob
 
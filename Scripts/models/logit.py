@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple, cast
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple, Union, cast
 import numpy # type: ignore
 import pandas
 import math
@@ -12,6 +12,7 @@ from parameters.destination_choice import destination_choice, distance_boundary
 from parameters.mode_choice import mode_choice
 import parameters.zone as zone_params
 from utils.zone_interval import ZoneIntervals
+from models.utility import UtilityKernel
 
 
 class LogitModel:
@@ -47,37 +48,36 @@ class LogitModel:
             next(iter(impedance["car"].values())))
         for mode in self.mode_choice_param:
             b = self.mode_choice_param[mode]
-            utility = numpy.zeros_like(expsum)
-            self._add_constant(utility, b["constant"])
-            utility = self._add_zone_util(
-                utility.T, b["generation"], generation=True).T
-            self._add_zone_util(utility, b["attraction"])
-            self._add_impedance(utility, impedance[mode], b["impedance"])
-            exps = numpy.exp(utility)
-            self._add_log_impedance(exps, impedance[mode], b["log"])
+            kernel = UtilityKernel(numpy.empty_like(expsum))
+            self._add_constant(kernel, b["constant"])
+            self._add_zone_util(kernel, b["generation"], generation=True)
+            self._add_zone_util(kernel, b["attraction"])
+            self._add_impedance(kernel, impedance[mode], b["impedance"])
+            self._add_log_impedance(kernel, impedance[mode], b["log"])
+            exps = kernel.evaluate()
             self.mode_exps[mode] = exps
             expsum += exps
         return expsum
     
     def _calc_dest_util(self, mode, impedance):
         b = self.dest_choice_param[mode]
-        utility: numpy.array = numpy.zeros_like(next(iter(impedance.values())))
-        self._add_zone_util(utility, b["attraction"])
-        self._add_impedance(utility, impedance, b["impedance"])
-        self.dest_exps[mode] = numpy.exp(utility)
-        size = numpy.zeros_like(utility)
+        template = next(iter(impedance.values()))
+        size = UtilityKernel(numpy.empty_like(template))
         self._add_zone_util(size, b["size"])
-        impedance["size"] = size
+        impedance["size"] = size.evaluate(exponentiate=False)
         if "transform" in b:
             b_transf = b["transform"]
-            transimp = numpy.zeros_like(utility)
+            transimp = UtilityKernel(numpy.empty_like(template))
             self._add_zone_util(transimp, b_transf["attraction"])
             self._add_impedance(transimp, impedance, b_transf["impedance"])
-            impedance["transform"] = transimp
-        self._add_log_impedance(self.dest_exps[mode], impedance, b["log"])
+            impedance["transform"] = transimp.evaluate(exponentiate=False)
+        kernel = UtilityKernel(numpy.empty_like(template))
+        self._add_zone_util(kernel, b["attraction"])
+        self._add_impedance(kernel, impedance, b["impedance"])
+        self._add_log_impedance(kernel, impedance, b["log"])
         if mode != "logsum":
-            threshold = distance_boundary[mode]
-            self.dest_exps[mode][impedance["dist"] > threshold] = 0
+            kernel.set_mask(impedance["dist"], distance_boundary[mode])
+        self.dest_exps[mode] = kernel.evaluate()
         try:
             return self.dest_exps[mode].sum(1)
         except ValueError:
@@ -85,20 +85,48 @@ class LogitModel:
     
     def _calc_sec_dest_util(self, mode, impedance, orig, dest):
         b = self.dest_choice_param[mode]
-        utility = numpy.zeros_like(next(iter(impedance.values())))
-        self._add_sec_zone_util(utility, b["attraction"], orig, dest)
-        self._add_impedance(utility, impedance, b["impedance"])
-        dest_exps = numpy.exp(utility)
-        size = numpy.zeros_like(utility)
+        template = next(iter(impedance.values()))
+        size = UtilityKernel(numpy.empty_like(template))
         self._add_sec_zone_util(size, b["size"])
-        impedance["size"] = size
-        self._add_log_impedance(dest_exps, impedance, b["log"])
+        impedance["size"] = size.evaluate(exponentiate=False)
+        kernel = UtilityKernel(numpy.empty_like(template))
+        self._add_sec_zone_util(kernel, b["attraction"], orig, dest)
+        self._add_impedance(kernel, impedance, b["impedance"])
+        self._add_log_impedance(kernel, impedance, b["log"])
         if mode != "logsum":
-            threshold = distance_boundary[mode]
-            dest_exps[impedance["dist"] > threshold] = 0
-        return dest_exps
+            kernel.set_mask(impedance["dist"], distance_boundary[mode])
+        return kernel.evaluate()
 
-    def _add_constant(self, utility, b):
+    def _coefficient(self, b, ndim):
+        """Get parameter as scalar or as array of row-wise values.
+
+        If parameter b is a tuple of two terms, they will be used for
+        capital region and surrounding region respectively.
+
+        Parameters
+        ----------
+        b : float or tuple
+            The value of the parameter
+        ndim : int
+            Number of dimensions of the utility array
+
+        Returns
+        -------
+        float or ndarray
+            Scalar or array that can be broadcast to utility array
+        """
+        try: # If only one parameter
+            return float(b)
+        except TypeError: # Separate sub-region parameters
+            coeff = numpy.empty(self.sub_bounds[-1].stop)
+            for i, bounds in enumerate(self.sub_bounds):
+                coeff[bounds] = b[i]
+            if ndim == 1: # 1-d array calculation
+                return coeff
+            else: # 2-d matrix calculation
+                return coeff[:, numpy.newaxis]
+
+    def _add_constant(self, kernel, b):
         """Add constant term to utility.
 
         If parameter b is a tuple of two terms, they will be added for
@@ -106,21 +134,14 @@ class LogitModel:
         
         Parameters
         ----------
-        utility : ndarray
-            Numpy array to which the constant b will be added
+        kernel : UtilityKernel
+            Utility expression to which the constant b will be added
         b : float or tuple
             The value of the constant
         """
-        try: # If only one parameter
-            utility += b
-        except ValueError: # Separate sub-region parameters
-            for i, bounds in enumerate(self.sub_bounds):
-                if utility.ndim == 1: # 1-d array calculation
-                    utility[bounds] += b[i]
-                else: # 2-d matrix calculation
-                    utility[bounds, :] += b[i]
+        kernel.add_linear(self._coefficient(b, kernel.ndim))
     
-    def _add_impedance(self, utility, impedance, b):
+    def _add_impedance(self, kernel, impedance, b):
         """Adds simple linear impedances to utility.
 
         If parameter in b is tuple of two terms, they will be added for
@@ -128,8 +149,8 @@ class LogitModel:
         
         Parameters
         ----------
-        utility : ndarray
-            Numpy array to which the impedances will be added
+        kernel : UtilityKernel
+            Utility expression to which the impedances will be added
         impedance : dict
             A dictionary of time-averaged impedance matrices. Includes keys
             `time`, `cost`, and `dist` of which values are all ndarrays.
@@ -137,14 +158,11 @@ class LogitModel:
             The parameters for different impedance matrices.
         """
         for i in b:
-            try: # If only one parameter
-                utility += b[i] * impedance[i]
-            except ValueError: # Separate sub-region parameters
-                for j, bounds in enumerate(self.sub_bounds):
-                    utility[bounds, :] += b[i][j] * impedance[i][bounds, :]
-        return utility
+            kernel.add_linear(
+                self._coefficient(b[i], kernel.ndim), impedance[i])
+        return kernel
 
-    def _add_log_impedance(self, exps, impedance, b):
+    def _add_log_impedance(self, kernel, impedance, b):
         """Adds log transformations of impedance to utility.
         
         This is an optimized way of calculating log terms. Calculates
@@ -157,8 +175,8 @@ class LogitModel:
 
         Parameters
         ----------
-        exps : ndarray
-            Numpy array to which the impedances will be multiplied
+        kernel : UtilityKernel
+            Utility expression to which the impedances will be multiplied
         impedance : dict
             A dictionary of time-averaged impedance matrices. Includes keys
             `time`, `cost`, and `dist` of which values are all ndarrays.
@@ -166,15 +184,11 @@ class LogitModel:
             The parameters for different impedance matrices
         """
         for i in b:
-            try: # If only one parameter
-                exps *= numpy.power(impedance[i] + 1, b[i])
-            except ValueError: # Separate sub-region parameters
-                for j, bounds in enumerate(self.sub_bounds):
-                    exps[bounds, :] *= numpy.power(
-                        impedance[i][bounds, :] + 1, b[i][j])
-        return exps
+            kernel.add_power(
+                self._coefficient(b[i], kernel.ndim), impedance[i])
+        return kernel
     
-    def _add_zone_util(self, utility, b, generation=False):
+    def _add_zone_util(self, kernel, b, generation=False):
         """Adds simple linear zone terms to utility.
 
         If parameter in b is tuple of two terms, they will be added for
@@ -182,8 +196,8 @@ class LogitModel:
         
         Parameters
         ----------
-        utility : ndarray
-            Numpy array to which the impedances will be added
+        kernel : UtilityKernel
+            Utility expression to which the zone terms will be added
         b : dict
             The parameters for different zone data.
         generation : bool
@@ -193,28 +207,34 @@ class LogitModel:
         """
         zdata = self.zone_data
         for i in b:
-            try: # If only one parameter
-                utility += b[i] * zdata.get_data(i, self.bounds, generation)
-            except ValueError: # Separate sub-region parameters
-                for j, bounds in enumerate(self.sub_bounds):
-                    data = zdata.get_data(i, bounds, generation)
-                    if utility.ndim == 1: # 1-d array calculation
-                        utility[bounds] += b[i][j] * data
-                    else: # 2-d matrix calculation
-                        utility[bounds, :] += b[i][j] * data
-        return utility
+            kernel.add_linear(
+                self._coefficient(b[i], kernel.ndim),
+                self._zone_term(zdata.get_data(i, self.bounds, generation),
+                                kernel, generation))
+        return kernel
+
+    def _zone_term(self, data, kernel, generation):
+        """Orient zone data vector along utility rows or columns.
+
+        Generation data applies to origins (rows) and other data
+        to destinations (columns).
+        """
+        if generation and data.ndim == 1 and kernel.ndim == 2:
+            return data[:, numpy.newaxis]
+        else:
+            return data
     
-    def _add_sec_zone_util(self, utility, b, orig=None, dest=None):
+    def _add_sec_zone_util(self, kernel, b, orig=None, dest=None):
         for i in b:
             data = self.zone_data.get_data(i, self.bounds, generation=True)
             try: # If only one parameter
-                utility += b[i] * data
-            except ValueError: # Separate params for orig and dest
-                utility += b[i][0] * data[orig, self.bounds]
-                utility += b[i][1] * data[dest, self.bounds]
-        return utility
+                kernel.add_linear(float(b[i]), data)
+            except TypeError: # Separate params for orig and dest
+                kernel.add_linear(b[i][0], data[orig, self.bounds])
+                kernel.add_linear(b[i][1], data[dest, self.bounds])
+        return kernel
 
-    def _add_log_zone_util(self, exps, b, generation=False):
+    def _add_log_zone_util(self, kernel, b, generation=False):
         """Adds log transformations of zone data to utility.
         
         This is an optimized way of calculating log terms. Calculates
@@ -227,8 +247,8 @@ class LogitModel:
 
         Parameters
         ----------
-        exps : ndarray
-            Numpy array to which the impedances will be multiplied
+        kernel : UtilityKernel
+            Utility expression to which the zone terms will be multiplied
         b : dict
             The parameters for different zone data.
         generation : bool
@@ -238,9 +258,11 @@ class LogitModel:
         """
         zdata = self.zone_data
         for i in b:
-            exps *= numpy.power(
-                zdata.get_data(i, self.bounds, generation) + 1, b[i])
-        return exps
+            kernel.add_power(
+                self._coefficient(b[i], kernel.ndim),
+                self._zone_term(zdata.get_data(i, self.bounds, generation),
+                                kernel, generation))
+        return kernel
 
 
 class ModeDestModel(LogitModel):
@@ -349,7 +371,8 @@ class ModeDestModel(LogitModel):
     
     def calc_individual_mode_prob(self, 
                                   is_car_user: bool, 
-                                  zone: int) -> Tuple[numpy.array, float]:
+                                  zone: Union[int, numpy.ndarray]
+                                 ) -> Tuple[numpy.ndarray, Union[float, numpy.ndarray]]:
         """Calculate individual choice probabilities with individual dummies.
         
         Calculate mode choice probabilities for individual
@@ -362,35 +385,37 @@ class ModeDestModel(LogitModel):
         ----------
         is_car_user : bool
             Whether the agent is car user or not
-        zone : int
-            Index of zone where the agent lives
+        zone : int or numpy.ndarray
+            Index of zone where the agent lives, or array of zone indices
+            if probabilities are calculated for several zones at once
         
         Returns
         -------
-        numpy.array
+        numpy.ndarray
             Choice probabilities for purpose modes
-        float
+            (one row per zone, if `zone` is an array)
+        float or numpy.ndarray
             Total accessibility for individual (eur)
         """
-        mode_exps = {}
-        mode_expsum = 0
+        mode_exps = []
         modes = self.purpose.modes
+        self.mode_choice_param = cast(Dict[str, Dict[str, Any]], self.mode_choice_param) #type checker help
         for mode in modes:
-            mode_exps[mode] = self.mode_exps[mode][zone]
-            self.mode_choice_param = cast(Dict[str, Dict[str, Any]], self.mode_choice_param) #type checker help
+            mode_exp = self.mode_exps[mode][zone].astype(float)
             b = self.mode_choice_param[mode]["individual_dummy"]
             if is_car_user and "car_users" in b:
                 try:
-                    mode_exps[mode] *= math.exp(b["car_users"])
+                    mode_exp = mode_exp * math.exp(b["car_users"])
                 except TypeError:
                     # Separate sub-region parameters
                     i = self.purpose.sub_intervals.searchsorted(
                         zone, side="right")
-                    mode_exps[mode] *= math.exp(b["car_users"][i])
-            mode_expsum += mode_exps[mode]
-        probs = numpy.empty(len(modes))
-        for i, mode in enumerate(modes):
-            probs[i] = mode_exps[mode] / mode_expsum
+                    mode_exp = mode_exp * numpy.exp(
+                        numpy.array(b["car_users"])[i])
+            mode_exps.append(mode_exp)
+        mode_expsum = sum(mode_exps)
+        probs = numpy.stack(mode_exps, axis=-1) / numpy.expand_dims(
+            mode_expsum, -1)
         # utils to money
         logsum = numpy.log(mode_expsum)
         b = self._get_cost_util_coefficient()
@@ -400,8 +425,7 @@ class ModeDestModel(LogitModel):
         except TypeError:
             # Separate sub-region parameters
             i = self.purpose.sub_intervals.searchsorted(zone, side="right")
-            money_utility = 1 / b[i]
-        self.mode_choice_param = cast(Dict[str, Dict[str, Any]], self.mode_choice_param) #type checker help
+            money_utility = 1 / numpy.array(b)[i]
         money_utility /= self.mode_choice_param["car"]["log"]["logsum"]
         accessibility = -money_utility * logsum
         return probs, accessibility
@@ -503,76 +527,30 @@ class AccessibilityModel(ModeDestModel):
                     names[self.purpose.name], aggregate["all"]),
                 "result_summary")
 
-    def _add_constant(self, utility, b):
-        """Add constant term to utility.
+    def _coefficient(self, b, ndim):
+        """Get parameter as scalar.
 
         If parameter b is a tuple of two terms,
         capital region will be picked.
 
         Parameters
         ----------
-        utility : ndarray
-            Numpy array to which the constant b will be added
         b : float or tuple
-            The value of the constant
-        """
-        try: # If only one parameter
-            utility += b
-        except ValueError: # Separate params for cap region and surrounding
-            utility += b[0]
-
-    def _add_impedance(self, utility, impedance, b):
-        """Adds simple linear impedances to utility.
+            The value of the parameter
+        ndim : int
+            Number of dimensions of the utility array
 
-        If parameter in b is tuple of two terms,
-        capital region will be picked.
-
-        Parameters
-        ----------
-        utility : ndarray
-            Numpy array to which the impedances will be added
-        impedance : dict
-            A dictionary of time-averaged impedance matrices. Includes keys
-            `time`, `cost`, and `dist` of which values are all ndarrays.
-        b : dict
-            The parameters for different impedance matrices.
-        """
-        for i in b:
-            try: # If only one parameter
-                utility += b[i] * impedance[i]
-            except ValueError: # Separate params for cap region and surrounding
-                utility += b[i][0] * impedance[i]
-        return utility
-
-    def _add_log_impedance(self, exps, impedance, b):
-        """Adds log transformations of impedance to utility.
-
-        This is an optimized way of calculating log terms. Calculates
-        impedance1^b1 * ... * impedanceN^bN in the following equation:
-        e^(linear_terms + b1*log(impedance1) + ... + bN*log(impedanceN))
-        = e^(linear_terms) * impedance1^b1 * ... * impedanceN^bN
-
-        If parameter in b is tuple of two terms,
-        capital region will be picked.
-
-        Parameters
-        ----------
-        exps : ndarray
-            Numpy array to which the impedances will be multiplied
-        impedance : dict
-            A dictionary of time-averaged impedance matrices. Includes keys
-            `time`, `cost`, and `dist` of which values are all ndarrays.
-        b : dict
-            The parameters for different impedance matrices
+        Returns
+        -------
+        float
+            Scalar parameter value
         """
-        for i in b:
-            try: # If only one parameter
-                exps *= numpy.power(impedance[i] + 1, b[i])
-            except ValueError: # Separate params for cap region and surrounding
-                exps *= numpy.power(impedance[i] + 1, b[i][0])
-        return exps
+        try: # If only one parameter
+            return float(b)
+        except TypeError: # Separate params for cap region and surrounding
+            return float(b[0])
 
-    def _add_zone_util(self, utility, b, generation=False):
+    def _add_zone_util(self, kernel, b, generation=False):
         """Adds simple linear zone terms to utility.
 
         If parameter in b is tuple of two terms,
@@ -580,8 +558,8 @@ class AccessibilityModel(ModeDestModel):
 
         Parameters
         ----------
-        utility : ndarray
-            Numpy array to which the impedances will be added
+        kernel : UtilityKernel
+            Utility expression to which the zone terms will be added
         b : dict
             The parameters for different zone data.
         generation : bool
@@ -589,16 +567,9 @@ class AccessibilityModel(ModeDestModel):
             geographical area in which this model is used based on the
             `self.bounds` attribute of this class.
         """
-        zdata = self.zone_data
-        for i in b:
-            try: # If only one parameter
-                # Remove area dummies from accessibility indicators
-                if i not in zone_params.areas:
-                    utility += b[i] * zdata.get_data(
-                        i, self.bounds, generation)
-            except ValueError: # Separate params for cap region and surrounding
-                utility += b[i][0] * zdata.get_data(i, self.bounds, generation)
-        return utility
+        # Remove area dummies from accessibility indicators
+        b = {i: b[i] for i in b if i not in zone_params.areas}
+        return LogitModel._add_zone_util(self, kernel, b, generation)
 
 
 class DestModeModel(LogitModel):
@@ -695,6 +666,34 @@ class SecDestModel(LogitModel):
         dest_exps = self._calc_sec_dest_util(mode, impedance, origin, destination)
         return dest_exps.T / dest_exps.sum(1)
 
+    def calc_batch_prob(self, mode, impedance, origins, destinations):
+        """Calculate choice probabilities for a batch of o-d pairs.
+        
+        Parameters
+        ----------
+        mode : str
+            Mode (car/transit/bike)
+        impedance : dict
+            Type (time/cost/dist) : numpy 2d matrix
+                Impedances (o-d pair x secondary destination)
+        origins: ndarray
+            Origin zone indices of pairs
+        destinations: ndarray
+            Destination zone indices of pairs
+        
+        Returns
+        -------
+        numpy 2-d matrix
+            Choice probabilities (o-d pair x secondary destination)
+        """
+        dest_exps = self._calc_sec_dest_util(
+            mode, impedance, origins, destinations)
+        expsum = dest_exps.sum(1)[:, numpy.newaxis]
+        # Destinations where all secondary destinations are out of reach
+        # will have zero probabilities
+        return numpy.divide(
+            dest_exps, expsum, out=dest_exps, where=expsum > 0)
+
 
 class OriginModel(DestModeModel):
     pass
@@ -0,0 +1,186 @@
+from typing import Any, Dict, List, Optional, Tuple, Union, cast
+import numpy # type: ignore
+try:
+    import numexpr # type: ignore
+    _use_numexpr = True
+except ImportError:
+    _use_numexpr = False
+
+from datatypes.block_matrix import BlockDiagonalMatrix
+
+
+# Number of matrix cells processed at a time in NumPy fallback evaluation
+BLOCK_SIZE = 2**16
+# Max number of arrays in one numexpr evaluation, output array included
+MAX_OPERANDS = 32
+
+
+class UtilityKernel:
+    """Fused evaluator for one logit utility expression.
+
+    Collects the terms of a utility function and fills the output array
+    in one pass:
+    out = e^(c1*x1 + ... + cN*xN) * (y1+1)^b1 * ... * (yM+1)^bM
+
+    Coefficients can be scalars or arrays broadcastable to output shape
+    (e.g., separate parameters for sub-regions as a column vector).
+    Terms can also be `BlockDiagonalMatrix` objects, which are expanded
+    only one block of rows at a time.
+    If numexpr is installed, the expression is compiled with it,
+    otherwise NumPy operations are performed in-place in row blocks,
+    so that no full-size temporary matrices are allocated.
+
+    Parameters
+    ----------
+    out : numpy.ndarray
+        Array where the result will be stored (1-d or 2-d)
+    """
+
+    def __init__(self, out: numpy.ndarray):
+        self.out = out
+        self._linear: List[Tuple[Any, Optional[numpy.ndarray]]] = []
+        self._power: List[Tuple[Any, numpy.ndarray]] = []
+        self._mask: Optional[Tuple[numpy.ndarray, float]] = None
+
+    @property
+    def ndim(self) -> int:
+        return self.out.ndim
+
+    def add_linear(self, b: Any, data: Optional[numpy.ndarray] = None):
+        """Add linear term b*data (or constant b if data is None)."""
+        self._linear.append((b, data))
+
+    def add_power(self, b: Any, data: numpy.ndarray):
+        """Add log term b*log(data+1), i.e., multiply exps by (data+1)^b."""
+        self._power.append((b, data))
+
+    def set_mask(self, data: numpy.ndarray, threshold: float):
+        """Set exps to zero where data exceeds threshold."""
+        self._mask = (data, threshold)
+
+    def evaluate(self, exponentiate: bool = True) -> numpy.ndarray:
+        """Fill output array.
+
+        Parameters
+        ----------
+        exponentiate : bool (optional)
+            If False, only the sum of linear terms is calculated
+
+        Returns
+        -------
+        numpy.ndarray
+            The output array
+        """
+        if not exponentiate and (self._power or self._mask is not None):
+            raise ValueError("Log terms are only valid for exponentiated utility")
+        if not self._linear and not self._power:
+            self.out.fill(1 if exponentiate else 0)
+            if self._mask is not None:
+                data, threshold = self._mask
+                self.out[data > threshold] = 0
+        elif _use_numexpr and self.out.size > 0:
+            # numexpr does not accept zero-sized operands
+            self._evaluate_numexpr(exponentiate)
+        else:
+            self._evaluate_blocks(exponentiate)
+        return self.out
+
+    def _evaluate_numexpr(self, exponentiate: bool):
+        local_dict: Dict[str, Any] = {}
+        groups: List[Tuple[numpy.ndarray, numpy.ndarray]] = []
+        terms = []
+        for i, (b, data) in enumerate(self._linear):
+            local_dict["c{}".format(i)] = b
+            if data is None:
+                terms.append("c{}".format(i))
+            elif isinstance(data, BlockDiagonalMatrix):
+                # Broadcast group comparison instead of dense matrix,
+                # group arrays are shared between terms if equal
+                for k, (row_groups, col_groups) in enumerate(groups):
+                    if (numpy.array_equal(row_groups, data.row_groups)
+                            and numpy.array_equal(col_groups, data.col_groups)):
+                        break
+                else:
+                    k = len(groups)
+                    groups.append((data.row_groups, data.col_groups))
+                    local_dict["r{}".format(k)] = data.row_groups[:, numpy.newaxis]
+                    local_dict["g{}".format(k)] = data.col_groups
+                terms.append("where(r{}== g{}, {}, {})".format(
+                    k, k,
+                    self._block_value(local_dict, i, "x", data.inside),
+                    self._block_value(local_dict, i, "z", data.outside)))
+            elif data.dtype == bool:
+                local_dict["x{}".format(i)] = data
+                terms.append("where(x{0}, c{0}, 0)".format(i))
+            else:
+                local_dict["x{}".format(i)] = data
+                terms.append("c{0}*x{0}".format(i))
+        expr = " + ".join(terms)
+        if exponentiate:
+            factors = ["exp({})".format(expr)] if terms else []
+            for i, (b, data) in enumerate(self._power):
+                local_dict["b{}".format(i)] = b
+                local_dict["y{}".format(i)] = data
+                factors.append("(y{0} + 1)**b{0}".format(i))
+            expr = " * ".join(factors)
+            if self._mask is not None:
+                local_dict["m"], local_dict["t"] = self._mask
+                expr = "where(m > t, 0, {})".format(expr)
+        # Output array is an operand as well
+        if len(local_dict) + 1 > MAX_OPERANDS:
+            self._evaluate_blocks(exponentiate)
+        else:
+            numexpr.evaluate(
+                expr, local_dict=local_dict, out=self.out, casting="unsafe")
+
+    def _block_value(self,
+                     local_dict: Dict[str, Any],
+                     i: int,
+                     prefix: str,
+                     value: Any) -> str:
+        """Get expression for term i inside or outside matrix blocks."""
+        if numpy.ndim(value) == 0 and value == 0:
+            return "0"
+        name = "{}{}".format(prefix, i)
+        local_dict[name] = numpy.asarray(value, self.out.dtype)
+        return "c{}*{}".format(i, name)
+
+    def _evaluate_blocks(self, exponentiate: bool):
+        out = self.out
+        row_size = max(out[:1].size, 1)
+        step = max(BLOCK_SIZE // row_size, 1)
+        nr_rows = out.shape[0]
+        tmp_buffer = numpy.empty(min(step, nr_rows) * row_size, out.dtype)
+        for start in range(0, nr_rows, step):
+            rows = slice(start, min(start + step, nr_rows))
+            block = out[rows]
+            tmp = tmp_buffer[:block.size].reshape(block.shape)
+            block.fill(0)
+            for b, data in self._linear:
+                if data is None:
+                    numpy.add(block, self._block(b, rows), out=block)
+                else:
+                    numpy.multiply(
+                        self._block(b, rows), self._block(data, rows), out=tmp)
+                    numpy.add(block, tmp, out=block)
+            if exponentiate:
+                numpy.exp(block, out=block)
+                for b, data in self._power:
+                    numpy.add(self._block(data, rows), 1, out=tmp)
+                    numpy.power(tmp, self._block(b, rows), out=tmp)
+                    numpy.multiply(block, tmp, out=block)
+                if self._mask is not None:
+                    data, threshold = self._mask
+                    block[self._block(data, rows) > threshold] = 0
+
+    def _block(self,
+               data: Union[float, numpy.ndarray],
+               rows: slice) -> Union[float, numpy.ndarray]:
+        """Get rows of term array, if term is not broadcast along rows."""
+        if isinstance(data, BlockDiagonalMatrix):
+            return numpy.asarray(data[rows])
+        elif numpy.ndim(data) == self.out.ndim and numpy.shape(data)[0] != 1:
+            data = cast(numpy.ndarray, data) #type checker help
+            return data[rows]
+        else:
+            return data
@@ -1,16 +1,17 @@
 import threading
 import multiprocessing
 import os
-from typing import Any, Callable, Dict, List, Set, Union, cast
+import json
+from typing import Any, Callable, Dict, List, Mapping, Optional, Set, Tuple, Union, cast
 import numpy # type: ignore
 import pandas
-import random
 from collections import defaultdict
 from assignment.abstract_assignment import AssignmentModel
 from assignment.emme_assignment import EmmeAssignmentModel
 from assignment.mock_assignment import MockAssignmentModel
 
 import utils.log as log
+from utils.memory import peak_memory
 from utils.zone_interval import ArrayAggregator
 import assignment.departure_time as dt
 from datahandling.resultdata import ResultsData
@@ -19,9 +20,10 @@ from datahandling.matrixdata import MatrixData
 from demand.freight import FreightModel
 from demand.trips import DemandModel
 from demand.external import ExternalModel
+from demand.sec_dest_pool import SecDestPool
+from demand.agent_pool import AgentPool
 from datatypes.purpose import SecDestPurpose
-from datatypes.person import Person
-from datatypes.tour import Tour
+from datatypes.population import TABLE_CHUNK_SIZE
 from transform.impedance_transformer import ImpedanceTransformer
 from models.linear import CarDensityModel
 import parameters.assignment as param
@@ -47,6 +49,14 @@ class ModelSystem:
         can be EmmeAssignmentModel or MockAssignmentModel
     name : str
         Name of scenario, used for results subfolder
+    sec_dest_backend : str (optional)
+        Calculation backend for secondary destination choice
+        (batch/processes/threads), default is set in parameters
+    result_format : str (optional)
+        Format of result tables (txt/parquet/feather/hdf5), default is txt
+    validation : str (optional)
+        Zone data validation level (strict/lenient),
+        default is set in parameters
     """
 
     def __init__(self, 
@@ -55,22 +65,33 @@ class ModelSystem:
                  base_matrices_path: str,
                  results_path: str, 
                  assignment_model: AssignmentModel, 
-                 name: str):
+                 name: str,
+                 sec_dest_backend: Optional[str] = None,
+                 result_format: str = "txt",
+                 validation: Optional[str] = None):
+        self.sec_dest_backend = (param.sec_dest_backend
+            if sec_dest_backend is None else sec_dest_backend)
         self.ass_model = cast(Union[MockAssignmentModel,EmmeAssignmentModel], assignment_model) #type checker hint
         self.zone_numbers: numpy.array = self.ass_model.zone_numbers
         self.travel_modes: Dict[str, bool] = {}  # Dict instead of set, to preserve order
 
         # Input data
+        if validation is None:
+            validation = zone_param.zone_data_validation
         self.zdata_base = BaseZoneData(
-            base_zone_data_path, self.zone_numbers)
+            base_zone_data_path, self.zone_numbers, validation)
         self.basematrices = MatrixData(base_matrices_path)
         self.zdata_forecast = ZoneData(
-            zone_data_path, self.zone_numbers)
+            zone_data_path, self.zone_numbers, validation)
 
         # Output data
         self.resultmatrices = MatrixData(
             os.path.join(results_path, name, "Matrices"))
-        self.resultdata = ResultsData(os.path.join(results_path, name))
+        self.resultdata = ResultsData(
+            os.path.join(results_path, name), result_format)
+        self.name = name
+        self.checkpoint_path = os.path.join(
+            results_path, name, "checkpoint.npz")
 
         self.dm = self._init_demand_model()
         self.fm = FreightModel(
@@ -85,6 +106,7 @@ class ModelSystem:
             self.zdata_base, self.zdata_forecast, bounds, self.resultdata)
         self.mode_share: List[Dict[str,Any]] = []
         self.convergence = pandas.DataFrame()
+        self.memory_usage = pandas.DataFrame()
         self.trucks = self.fm.calc_freight_traffic("truck")
         self.trailer_trucks = self.fm.calc_freight_traffic("trailer_truck")
 
@@ -177,28 +199,8 @@ class ModelSystem:
                     Impedance (float 2-d matrix)
         """
         impedance = {}
-
-        # create attributes and background variables to network
-        self.ass_model.prepare_network(self.zdata_forecast.car_dist_cost)
-
-        # Calculate transit cost matrix, and save it to emmebank
+        self._prepare_assignment(use_fixed_transit_cost)
         time_periods = self.ass_model.time_periods
-        with self.basematrices.open(
-                "demand", time_periods[0], self.ass_model.zone_numbers) as mtx:
-            base_demand = {ass_class: mtx[ass_class]
-                for ass_class in param.transport_classes}
-        self.ass_model.init_assign(base_demand)
-        if use_fixed_transit_cost:
-            log.info("Using fixed transit cost matrix")
-            with self.resultmatrices.open("cost", time_periods[0]) as aht_mtx:
-                fixed_cost = aht_mtx["transit_work"]
-        else:
-            log.info("Calculating transit cost")
-            fixed_cost = None
-        self.ass_model.calc_transit_cost(
-            self.zdata_forecast.transit_zone,
-            self.basematrices.peripheral_transit_cost(self.zdata_base),
-            fixed_cost)
 
         # Perform traffic assignment and get result impedance, 
         # for each time period
@@ -224,6 +226,156 @@ class ModelSystem:
         self.dtm.init_demand()
         return impedance
 
+    def _prepare_assignment(self, use_fixed_transit_cost: bool):
+        """Prepare network and calculate transit cost matrix."""
+        # create attributes and background variables to network
+        self.ass_model.prepare_network(self.zdata_forecast.car_dist_cost)
+
+        # Calculate transit cost matrix, and save it to emmebank
+        time_periods = self.ass_model.time_periods
+        with self.basematrices.open(
+                "demand", time_periods[0], self.ass_model.zone_numbers) as mtx:
+            base_demand = {ass_class: mtx[ass_class]
+                for ass_class in param.transport_classes}
+        self.ass_model.init_assign(base_demand)
+        if use_fixed_transit_cost:
+            log.info("Using fixed transit cost matrix")
+            with self.resultmatrices.open("cost", time_periods[0]) as aht_mtx:
+                fixed_cost = aht_mtx["transit_work"]
+        else:
+            log.info("Calculating transit cost")
+            fixed_cost = None
+        self.ass_model.calc_transit_cost(
+            self.zdata_forecast.transit_zone,
+            self.basematrices.peripheral_transit_cost(self.zdata_base),
+            fixed_cost)
+
+    def save_checkpoint(self, impedance: Dict[str, Dict[str, Dict[str, numpy.ndarray]]],
+                        iteration: int):
+        """Save state of model run after iteration.
+
+        Scenario name, impedance, car demand of previous iteration
+        (for convergence), impedance ratios, iteration statistics and
+        agent state (in agent model) are saved as binary numpy arrays
+        in `checkpoint_path`, overwriting earlier checkpoint.
+
+        Parameters
+        ----------
+        impedance : dict
+            Time period (aht/pt/iht) : dict
+                Type (time/cost/dist) : dict
+                    Assignment class (car_work/transit/...) : numpy 2d matrix
+        iteration : int
+            Number of iterations completed
+        """
+        arrays = {
+            "scenario": numpy.array(self.name),
+            "zone_numbers": numpy.asarray(self.zone_numbers),
+            "meta": numpy.array(json.dumps({
+                "iteration": iteration,
+                "convergence": self.convergence.to_dict("list"),
+                "mode_share": self.mode_share,
+            })),
+        }
+        for tp in impedance:
+            for mtx_type in impedance[tp]:
+                for ass_class in impedance[tp][mtx_type]:
+                    arrays["impedance/{}/{}/{}".format(
+                        tp, mtx_type, ass_class)] = numpy.ma.getdata(
+                            impedance[tp][mtx_type][ass_class])
+        if isinstance(self.dtm.old_car_demand, numpy.ndarray):
+            arrays["old_car_demand"] = self.dtm.old_car_demand
+        for ratio in ("time_ratio", "cost_ratio"):
+            try:
+                arrays[ratio] = self.zdata_forecast[ratio].values
+            except KeyError:
+                pass
+        arrays.update(self._agent_state())
+        # Write to temporary file first, so that an interrupted save
+        # does not destroy the previous checkpoint
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "wb") as file:
+            numpy.savez(file, **arrays)
+        os.replace(tmp_path, self.checkpoint_path)
+        log.info("Saved checkpoint after iteration {}".format(iteration))
+
+    def resume(self,
+               use_fixed_transit_cost: bool = False,
+               checkpoint_path: Optional[str] = None
+              ) -> Tuple[Dict[str, Dict[str, Dict[str, numpy.ndarray]]], int]:
+        """Restore state of model run from checkpoint.
+
+        Replaces `assign_base_demand` when continuing an interrupted run,
+        or when starting from the converged state of another scenario
+        with the same zones. In the latter case, only impedance,
+        car demand and impedance ratios are restored, and iteration
+        count starts from zero.
+
+        Parameters
+        ----------
+        use_fixed_transit_cost : bool (optional)
+            If transit cost is already calculated for this scenario and is
+            found in Results folder, it can be reused to save time
+        checkpoint_path : str (optional)
+            Path to checkpoint file, default is `checkpoint_path`
+
+        Returns
+        -------
+        dict
+            Time period (aht/pt/iht) : dict
+                Type (time/cost/dist) : dict
+                    Assignment class (car_work/transit/...) : numpy 2d matrix
+        int
+            Number of iterations of this scenario completed before checkpoint
+        """
+        if checkpoint_path is None:
+            checkpoint_path = self.checkpoint_path
+        if not os.path.isfile(checkpoint_path):
+            msg = "Checkpoint file {} not found".format(checkpoint_path)
+            log.error(msg)
+            raise FileNotFoundError(msg)
+        with numpy.load(checkpoint_path) as checkpoint:
+            if not numpy.array_equal(
+                    checkpoint["zone_numbers"], self.zone_numbers):
+                msg = "Zone numbers in checkpoint {} do not match model".format(
+                    checkpoint_path)
+                log.error(msg)
+                raise ValueError(msg)
+            meta = json.loads(str(checkpoint["meta"]))
+            scenario = (str(checkpoint["scenario"])
+                        if "scenario" in checkpoint.files else None)
+            is_same_scenario = scenario == self.name
+            impedance: Dict[str, Dict[str, Dict[str, numpy.ndarray]]] = {}
+            for key in checkpoint.files:
+                if key.startswith("impedance/"):
+                    _, tp, mtx_type, ass_class = key.split("/")
+                    impedance.setdefault(tp, {}).setdefault(mtx_type, {})[
+                        ass_class] = checkpoint[key]
+            if "old_car_demand" in checkpoint.files:
+                self.dtm.old_car_demand = checkpoint["old_car_demand"]
+            for ratio in ("time_ratio", "cost_ratio"):
+                if ratio in checkpoint.files:
+                    self.zdata_forecast[ratio] = pandas.Series(
+                        checkpoint[ratio], self.zone_numbers)
+            if is_same_scenario:
+                self._restore_agent_state(checkpoint)
+        self._prepare_assignment(use_fixed_transit_cost)
+        if not is_same_scenario:
+            log.info("Starting model run from state of scenario {} in {}".format(
+                scenario, checkpoint_path))
+            return impedance, 0
+        self.convergence = pandas.DataFrame(meta["convergence"])
+        self.mode_share[:] = meta["mode_share"]
+        log.info("Resumed model run after iteration {} from {}".format(
+            meta["iteration"], checkpoint_path))
+        return impedance, meta["iteration"]
+
+    def _agent_state(self) -> Dict[str, numpy.ndarray]:
+        return {}
+
+    def _restore_agent_state(self, checkpoint: Mapping[str, numpy.ndarray]):
+        pass
+
     def run_iteration(self, previous_iter_impedance, iteration=None):
         """Calculate demand and assign to network.
 
@@ -255,6 +407,7 @@ class ModelSystem:
                     Impedance (float 2-d matrix)
         """
         impedance = {}
+        memory: Dict[str, float] = {}
 
         # Add truck and trailer truck demand, to time-period specific
         # matrices (DTM), used in traffic assignment
@@ -268,6 +421,8 @@ class ModelSystem:
 
         # Calculate internal demand
         self._add_internal_demand(previous_iter_impedance, iteration=="last")
+        self.imptrans.clear_cache()
+        self._record_memory(memory, "internal_demand")
 
         # Calculate external demand
         for mode in param.external_modes:
@@ -284,6 +439,7 @@ class ModelSystem:
                 int_demand = self._sum_trips_per_zone(mode)
             ext_demand = self.em.calc_external(mode, int_demand)
             self.dtm.add_demand(ext_demand)
+        self._record_memory(memory, "external_demand")
 
         # Calculate tour sums and mode shares
         tour_sum = {mode: self._sum_trips_per_zone(mode, include_dests=False)
@@ -325,6 +481,7 @@ class ModelSystem:
             if iteration=="last":
                 impedance[tp]["time"]["transit_uncongested"] = previous_iter_impedance[tp]["time"]["transit_work"]
                 self._save_to_omx(impedance[tp], tp)
+        self._record_memory(memory, "assignment")
         if iteration=="last":
             self.ass_model.aggregate_results(self.resultdata)
             self._calculate_noise_areas()
@@ -342,9 +499,28 @@ class ModelSystem:
             iteration, gap["rel_gap"]))
         self.convergence = self.convergence.append(gap, ignore_index=True)
         self.resultdata._df_buffer["demand_convergence.txt"] = self.convergence
+        if memory:
+            self.memory_usage = self.memory_usage.append(
+                memory, ignore_index=True)
+            self.resultdata._df_buffer["memory_usage.txt"] = self.memory_usage
         self.resultdata.flush()
         return impedance
 
+    def _record_memory(self, memory: Dict[str, float], stage: str):
+        """Store peak memory use (MB) of model run so far, after stage.
+
+        Peak is measured from process start, so growth between stages
+        shows which stage needed the most memory.
+        Only recorded if `report_memory_usage` is set in parameters.
+        """
+        if not param.report_memory_usage:
+            return
+        peak = peak_memory()
+        if peak is not None:
+            memory[stage] = peak
+            log.debug("Peak memory use after {}: {:.0f} MB".format(
+                stage, peak))
+
     def _save_demand_to_omx(self, tp):
         zone_numbers = self.ass_model.zone_numbers
         demand_sum_string = tp
@@ -423,13 +599,58 @@ class ModelSystem:
         return int_demand
 
     def _distribute_sec_dests(self, purpose, mode, impedance):
-        threads = []
-        demand = []
+        backend = self.sec_dest_backend
+        if backend == "batch":
+            for origs in self._sec_dest_blocks(purpose, mode):
+                demand, orig_demand = purpose.distribute_tours_batched(
+                    mode, impedance[mode], origs)
+                self.dtm.add_sec_dest_demand(demand, orig_demand)
+        elif backend == "processes":
+            nr_processes = self._nr_processors()
+            blocks = self._sec_dest_blocks(purpose, mode, nr_processes)
+            with SecDestPool(
+                    purpose, mode, impedance[mode], nr_processes) as pool:
+                pool.distribute(blocks)
+            self.dtm.add_sec_dest_demand(pool.demand, pool.orig_demand)
+        elif backend == "threads":
+            self._distribute_sec_dests_threaded(purpose, mode, impedance)
+        else:
+            raise ValueError(
+                "Unknown secondary destination backend {}".format(backend))
+        purpose.print_data()
+
+    def _sec_dest_blocks(self, purpose, mode, nr_blocks=1):
+        """Divide secondary destination origins into blocks.
+
+        Number of origins calculated at a time is limited by the size
+        of the (o-d pair x secondary destination) arrays.
+        """
+        nr_zones = purpose.bounds.stop - purpose.bounds.start
+        cum_pairs = numpy.cumsum(purpose.count_pairs(mode))
+        step = max(param.sec_dest_batch_cells // nr_zones, 1)
+        step = min(step, -(-int(cum_pairs[-1]) // nr_blocks))
+        blocks = []
+        start = 0
+        while start < len(cum_pairs):
+            offset = cum_pairs[start-1] if start > 0 else 0
+            stop = int(numpy.searchsorted(cum_pairs, offset + step, "right"))
+            stop = max(stop, start + 1)
+            blocks.append(slice(start, stop))
+            start = stop
+        return blocks
+
+    def _nr_processors(self):
         nr_threads = param.performance_settings["number_of_processors"]
         if nr_threads == "max":
             nr_threads = multiprocessing.cpu_count()
         elif nr_threads <= 0:
             nr_threads = 1
+        return nr_threads
+
+    def _distribute_sec_dests_threaded(self, purpose, mode, impedance):
+        threads = []
+        demand = []
+        nr_threads = self._nr_processors()
         bounds = next(iter(purpose.sources)).bounds
         for i in range(nr_threads):
             # Take a range of origins, for which this thread
@@ -450,7 +671,6 @@ class ModelSystem:
             for tp in dtm.demand:
                 for ass_class in dtm.demand[tp]:
                     self.dtm.demand[tp][ass_class] += dtm.demand[tp][ass_class]
-        purpose.print_data()
 
     def _distribute_tours(self, container, purpose, mode, impedance, origs):
         for orig in origs:
@@ -520,9 +740,54 @@ class AgentModelSystem(ModelSystem):
 
     def _init_demand_model(self):
         log.info("Creating synthetic population")
-        random.seed(zone_param.population_draw)
         return DemandModel(self.zdata_forecast, self.resultdata, is_agent_model=True)
 
+    def _agent_state(self) -> Dict[str, numpy.ndarray]:
+        """Get arrays needed to continue agent simulation.
+
+        Population seed is stored, so that a population drawn with
+        random seed is drawn again identically on resume.
+        """
+        population = self.dm.population
+        tours = population.tours
+        arrays = {
+            "population_seed": numpy.array(population.rng.seed, numpy.uint64),
+            "is_car_user": population.is_car_user,
+            "tour_purposes": numpy.array(
+                [purpose.name for purpose in tours.purposes]),
+        }
+        for column, values in tours.get_columns().items():
+            arrays["tours/" + column] = values
+        if self.dtm.agent_demand is not None:
+            for tp in self.dtm.agent_demand:
+                for ass_class in self.dtm.agent_demand[tp]:
+                    arrays["agent_demand/{}/{}".format(tp, ass_class)] = (
+                        self.dtm.agent_demand[tp][ass_class])
+        return arrays
+
+    def _restore_agent_state(self, checkpoint: Mapping[str, numpy.ndarray]):
+        if "population_seed" not in checkpoint:
+            return
+        seed = int(checkpoint["population_seed"])
+        if seed != self.dm.population.rng.seed:
+            log.info("Drawing population with seed {} from checkpoint".format(
+                seed))
+            self.dm.create_population(seed)
+        population = self.dm.population
+        population.is_car_user = checkpoint["is_car_user"]
+        columns = {key[len("tours/"):]: checkpoint[key]
+            for key in checkpoint if key.startswith("tours/")}
+        population.tours.merge(
+            {str(name): self.dm.purpose_dict[str(name)]
+                for name in checkpoint["tour_purposes"]},
+            [(0, columns)])
+        agent_demand: Dict[str, Dict[str, numpy.ndarray]] = {}
+        for key in checkpoint:
+            if key.startswith("agent_demand/"):
+                _, tp, ass_class = key.split("/")
+                agent_demand.setdefault(tp, {})[ass_class] = checkpoint[key]
+        self.dtm.agent_demand = agent_demand or None
+
     def _add_internal_demand(self, previous_iter_impedance, is_last_iteration):
         """Produce tours and add fractions of them
         for each time-period to container in departure time model.
@@ -542,7 +807,6 @@ class AgentModelSystem(ModelSystem):
             secondary destinations are calculated for all modes
         """
         log.info("Demand calculation started...")
-        random.seed(None)
         self.dm.car_use_model.calc_basic_prob()
         for purpose in self.dm.tour_purposes:
             if isinstance(purpose, SecDestPurpose):
@@ -574,15 +838,40 @@ class AgentModelSystem(ModelSystem):
         purpose = self.dm.purpose_dict["hoo"]
         sec_dest_tours = {mode: [defaultdict(list) for _ in purpose.zone_numbers]
             for mode in purpose.modes}
+        population = self.dm.population
+        backend = param.agent_backend
+        threshold = param.agent_change_threshold
+        is_incremental = (backend == "vectorized" and threshold is not None
+                          and not is_last_iteration
+                          and len(population.tours) > 0
+                          and self.dtm.agent_demand is not None)
+        previous = None
+        simulated = None
+        removed = None
+        if backend == "vectorized":
+            if is_incremental:
+                previous = population.tours.snapshot()
+            population.decide_car_use()
+            population.tours.generate(self.dm.purpose_dict, tour_probs)
+            if is_incremental:
+                simulated, removed = population.tours.recycle_choices(
+                    previous, threshold)
+                log.info("Simulating {} of {} tours".format(
+                    simulated.sum(), len(simulated)))
+            population.tours.choose_modes_and_destinations(
+                sec_dest_tours, simulated)
+        elif backend == "processes":
+            with AgentPool(population, self.dm.purpose_dict, tour_probs,
+                           self._nr_processors()) as pool:
+                pool.simulate(sec_dest_tours)
+        else:
+            raise ValueError("Unknown agent backend {}".format(backend))
+        bounds = self.dm.car_use_model.bounds
         car_users = pandas.Series(
-            0, self.zdata_forecast.zone_numbers[self.dm.car_use_model.bounds])
-        for person in self.dm.population:
-            person.decide_car_use()
-            car_users[person.zone.number] += person.is_car_user
-            person.add_tours(self.dm.purpose_dict, tour_probs)
-            for tour in person.tours:
-                tour.choose_mode(person.is_car_user)
-                tour.choose_destination(sec_dest_tours)
+            numpy.bincount(
+                population.zone_index, population.is_car_user,
+                bounds.stop)[bounds],
+            self.zdata_forecast.zone_numbers[bounds])
         self.dm.car_use_model.print_results(
             car_users / self.dm.zone_population, self.dm.zone_population)
         log.info("Primary destinations assigned")
@@ -610,24 +899,25 @@ class AgentModelSystem(ModelSystem):
                 thread.join()
         for purpose in self.dm.tour_purposes:
             purpose.print_data()
-        for person in self.dm.population:
-            for tour in person.tours:
-                self.dtm.add_demand(tour)
+        if threshold is None:
+            self.dtm.add_tours_bulk(population.tours)
+        else:
+            self.dtm.update_agent_demand(
+                population.tours, simulated, previous, removed)
         if is_last_iteration:
-            random.seed(zone_param.population_draw)
             self.dm.predict_income()
-            random.seed(None)
+            population.calc_income()
+            population.tours.calc_cost(previous_iter_impedance)
             fname0 = "agents"
             fname1 = "tours"
-            # print person and tour attr to files
-            self.resultdata.print_line("\t".join(Person.attr), fname0)
-            self.resultdata.print_line("\t".join(Tour.attr), fname1)
-            for person in self.dm.population:
-                person.calc_income()
-                self.resultdata.print_line(str(person), fname0)
-                for tour in person.tours:
-                    tour.calc_cost(previous_iter_impedance)
-                    self.resultdata.print_line(str(tour), fname1)
+            # print person and tour attr to files, chunk by chunk
+            for table, fname in ((population, fname0),
+                                 (population.tours, fname1)):
+                for start in range(0, len(table), TABLE_CHUNK_SIZE):
+                    self.resultdata.print_table(
+                        table.get_table(
+                            slice(start, start + TABLE_CHUNK_SIZE)),
+                        fname)
             log.info("Results printed to files {} and {}".format(
                 fname0, fname1))
         log.info("Demand calculation completed")
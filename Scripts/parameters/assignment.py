@@ -161,6 +161,31 @@ hsl_area = "ABCDE HEXL"
 performance_settings = {
     "number_of_processors": "max"
 }
+# Calculation backend for secondary destination choice:
+# "batch" = blocks of origins in main process,
+# "processes" = blocks of origins in process pool with shared memory,
+# "threads" = origins one by one in threads
+sec_dest_backend = "batch"
+# Calculation backend for agent car use, tour generation and
+# mode and destination choice:
+# "vectorized" = all agents at once in main process,
+# "processes" = agents in blocks of home zones in process pool
+agent_backend = "vectorized"
+# Threshold for change in cumulative mode and destination probabilities,
+# under which agent tours keep their choices from previous iteration
+# (None = all tours are simulated in every iteration).
+# Used with vectorized backend, last iteration is always fully simulated.
+agent_change_threshold = None
+# Max number of (o-d pair, secondary destination) cells calculated
+# at a time in secondary destination choice with "batch" and
+# "processes" backends (each block has at least one origin)
+sec_dest_batch_cells = 2**22
+# Floating point precision of matrices and zone data in demand model
+# ("float32" halves memory use compared to "float64",
+# but changes model results slightly)
+float_precision = "float64"
+# Record peak memory use after each model stage to memory_usage.txt
+report_memory_usage = False
 # Inversed value of time [min/eur]
 vot_inv = {
     "work": 7.576, # 1 / ((7.92 eur/h) / (60 min/h)) = 7.576 min/eur
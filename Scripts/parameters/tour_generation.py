@@ -670,3 +670,9 @@ garbage_generation = {
     "workplaces": 0.000025,
 }
 vector_calibration_threshold = 5
+# Freight matrix balancing stops after max iterations, or when
+# relative error in each zone production is under tolerance
+freight_balancing = {
+    "max_iterations": 100,
+    "tolerance": 1e-5,
+}
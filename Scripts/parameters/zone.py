@@ -1,9 +1,20 @@
 # Share of demand that will be simulated in agent model
-from typing import Any, Dict, List, Tuple, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 
 agent_demand_fraction = 1.0
 
+# Validation level of zone data values:
+# "strict" = always checked,
+# "lenient" = checks skipped for input files already validated
+# (recognized by content hash stored in zone_data_cache_dir)
+zone_data_validation = "strict"
+
+# Directory where parsed zone data files are cached
+# (keyed by content hash of input files), None = no cache.
+# Cache files are never removed automatically.
+zone_data_cache_dir: Optional[str] = None
+
 # Seed number for population attributes:
 # int = fixed seed and same population for each run
 # None = different population for each run
@@ -1,12 +1,16 @@
 import unittest
 import pandas
 import os
+import tempfile
 import numpy
+import openmatrix as omx
 
 import utils.log as log
 from datahandling.zonedata import ZoneData
+import datahandling.matrixdata as matrixdata
 from datahandling.matrixdata import MatrixData
 import parameters.assignment as param
+from utils.memory import float_dtype
 
 
 TEST_DATA_PATH = os.path.join(
@@ -51,6 +55,66 @@ class MatrixDataTest(unittest.TestCase):
             with matrix_data.open(matrix_type, key, expanded_zones) as mtx:
                 for ass_class in param.transport_classes:
                     a = mtx[ass_class]
+                    self.assertEqual(a.shape, (13, 13))
+                    self.assertEqual(a[3, :].sum() + a[:, 3].sum(), 0)
+
+    def test_uncompressed_matrix(self):
+        log.initialize(Config())
+        with tempfile.TemporaryDirectory() as path:
+            zone_numbers = numpy.array([5, 7, 9])
+            data = numpy.arange(9, dtype=numpy.float32).reshape(3, 3)
+            with omx.open_file(os.path.join(path, "time_aht.omx"), 'w') as file:
+                for ass_class in param.transport_classes:
+                    file.create_array(file.root.data, ass_class, data)
+                file.create_mapping("zone_number", zone_numbers)
+            m = MatrixData(path)
+            network_zones = numpy.array([5, 6, 7, 9])
+            with m.open("time", "aht") as mtx:
+                a = mtx["car_work"]
+                b = mtx["car_work"]
+            numpy.testing.assert_array_equal(a, data)
+            # Each read gives a separate array
+            a[0, 0] = 100
+            self.assertEqual(b[0, 0], 0)
+            with m.open("time", "aht", list(network_zones)) as mtx:
+                c = mtx["car_work"]
+            numpy.testing.assert_array_equal(c[[0, 2, 3]][:, [0, 2, 3]], data)
+            self.assertEqual(c[1, :].sum() + c[:, 1].sum(), 0)
+            del a, b, c
+
+    def test_file_pool(self):
+        log.initialize(Config())
+        with tempfile.TemporaryDirectory() as path:
+            m = MatrixData(path)
+            zone_numbers = [5, 7, 9]
+            for tp in ("aht", "pt", "iht"):
+                with m.open("time", tp, zone_numbers, 'w') as mtx:
+                    mtx["car_work"] = numpy.ones((3, 3))
+            with m.open("time", "aht") as mtx:
+                handle = mtx._file
+            with m.open("time", "aht") as mtx:
+                self.assertIs(mtx._file, handle)
+            max_open_files = matrixdata.MAX_OPEN_FILES
+            matrixdata.MAX_OPEN_FILES = 2
+            for tp in ("pt", "iht"):
+                with m.open("time", tp) as mtx:
+                    pass
+            matrixdata.MAX_OPEN_FILES = max_open_files
+            self.assertFalse(handle.isopen)
+            with m.open("time", "pt") as mtx:
+                handle = mtx._file
+            # Files read through other instances are closed before writing
+            other = MatrixData(path)
+            with other.open("time", "pt") as mtx:
+                other_handle = mtx._file
+            with m.open("time", "pt", zone_numbers, 'w') as mtx:
+                mtx["car_work"] = numpy.zeros((3, 3))
+            self.assertFalse(handle.isopen)
+            self.assertFalse(other_handle.isopen)
+            with m.open("time", "pt") as mtx:
+                self.assertEqual(mtx["car_work"].sum(), 0)
+            m.close()
+            other.close()
 
 
 class ZoneDataTest(unittest.TestCase):
@@ -93,7 +157,7 @@ class ZoneDataTest(unittest.TestCase):
         expected_row = pandas.Series(
             [1142, 229, 3.8014, 1.8091, 2.1984],
             index=["population", "workplaces", "shops", "logistics", "industry"],
-            dtype=numpy.float32, name=244)
+            dtype=float_dtype(), name=244)
         pandas.testing.assert_series_equal(row, expected_row)
 
     def test_industry_series_and_indexes_2016(self):
@@ -101,5 +165,5 @@ class ZoneDataTest(unittest.TestCase):
         industry = df["industry"] # Let's pick a column and validate it
         expected_industry = pandas.Series(
             [3.3971, 579.7232, 2.1984, 467.7852, 29.4101, 2.1424, 7.392, 0, 0, 0],
-            index=INTERNAL_ZONES, dtype=numpy.float32, name="industry")
+            index=INTERNAL_ZONES, dtype=float_dtype(), name="industry")
         pandas.testing.assert_series_equal(industry, expected_industry)
@@ -1,9 +1,15 @@
+import functools
+import multiprocessing
 import unittest
+from unittest import mock
 import numpy
 
 import utils.log as log
 from modelsystem import ModelSystem, AgentModelSystem
 from assignment.mock_assignment import MockAssignmentModel
+import assignment.departure_time as dt
+import demand.agent_pool as agent_pool
+import demand.sec_dest_pool as sec_dest_pool
 from datahandling.matrixdata import MatrixData
 from datatypes.demand import Demand
 import parameters
@@ -56,7 +62,187 @@ class ModelTest(unittest.TestCase):
         self.assertAlmostEquals(model.mode_share[0]["car"], 0.22489513375983478)
         
         print("Model system test done")
-    
+
+    def test_float_precision(self):
+        log.initialize(Config())
+        results_path = os.path.join(TEST_DATA_PATH, "Results")
+        zone_data_path = os.path.join(
+            TEST_DATA_PATH, "Scenario_input_data", "2030_test")
+        base_zone_data_path = os.path.join(
+            TEST_DATA_PATH, "Base_input_data", "2018_zonedata")
+        base_matrices_path = os.path.join(
+            TEST_DATA_PATH, "Base_input_data", "base_matrices")
+        precision = parameters.assignment.float_precision
+        results = {}
+        try:
+            for float_precision in ("float64", "float32"):
+                parameters.assignment.float_precision = float_precision
+                ass_model = MockAssignmentModel(MatrixData(
+                    os.path.join(results_path, "test", "Matrices")))
+                model = ModelSystem(
+                    zone_data_path, base_zone_data_path, base_matrices_path,
+                    results_path, ass_model, "test")
+                self.assertEqual(
+                    model.dtm.demand["aht"]["car_work"].dtype, float_precision)
+                impedance = model.assign_base_demand()
+                model.run_iteration(impedance)
+                results[float_precision] = {
+                    "car_work_demand": model.dtm.old_car_demand.sum(),
+                    "tours": {(purpose.name, mode): tours.sum()
+                        for purpose in model.dm.tour_purposes
+                        for mode, tours in purpose.generated_tours.items()},
+                    "mode_share": model.mode_share[0],
+                }
+        finally:
+            parameters.assignment.float_precision = precision
+        reference = results["float64"]
+        result = results["float32"]
+        self.assertAlmostEqual(
+            result["car_work_demand"] / reference["car_work_demand"], 1,
+            places=5)
+        for key in reference["tours"]:
+            self.assertAlmostEqual(
+                result["tours"][key], reference["tours"][key], places=3)
+        for mode in reference["mode_share"]:
+            self.assertAlmostEqual(
+                result["mode_share"][mode], reference["mode_share"][mode],
+                places=6)
+
+
+    def test_sec_dest_backends(self):
+        log.initialize(Config())
+        results_path = os.path.join(TEST_DATA_PATH, "Results")
+        zone_data_path = os.path.join(
+            TEST_DATA_PATH, "Scenario_input_data", "2030_test")
+        base_zone_data_path = os.path.join(
+            TEST_DATA_PATH, "Base_input_data", "2018_zonedata")
+        base_matrices_path = os.path.join(
+            TEST_DATA_PATH, "Base_input_data", "base_matrices")
+        init_demand = dt.DepartureTimeModel.init_demand
+        demand = {}
+        attracted = {}
+
+        def record_demand(dtm):
+            # Assigned demand is reset after assignment
+            if dtm.demand is not None:
+                demand[backend] = {tp: {ass_class: mtx.copy()
+                        for ass_class, mtx in dtm.demand[tp].items()}
+                    for tp in dtm.demand}
+            return init_demand(dtm)
+
+        batch_cells = parameters.assignment.sec_dest_batch_cells
+        try:
+            # Small batches, so that origins are divided into many blocks
+            parameters.assignment.sec_dest_batch_cells = 200
+            # Pool replacing its workers after each task must not hang
+            replacing_pool = functools.partial(
+                multiprocessing.Pool, maxtasksperchild=1)
+            for backend in ("threads", "batch", "processes", "replacing"):
+                ass_model = MockAssignmentModel(MatrixData(
+                    os.path.join(results_path, "test", "Matrices")))
+                model = ModelSystem(
+                    zone_data_path, base_zone_data_path, base_matrices_path,
+                    results_path, ass_model, "test",
+                    "processes" if backend == "replacing" else backend)
+                impedance = model.assign_base_demand()
+                with mock.patch.object(
+                        dt.DepartureTimeModel, "init_demand", record_demand):
+                    if backend == "replacing":
+                        with mock.patch.object(
+                                sec_dest_pool.multiprocessing, "Pool",
+                                replacing_pool):
+                            model.run_iteration(impedance)
+                    else:
+                        model.run_iteration(impedance)
+                attracted[backend] = {(purpose.name, mode): tours
+                    for purpose in model.dm.tour_purposes
+                    for mode, tours in purpose.attracted_tours.items()}
+        finally:
+            parameters.assignment.sec_dest_batch_cells = batch_cells
+        reference = demand["threads"]
+        self.assertGreater(reference["aht"]["car_leisure"].sum(), 0)
+        for backend in demand:
+            for tp in reference:
+                for ass_class in reference[tp]:
+                    numpy.testing.assert_allclose(
+                        demand[backend][tp][ass_class],
+                        reference[tp][ass_class], rtol=1e-4, atol=1e-6)
+            for key in attracted["threads"]:
+                numpy.testing.assert_allclose(
+                    attracted[backend][key], attracted["threads"][key],
+                    rtol=1e-4)
+
+    def test_resume(self):
+        log.initialize(Config())
+        results_path = os.path.join(TEST_DATA_PATH, "Results")
+        zone_data_path = os.path.join(
+            TEST_DATA_PATH, "Scenario_input_data", "2030_test")
+        base_zone_data_path = os.path.join(
+            TEST_DATA_PATH, "Base_input_data", "2018_zonedata")
+        base_matrices_path = os.path.join(
+            TEST_DATA_PATH, "Base_input_data", "base_matrices")
+        models = []
+        for _ in range(2):
+            ass_model = MockAssignmentModel(MatrixData(
+                os.path.join(results_path, "test", "Matrices")))
+            models.append(ModelSystem(
+                zone_data_path, base_zone_data_path, base_matrices_path,
+                results_path, ass_model, "test"))
+        impedance = models[0].assign_base_demand()
+        impedance = models[0].run_iteration(impedance, 1)
+        models[0].save_checkpoint(impedance, 1)
+        models[0].run_iteration(impedance, 2)
+        impedance, iteration = models[1].resume()
+        self.assertEqual(iteration, 1)
+        self.assertEqual(len(models[1].mode_share), 1)
+        models[1].run_iteration(impedance, 2)
+        self.assertListEqual(models[1].mode_share, models[0].mode_share)
+        numpy.testing.assert_allclose(
+            models[1].convergence.values, models[0].convergence.values)
+        # Checkpoint of another scenario only gives starting state
+        models[1].name = "other"
+        impedance, iteration = models[1].resume()
+        self.assertEqual(iteration, 0)
+        os.remove(models[0].checkpoint_path)
+
+    @mock.patch.object(parameters.assignment, "agent_change_threshold", 0.01)
+    @mock.patch.object(parameters.zone, "population_draw", None)
+    def test_agent_resume(self):
+        log.initialize(Config())
+        results_path = os.path.join(TEST_DATA_PATH, "Results")
+        zone_data_path = os.path.join(
+            TEST_DATA_PATH, "Scenario_input_data", "2030_test")
+        base_zone_data_path = os.path.join(
+            TEST_DATA_PATH, "Base_input_data", "2018_zonedata")
+        base_matrices_path = os.path.join(
+            TEST_DATA_PATH, "Base_input_data", "base_matrices")
+        models = []
+        for _ in range(2):
+            ass_model = MockAssignmentModel(MatrixData(
+                os.path.join(results_path, "test", "Matrices")))
+            models.append(AgentModelSystem(
+                zone_data_path, base_zone_data_path, base_matrices_path,
+                results_path, ass_model, "test"))
+        impedance = models[0].assign_base_demand()
+        impedance = models[0].run_iteration(impedance, 1)
+        models[0].save_checkpoint(impedance, 1)
+        models[0].run_iteration(impedance, 2)
+        impedance, iteration = models[1].resume()
+        self.assertEqual(iteration, 1)
+        # Population with random seed is drawn again with same seed
+        self.assertEqual(models[1].dm.population.rng.seed,
+                         models[0].dm.population.rng.seed)
+        self.assertIsNotNone(models[1].dtm.agent_demand)
+        models[1].run_iteration(impedance, 2)
+        tours = [model.dm.population.tours for model in models]
+        for column in ("person", "purpose", "orig", "dest", "mode"):
+            numpy.testing.assert_array_equal(
+                getattr(tours[1], column), getattr(tours[0], column))
+        self.assertListEqual(models[1].mode_share, models[0].mode_share)
+        numpy.testing.assert_allclose(
+            models[1].convergence.values, models[0].convergence.values)
+        os.remove(models[0].checkpoint_path)
+
     def test_agent_model(self):
         log.initialize(Config())
         results_path = os.path.join(TEST_DATA_PATH, "Results")
@@ -75,6 +261,67 @@ class ModelTest(unittest.TestCase):
         impedance = model.run_iteration(impedance)
         impedance = model.run_iteration(impedance, "last")
 
+    def test_agent_backends(self):
+        log.initialize(Config())
+        results_path = os.path.join(TEST_DATA_PATH, "Results")
+        zone_data_path = os.path.join(
+            TEST_DATA_PATH, "Scenario_input_data", "2030_test")
+        base_zone_data_path = os.path.join(
+            TEST_DATA_PATH, "Base_input_data", "2018_zonedata")
+        base_matrices_path = os.path.join(
+            TEST_DATA_PATH, "Base_input_data", "base_matrices")
+        init_demand = dt.DepartureTimeModel.init_demand
+        demand = {}
+        tours = {}
+
+        def record_demand(dtm):
+            # Assigned demand is reset after assignment
+            if dtm.demand is not None:
+                demand[backend] = {tp: {ass_class: mtx.copy()
+                        for ass_class, mtx in dtm.demand[tp].items()}
+                    for tp in dtm.demand}
+            return init_demand(dtm)
+
+        agent_backend = parameters.assignment.agent_backend
+        # Workers must not depend on state inherited by forking
+        spawn_pool = multiprocessing.get_context("spawn").Pool
+        try:
+            for backend in ("vectorized", "processes", "spawn"):
+                parameters.assignment.agent_backend = (
+                    "vectorized" if backend == "vectorized" else "processes")
+                ass_model = MockAssignmentModel(MatrixData(
+                    os.path.join(results_path, "test", "Matrices")))
+                model = AgentModelSystem(
+                    zone_data_path, base_zone_data_path, base_matrices_path,
+                    results_path, ass_model, "test")
+                impedance = model.assign_base_demand()
+                with mock.patch.object(
+                        dt.DepartureTimeModel, "init_demand", record_demand):
+                    if backend == "spawn":
+                        with mock.patch.object(
+                                agent_pool.multiprocessing, "Pool",
+                                spawn_pool):
+                            model.run_iteration(impedance)
+                    else:
+                        model.run_iteration(impedance)
+                population = model.dm.population
+                tours[backend] = dict(
+                    population.tours.get_columns(),
+                    is_car_user=population.is_car_user.copy())
+        finally:
+            parameters.assignment.agent_backend = agent_backend
+        reference = demand["vectorized"]
+        self.assertGreater(reference["aht"]["car_work"].sum(), 0)
+        for backend in ("processes", "spawn"):
+            for column, values in tours["vectorized"].items():
+                numpy.testing.assert_array_equal(
+                    tours[backend][column], values)
+            for tp in reference:
+                for ass_class in reference[tp]:
+                    numpy.testing.assert_allclose(
+                        demand[backend][tp][ass_class],
+                        reference[tp][ass_class], rtol=1e-6)
+
     def _validate_impedances(self, impedances):
         self.assertIsNotNone(impedances)
         self.assertIs(type(impedances), dict)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy
+import unittest
+from unittest import mock
+import demand.agent_pool as agent_pool
+from demand.sec_dest_pool import SharedArrays, attach
+from datahandling.resultdata import ResultsData
+
+
+class ShareStateTest(unittest.TestCase):
+    def test_share_state(self):
+        for use_out_of_band in {agent_pool._use_out_of_band, False}:
+            with mock.patch.object(
+                    agent_pool, "_use_out_of_band", use_out_of_band):
+                self._check_share_state(use_out_of_band)
+
+    def _check_share_state(self, use_out_of_band):
+        arrays = SharedArrays()
+        resultdata = mock.Mock(spec=ResultsData)
+        state = {
+            "prob": numpy.arange(12, dtype=numpy.float32).reshape(3, 4),
+            "draws": numpy.linspace(0, 1, 5)[::2],
+            "name": "hw",
+            "resultdata": resultdata,
+        }
+        data, positions = agent_pool.share_state(state, arrays)
+        self.assertEqual(len(positions) > 0, use_out_of_band)
+        blocks, attached = attach(arrays.specs)
+        loaded = agent_pool.load_state(data, positions, attached)
+        numpy.testing.assert_array_equal(loaded["prob"], state["prob"])
+        self.assertEqual(loaded["prob"].dtype, numpy.float32)
+        numpy.testing.assert_array_equal(loaded["draws"], state["draws"])
+        self.assertEqual(loaded["name"], "hw")
+        # Result writers are not passed to workers
+        self.assertIsNone(loaded["resultdata"])
+        if use_out_of_band:
+            # Shared arrays must not be modified by workers
+            with self.assertRaises(ValueError):
+                loaded["prob"][0, 0] = 100
+        del loaded, attached
+        for shm in blocks:
+            shm.close()
+        arrays.close()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy
+import unittest
+from unittest import mock
+from utils.counter_rng import CounterRNG
+
+
+class CounterRNGTest(unittest.TestCase):
+    def test_partitioning(self):
+        rng = CounterRNG(31)
+        persons = numpy.arange(1000)
+        draws = rng.uniform("mode", persons, 3)
+        self.assertTrue((draws >= 0).all() and (draws < 1).all())
+        numpy.testing.assert_array_equal(
+            numpy.concatenate([
+                CounterRNG(31).uniform("mode", persons[500:], 3),
+                CounterRNG(31).uniform("mode", persons[:500], 3),
+            ]),
+            numpy.concatenate([draws[500:], draws[:500]]))
+        self.assertFalse(numpy.array_equal(
+            draws, rng.uniform("dest", persons, 3)))
+        self.assertFalse(numpy.array_equal(
+            draws, rng.uniform("mode", persons, 4)))
+        self.assertFalse(numpy.array_equal(
+            draws, CounterRNG(32).uniform("mode", persons, 3)))
+
+    def test_standard_normal(self):
+        draws = CounterRNG(31).standard_normal("income", numpy.arange(10**5))
+        self.assertAlmostEqual(draws.mean(), 0, places=1)
+        self.assertAlmostEqual(draws.std(), 1, places=1)
+
+    def test_random_seed(self):
+        with mock.patch("utils.counter_rng.log") as log:
+            rng = CounterRNG(None)
+        self.assertIsInstance(rng.seed, int)
+        self.assertIn(str(rng.seed), log.info.call_args[0][0])
+        persons = numpy.arange(100)
+        numpy.testing.assert_array_equal(
+            rng.uniform("mode", persons),
+            CounterRNG(rng.seed).uniform("mode", persons))
+        self.assertFalse(numpy.array_equal(
+            rng.uniform("mode", persons),
+            CounterRNG(None).uniform("mode", persons)))
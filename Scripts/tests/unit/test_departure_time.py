@@ -47,3 +47,92 @@ class DepartureTimeTest(unittest.TestCase):
         self.assertEquals(dtm.demand["pt"]["car_leisure"].ndim, 2)
         self.assertEquals(dtm.demand["aht"]["bike_work"].shape[1], 8)
         self.assertNotEquals(dtm.demand["iht"]["car_leisure"][0, 1], 0)
+
+    def test_sec_dest_add(self):
+        class Demand:
+            is_car_passenger = False
+            dest = None
+            def __init__(self, mtx, orig=None):
+                self.purpose = Purpose()
+                self.mode = "car"
+                self.matrix = mtx
+                self.orig = orig
+                self.position = (orig, 1, 1)
+        class Purpose:
+            name = "hoo"
+            bounds = slice(1, 4)
+        mtx = numpy.arange(18, dtype=float)
+        mtx.shape = (2, 3, 3)
+        dtm = DepartureTimeModel(8)
+        for i in range(2):
+            dtm.add_demand(Demand(mtx[i], 2 + i))
+        batch_dtm = DepartureTimeModel(8)
+        batch_dtm.add_sec_dest_demand(
+            Demand(mtx.sum(0)), Demand(mtx.sum(1), 2))
+        for tp in dtm.demand:
+            numpy.testing.assert_allclose(
+                batch_dtm.demand[tp]["car_leisure"],
+                dtm.demand[tp]["car_leisure"], rtol=1e-6)
+
+    def test_tours_bulk_add(self):
+        class Purpose:
+            def __init__(self, name, modes):
+                self.name = name
+                self.modes = modes
+        hoo = Purpose("hoo", ["car", "transit", "bike", "walk"])
+        tour_purposes = [
+            Purpose("hw", ["car", "transit", "bike", "walk"]),
+            Purpose("ho", ["car", "transit", "bike", "walk"]),
+        ]
+        for purpose in tour_purposes:
+            purpose.sec_dest_purpose = hoo
+        class Tour:
+            is_car_passenger = False
+            matrix = numpy.array([[1.0]])
+            def __init__(self, tours, i):
+                self.purpose = tours.purposes[tours.purpose[i]]
+                self.mode = self.purpose.modes[tours.mode[i]]
+                if tours.sec_dest[i] < 0:
+                    self.dest = tours.dest[i]
+                    self.position = (tours.orig[i], tours.dest[i])
+                else:
+                    self.dest = tours.dest[i]
+                    self.position = (
+                        tours.orig[i], tours.dest[i], tours.sec_dest[i])
+        class Tours:
+            purposes = tour_purposes
+            purpose = numpy.array([0, 0, 1, 1, 1, 0])
+            mode = numpy.array([0, 1, 0, 2, 3, 0])
+            orig = numpy.array([0, 1, 2, 2, 3, 4])
+            dest = numpy.array([1, 1, 5, 0, 2, 4])
+            sec_dest = numpy.array([-1, -1, 3, -1, -1, 2])
+            def is_car_passenger(self):
+                return numpy.array([False, False, False, False, False, True])
+            def __getitem__(self, i):
+                return Tour(self, i)
+            def __iter__(self):
+                for i in range(len(self.purpose)):
+                    yield Tour(self, i)
+        tours = Tours()
+        dtm = DepartureTimeModel(8)
+        for tour, is_car_passenger in zip(tours, tours.is_car_passenger()):
+            if not is_car_passenger:
+                dtm.add_demand(tour)
+        batch_dtm = DepartureTimeModel(8)
+        batch_dtm.add_tours_bulk(tours)
+        for tp in dtm.demand:
+            for ass_class in dtm.demand[tp]:
+                numpy.testing.assert_allclose(
+                    batch_dtm.demand[tp][ass_class],
+                    dtm.demand[tp][ass_class], rtol=1e-6)
+        # Removing and simulating again the same tours keeps demand
+        simulated = numpy.array([True, False, True, False, False, True])
+        agent_dtm = DepartureTimeModel(8)
+        agent_dtm.update_agent_demand(tours)
+        agent_dtm.init_demand()
+        agent_dtm.update_agent_demand(tours, simulated, tours, simulated)
+        for tp in dtm.demand:
+            for ass_class in dtm.demand[tp]:
+                numpy.testing.assert_allclose(
+                    agent_dtm.demand[tp][ass_class],
+                    dtm.demand[tp][ass_class], rtol=1e-6, atol=1e-6)
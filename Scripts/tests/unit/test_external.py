@@ -0,0 +1,35 @@
+import os
+import unittest
+import numpy
+import pandas
+
+from datahandling.matrixdata import MatrixData
+from datahandling.zonedata import ZoneData
+from demand.external import ExternalModel
+
+TEST_DATA_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "test_data")
+ZONE_NUMBERS = numpy.array([102, 103, 244, 1063, 1531, 2703, 2741, 6272, 6291, 19071, 31102, 31500])
+
+
+class ExternalModelTest(unittest.TestCase):
+    def test_calc_external(self):
+        zone_data = ZoneData(
+            os.path.join(TEST_DATA_PATH, "Scenario_input_data", "2030_test"),
+            ZONE_NUMBERS)
+        base_matrices = MatrixData(
+            os.path.join(TEST_DATA_PATH, "Base_input_data", "base_matrices"))
+        model = ExternalModel(base_matrices, zone_data, ZONE_NUMBERS)
+        internal_trips = pandas.Series(
+            numpy.arange(1.0, zone_data.zone_numbers.size + 1),
+            zone_data.zone_numbers)
+        demand = model.calc_external("car", internal_trips)
+        base_mtx = base_matrices.get_external("car")
+        self.assertIs(base_matrices.get_external("car"), base_mtx)
+        mtx = pandas.DataFrame(demand.matrix.T, ZONE_NUMBERS, zone_data.externalgrowth.index)
+        growth = zone_data.externalgrowth["car"].to_numpy()
+        # Municipality trips are divided between its zones by internal trips
+        helsinki = mtx.loc[0:1999]
+        numpy.testing.assert_allclose(
+            helsinki.sum(), growth * base_mtx.loc["Helsinki"].to_numpy())
+        numpy.testing.assert_allclose(
+            helsinki.loc[103] / helsinki.loc[102], 2.0)
@@ -0,0 +1,87 @@
+import os
+import unittest
+from unittest import mock
+import numpy
+import pandas
+
+from utils.freight import balance, fratar
+from utils.memory import float_dtype
+from datahandling.matrixdata import MatrixData
+from datahandling.zonedata import BaseZoneData, ZoneData
+from demand.freight import FreightModel
+
+TEST_DATA_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "test_data")
+ZONE_NUMBERS = numpy.array([102, 103, 244, 1063, 1531, 2703, 2741, 6272, 6291, 19071, 31102, 31500])
+
+
+class FreightTest(unittest.TestCase):
+    def test_balance(self):
+        trips = numpy.array([
+            [1.0, 2.0, 3.0],
+            [4.0, 5.0, 6.0],
+            [7.0, 8.0, 9.0],
+        ])
+        production = numpy.array([10.0, 20.0, 30.0])
+        attraction = numpy.array([30.0, 20.0, 10.0])
+        iterations, residual = balance(
+            trips, production, attraction, 100, 1e-8)
+        self.assertLess(iterations, 100)
+        self.assertLess(residual, 1e-8)
+        numpy.testing.assert_allclose(trips.sum(1), production, rtol=1e-8)
+        numpy.testing.assert_allclose(trips.sum(0), attraction, rtol=1e-8)
+        # Already balanced matrix needs only one pass
+        self.assertEqual(
+            balance(trips, production, attraction, 100, 1e-8)[0], 1)
+        trips = numpy.ones((3, 3))
+        self.assertEqual(balance(trips, production, attraction, 2, 0)[0], 2)
+
+    def test_balance_matching_rows(self):
+        # Row sums already match production, column sums do not
+        trips = numpy.array([
+            [1.0, 5.0, 0.0],
+            [0.0, 1.0, 1.0],
+            [2.0, 0.0, 2.0],
+        ])
+        production = trips.sum(1)
+        attraction = numpy.array([6.0, 2.0, 4.0])
+        iterations, residual = balance(
+            trips, production, attraction, 100, 1e-8)
+        self.assertGreater(iterations, 0)
+        self.assertLess(residual, 1e-8)
+        numpy.testing.assert_allclose(trips.sum(1), production, rtol=1e-8)
+        numpy.testing.assert_allclose(trips.sum(0), attraction, rtol=1e-8)
+
+    def test_fratar(self):
+        zones = [101, 102, 103]
+        trips = pandas.DataFrame(
+            numpy.arange(1.0, 10.0).reshape(3, 3), zones, zones)
+        target = pandas.Series([10.0, 20.0, 30.0], zones)
+        demand = fratar(target, trips)
+        numpy.testing.assert_array_equal(demand.index, zones)
+        numpy.testing.assert_allclose(demand.sum(1), target, rtol=1e-4)
+        numpy.testing.assert_allclose(demand.sum(0), target, rtol=1e-4)
+        self.assertEqual(demand.values.dtype, float_dtype())
+        # Seed matrix is not modified
+        self.assertEqual(trips.iloc[0, 0], 1.0)
+        with mock.patch("utils.freight.log") as log:
+            fratar(target, trips, max_iter=1)
+        log.warn.assert_called_once()
+
+    def test_freight_model_cache(self):
+        base_data = BaseZoneData(
+            os.path.join(TEST_DATA_PATH, "Base_input_data", "2018_zonedata"),
+            ZONE_NUMBERS)
+        forecast_data = ZoneData(
+            os.path.join(TEST_DATA_PATH, "Scenario_input_data", "2030_test"),
+            ZONE_NUMBERS)
+        base_matrices = MatrixData(
+            os.path.join(TEST_DATA_PATH, "Base_input_data", "base_matrices"))
+        demand = FreightModel(
+            base_data, forecast_data, base_matrices).calc_freight_traffic("truck")
+        model = FreightModel(base_data, forecast_data, base_matrices)
+        def calc(*args):
+            raise AssertionError("Freight demand not cached")
+        model._calc_freight_traffic = calc
+        cached = model.calc_freight_traffic("truck")
+        numpy.testing.assert_array_equal(cached.matrix, demand.matrix)
+        self.assertIsNot(cached.matrix, demand.matrix)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy
+import unittest
+from transform.impedance_transformer import ImpedanceTransformer
+
+
+class ImpedanceTransformerTest(unittest.TestCase):
+    def test_transform_cache(self):
+        class ZoneData:
+            nr_zones = 4
+        class Purpose:
+            zone_data = ZoneData()
+            bounds = slice(0, 3)
+            sub_bounds = [slice(0, 2), slice(2, 3)]
+            area = "metropolitan"
+            def __init__(self, name):
+                self.name = name
+        mtx = numpy.arange(16, dtype=numpy.float32)
+        mtx.shape = (4, 4)
+        impedance = {tp: {mtx_type: {ass_class: mtx
+                    for ass_class in ("car_work", "car_leisure",
+                                      "transit_work", "transit_leisure",
+                                      "bike", "walk")}
+                for mtx_type in ("time", "cost", "dist")}
+            for tp in ("aht", "pt", "iht")}
+        imptrans = ImpedanceTransformer()
+        hw = imptrans.transform(Purpose("hw"), impedance)
+        misses = imptrans.cache_misses
+        hc = imptrans.transform(Purpose("hc"), impedance)
+        self.assertGreater(imptrans.cache_hits, 0)
+        self.assertLess(imptrans.cache_misses, 2*misses)
+        # Bike impedance shares are the same for both purposes
+        self.assertIs(hw["bike"]["dist"], hc["bike"]["dist"])
+        self.assertFalse(hw["car"]["time"].flags.writeable)
+        share = (0.746026+0.234217+0.019757, 0.015065+0.329877+0.655057)
+        expected = share[0]*mtx[:3, :] + share[1]*mtx[:, :3].T
+        numpy.testing.assert_allclose(hw["car"]["time"], expected, rtol=1e-6)
+        expected[2, :] /= 44
+        expected[:2, :] /= 60
+        numpy.testing.assert_allclose(
+            hw["transit"]["cost"], expected, rtol=1e-6)
+        imptrans.clear_cache()
+        self.assertEqual(imptrans.cache_hits, 0)
@@ -3,15 +3,17 @@
 import numpy
 import pandas
 import unittest
-from datatypes.person import Person
+from datatypes.population import Population, TourTable
+from utils.counter_rng import CounterRNG
 
 
 class PersonTest(unittest.TestCase):
     def test_add_tours(self):
         class ZoneData:
+                zone_numbers = numpy.array([101, 102, 103, 104])
                 def zone_index(self, zonenumber):
                     try:
-                        return zonenumber - 100
+                        return zonenumber - 101
                     except TypeError:
                         raise KeyError()
         class GenMod:
@@ -26,11 +28,11 @@ class PersonTest(unittest.TestCase):
             gen_model = GenMod()
             def __init__(self, name):
                 self.name = name
-        class Zone:
-            number = 101
-            index = 0
-        p = Person(Zone(), (18, 29), GenMod(), None, ZoneData())
-        p.is_car_user = True
+        population = Population(
+            ZoneData(), [(7, 17), (18, 29)], numpy.array([0, 0, 2, 3]),
+            numpy.array([1, 1, 1, 0]), numpy.array([0, 1, 0, 0]), GenMod(),
+            None, [None, None], CounterRNG(0))
+        population.is_car_user[:] = True
         purposes = {
             "hw": Purpose("hw"),
             "ho": Purpose("ho"),
@@ -43,6 +45,105 @@ class PersonTest(unittest.TestCase):
             [0.3, 0.6, 1.0],
             [0.3, 0.6, 1.0],
         ])
-        probs = {"age_18-29": {True: data}}
-        p.add_tours(purposes, probs)
-        p.add_tours(purposes, probs)
+        probs = {
+            "age_7-17": {True: data, False: data},
+            "age_18-29": {True: data, False: data},
+        }
+        population.tours.generate(purposes, probs)
+        columns = {column: values.copy() for column, values
+            in population.tours.get_columns().items()}
+        parts = []
+        for persons in population.zone_blocks(2):
+            subset = population.subset(persons)
+            subset.tours.generate(purposes, probs)
+            parts.append((persons.start, subset.tours.get_columns()))
+        self.assertEqual(len(parts), 2)
+        population.tours.merge(purposes, parts)
+        for column, values in population.tours.get_columns().items():
+            numpy.testing.assert_array_equal(values, columns[column])
+        draws = population.tours.draw["mode"].copy()
+        nr_tours = len(population.tours)
+        population.tours.generate(purposes, probs)
+        self.assertEqual(len(population.tours), nr_tours)
+        numpy.testing.assert_array_equal(
+            population.tours.draw["mode"], draws)
+        for person in population:
+            tours = person.tours
+            self.assertEqual(tours[0].purpose_name, "hw")
+            for tour in tours:
+                self.assertEqual(tour.person_id, person.id)
+                self.assertEqual(
+                    tour.position, (population.zone_index[person.id],))
+
+    def test_recycle_choices(self):
+        class ZoneData:
+            zone_numbers = numpy.array([101, 102, 103])
+        class Model:
+            def __init__(self, cumul_dest_prob):
+                self.cumul_dest_prob = {"car": cumul_dest_prob}
+            def calc_individual_mode_prob(self, is_car_user, zones):
+                probs = numpy.full((len(zones), 2), 0.5)
+                return probs, numpy.ones(len(zones))
+        class Purpose:
+            modes = ["car", "transit"]
+            bounds = slice(0, 3)
+            def __init__(self, cumul_dest_prob):
+                self.model = Model(cumul_dest_prob)
+        # Cumulative destination probabilities, origins as columns
+        old_probs = numpy.array([
+            [0.3, 0.3, 0.3],
+            [0.6, 0.6, 0.6],
+            [1.0, 1.0, 1.0],
+        ])
+        # Probabilities from origin zone 2 have changed
+        new_probs = old_probs.copy()
+        new_probs[:, 2] = [0.1, 0.2, 1.0]
+        population = Population(
+            ZoneData(), [(18, 29)], numpy.array([0, 2, 1, 0, 0]),
+            numpy.zeros(5), numpy.arange(5), None, None, [None],
+            CounterRNG(0))
+        tours = population.tours
+        tours.purposes = [Purpose(old_probs)]
+        tours._init_columns(5)
+        tours.person[:] = numpy.arange(5)
+        tours.key[:] = [0, 0, 0, 0, 0]
+        tours.orig[:] = population.zone_index
+        tours.dest[:] = [1, 0, 2, 0, 1]
+        tours.sec_dest[:] = [1, -1, -1, -1, -1]
+        tours.mode[:] = 0
+        tours.mode_bounds[:] = [0.0, 0.5]
+        tours.dest_bounds[:] = TourTable._bounds(
+            old_probs, tours.dest, tours.orig)
+        previous = tours.snapshot()
+        # Person 3 becomes car user, person 4 makes another tour
+        population.is_car_user[3] = True
+        tours.purposes = [Purpose(new_probs)]
+        tours._init_columns(5)
+        tours.person[:] = numpy.arange(5)
+        tours.key[:] = [0, 0, 0, 0, 1]
+        tours.orig[:] = population.zone_index
+        simulated, removed = tours.recycle_choices(previous, 0.1)
+        # Tour from unchanged zone 0 to unchanged zone 1 keeps its choices,
+        # tours from and to changed zone 2 are redrawn
+        numpy.testing.assert_array_equal(
+            simulated, [False, True, True, True, True])
+        numpy.testing.assert_array_equal(
+            removed, [False, True, True, True, True])
+        numpy.testing.assert_array_equal(tours.mode, [0, -1, -1, -1, -1])
+        numpy.testing.assert_array_equal(tours.dest, [1, -1, -1, -1, -1])
+        numpy.testing.assert_array_equal(tours.sec_dest, [1, -1, -1, -1, -1])
+        numpy.testing.assert_array_equal(
+            tours.mode_bounds[0], previous.mode_bounds[0])
+        numpy.testing.assert_array_equal(
+            tours.dest_bounds[0], previous.dest_bounds[0])
+        self.assertEqual(tours.total_access[0], 1)
+        # Without change over threshold, all existing tours are recycled
+        tours.purposes = [Purpose(new_probs)]
+        tours._init_columns(5)
+        tours.person[:] = numpy.arange(5)
+        tours.key[:] = [0, 0, 0, 0, 1]
+        tours.orig[:] = population.zone_index
+        simulated, _ = tours.recycle_choices(previous, 0.5)
+        numpy.testing.assert_array_equal(
+            simulated, [False, False, False, True, True])
+        numpy.testing.assert_array_equal(tours.dest, [1, 0, 2, -1, -1])
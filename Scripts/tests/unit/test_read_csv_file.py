@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+import pandas
+
+import parameters.zone as param
+from utils.read_csv_file import read_csv_file, weighted_avg
+
+TEST_DATA_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "test_data")
+ZONE_NUMBERS = numpy.array([102, 103, 244, 1063, 1531, 2703, 2741, 6272, 6291, 19071])
+
+
+class ReadCsvFileTest(unittest.TestCase):
+    def test_cache(self):
+        cache_dir = param.zone_data_cache_dir
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            data_dir = os.path.join(tmp_dir, "zonedata")
+            shutil.copytree(
+                os.path.join(TEST_DATA_PATH, "Scenario_input_data", "2030_test"),
+                data_dir)
+            param.zone_data_cache_dir = os.path.join(tmp_dir, "cache")
+            try:
+                data = read_csv_file(data_dir, ".pop", ZONE_NUMBERS, numpy.float32)
+                self.assertListEqual(
+                    [os.path.splitext(f)[1]
+                        for f in os.listdir(param.zone_data_cache_dir)],
+                    [".npz"])
+                cached = read_csv_file(data_dir, ".pop", ZONE_NUMBERS, numpy.float32)
+                pandas.testing.assert_frame_equal(cached, data)
+                self.assertEqual(len(os.listdir(param.zone_data_cache_dir)), 1)
+                # Other arguments or changed files are not read from cache
+                read_csv_file(data_dir, ".pop", ZONE_NUMBERS)
+                self.assertEqual(len(os.listdir(param.zone_data_cache_dir)), 2)
+                with open(os.path.join(data_dir, "2030.pop"), "a") as f:
+                    f.write("\n")
+                read_csv_file(data_dir, ".pop", ZONE_NUMBERS, numpy.float32)
+                self.assertEqual(len(os.listdir(param.zone_data_cache_dir)), 3)
+                # Data with integer column labels
+                trucks = read_csv_file(data_dir, ".trk", squeeze=True)
+                pandas.testing.assert_frame_equal(
+                    read_csv_file(data_dir, ".trk", squeeze=True), trucks)
+                self.assertEqual(len(os.listdir(param.zone_data_cache_dir)), 4)
+                # Data with text columns is not cached
+                fares = read_csv_file(data_dir, ".tco")
+                pandas.testing.assert_frame_equal(
+                    read_csv_file(data_dir, ".tco"), fares)
+                self.assertEqual(len(os.listdir(param.zone_data_cache_dir)), 4)
+                param.zone_data_cache_dir = None
+                pandas.testing.assert_frame_equal(
+                    read_csv_file(data_dir, ".pop", ZONE_NUMBERS, numpy.float32),
+                    data)
+            finally:
+                param.zone_data_cache_dir = cache_dir
+
+    def test_weighted_avg(self):
+        data = pandas.DataFrame({
+                "total": [10, 30, 0, 0, 5],
+                "sh_a": [0.5, 0.1, 0.3, 0.7, 0.2],
+            },
+            [1, 2, 3, 4, 5])
+        mapping = pandas.Series([102, 101, 102, 103], [1, 2, 3, 4], name="zone")
+        aggregated = weighted_avg(data, mapping, "total")
+        numpy.testing.assert_array_equal(aggregated.index, [101, 102, 103])
+        self.assertEqual(aggregated.index.name, "zone")
+        self.assertEqual(aggregated.index.dtype, mapping.dtype)
+        numpy.testing.assert_array_equal(aggregated["total"], [30, 10, 0])
+        self.assertEqual(aggregated["total"].dtype, data["total"].dtype)
+        numpy.testing.assert_allclose(aggregated["sh_a"], [0.1, 0.5, 0])
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+import unittest
+import pandas
+import datahandling.resultdata as resultdata
+from datahandling.resultdata import ResultsData, export_results
+
+
+class ResultsDataTest(unittest.TestCase):
+    def _print_results(self, path, result_format):
+        results = ResultsData(path, result_format)
+        results.print_data(
+            pandas.Series([1.0, 2.0], ["b", "a"]), "areas.txt", "x")
+        results.print_data(
+            pandas.Series([3.0, 4.0], ["b", "a"]), "areas.txt", "y")
+        results.print_data(
+            pandas.Series([5.0, 6.0], ["a", "c"]), "areas.txt", "z")
+        mtx = pandas.DataFrame(
+            [[1.5, 2.5], [3.5, 4.5], [5.5, 6.5]],
+            ["helsinki", "espoo", "vantaa"], ["car", "transit"])
+        results.print_matrix(mtx, "aggregated_demand", "hw_car")
+        results.print_matrix(2 * mtx, "aggregated_demand", "hc_car")
+        for start in (0, 2):
+            results.print_table(pandas.DataFrame(
+                {"mode": ["car", "walk"], "cost": [start + 0.5, 1.25]},
+                pandas.RangeIndex(start, start + 2, name="id"),
+                ["mode", "cost"]), "agents")
+        results.flush()
+
+    def test_txt(self):
+        with tempfile.TemporaryDirectory() as path:
+            self._print_results(path, "txt")
+            df = pandas.read_csv(
+                os.path.join(path, "areas.txt"), sep='\t', index_col=0)
+            self.assertListEqual(list(df.index), ["a", "b", "c"])
+            self.assertListEqual(list(df.columns), ["x", "y", "z"])
+            self.assertEqual(df.at["a", "y"], 4.0)
+            self.assertTrue(pandas.isna(df.at["c", "x"]))
+            with open(os.path.join(path, "aggregated_demand.txt")) as f:
+                lines = f.read().splitlines()
+            self.assertEqual(len(lines), 12)
+            self.assertEqual(lines[0], "helsinki\tcar\thw\tcar\t1.5")
+            self.assertEqual(lines[3], "helsinki\ttransit\thw\tcar\t2.5")
+            self.assertEqual(lines[-1], "vantaa\ttransit\thc\tcar\t13.0")
+            with open(os.path.join(path, "agents.txt")) as f:
+                lines = f.read().splitlines()
+            self.assertEqual(len(lines), 5)
+            self.assertEqual(lines[0], "id\tmode\tcost")
+            self.assertEqual(lines[3], "2\tcar\t2.50000")
+
+    def test_export(self):
+        with tempfile.TemporaryDirectory() as path:
+            self._print_results(os.path.join(path, "txt"), "txt")
+            for result_format in resultdata.COLUMNAR_FORMATS:
+                if not resultdata.format_available(result_format):
+                    continue
+                export_path = os.path.join(path, result_format)
+                self._print_results(export_path, result_format)
+                self.assertFalse(
+                    os.path.exists(os.path.join(export_path, "areas.txt")))
+                export_results(export_path)
+                for filename in ("areas.txt", "aggregated_demand.txt",
+                                 "agents.txt"):
+                    with open(os.path.join(path, "txt", filename)) as f:
+                        expected = f.read()
+                    with open(os.path.join(export_path, filename)) as f:
+                        self.assertEqual(f.read(), expected, result_format)
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy
+import unittest
+from unittest import mock
+import demand.sec_dest_pool as sec_dest_pool
+
+
+class SharedArraysTest(unittest.TestCase):
+    def test_shared_arrays(self):
+        for use_shared_memory in {sec_dest_pool._use_shared_memory, False}:
+            with mock.patch.object(
+                    sec_dest_pool, "_use_shared_memory", use_shared_memory):
+                self._check_shared_arrays()
+
+    def _check_shared_arrays(self):
+        arrays = sec_dest_pool.SharedArrays()
+        mtx = numpy.arange(12, dtype=numpy.float32).reshape(3, 4)
+        shared = arrays.add("time", mtx)
+        out = arrays.zeros("demand", (2, 3), numpy.float64)
+        blocks, attached = sec_dest_pool.attach(arrays.specs)
+        numpy.testing.assert_array_equal(attached["time"], mtx)
+        self.assertEqual(attached["time"].dtype, numpy.float32)
+        attached["time"][0, 0] = 100
+        self.assertEqual(shared[0, 0], 100)
+        numpy.testing.assert_array_equal(attached["demand"], 0)
+        attached["demand"] += 1
+        numpy.testing.assert_array_equal(out, 1)
+        del attached
+        for shm in blocks:
+            shm.close()
+        del shared, out
+        arrays.close()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy
+import unittest
+from unittest import mock
+import models.utility as utility
+from models.utility import UtilityKernel
+from datatypes.block_matrix import BlockDiagonalMatrix
+
+
+class UtilityKernelTest(unittest.TestCase):
+    def test_kernel_calc(self):
+        mtx = numpy.arange(90, dtype=numpy.float32)
+        mtx.shape = (9, 10)
+        dist = numpy.flip(mtx, 1).copy()
+        attraction = numpy.linspace(0, 1, 10)
+        own_zone = numpy.eye(9, 10, dtype=bool)
+        row_param = numpy.array([-0.1]*7 + [-0.2]*2)[:, numpy.newaxis]
+        municipality = numpy.array([0, 0, 1, 1, 1, 2, 2, -1, -1, 3])
+        own = ((municipality[:9, numpy.newaxis] == municipality)
+               & (municipality >= 0))
+        expected = numpy.exp(
+            0.5 + row_param*mtx + 2*attraction + (-1.5)*own_zone
+            + 0.2*own_zone*attraction + 0.3*(~own)*attraction)
+        expected *= numpy.power(dist + 1, -0.8)
+        expected[dist > 80] = 0
+        for numexpr_installed in (utility._use_numexpr, False):
+            with mock.patch.object(
+                    utility, "_use_numexpr", numexpr_installed), \
+                 mock.patch.object(utility, "BLOCK_SIZE", 20):
+                self._check_kernel(
+                    mtx, dist, attraction, own_zone, row_param,
+                    municipality, expected)
+
+    def _check_kernel(self, mtx, dist, attraction, own_zone, row_param,
+                      municipality, expected):
+        kernel = UtilityKernel(numpy.empty_like(mtx))
+        kernel.add_linear(0.5)
+        kernel.add_linear(row_param, mtx)
+        kernel.add_linear(2, attraction)
+        kernel.add_linear(-1.5, own_zone)
+        zone_index = numpy.arange(10)
+        kernel.add_linear(0.2, BlockDiagonalMatrix(
+            zone_index, zone_index, attraction, 0)[:9, :])
+        kernel.add_linear(0.3, BlockDiagonalMatrix(
+            municipality, municipality, 0, attraction)[:9, :])
+        kernel.add_power(-0.8, dist)
+        kernel.set_mask(dist, 80)
+        exps = kernel.evaluate()
+        self.assertEqual(exps.dtype, numpy.float32)
+        numpy.testing.assert_allclose(exps, expected, rtol=1e-5)
+        kernel = UtilityKernel(numpy.empty(9))
+        kernel.add_linear(row_param[:, 0])
+        kernel.add_linear(3, numpy.arange(9))
+        numpy.testing.assert_allclose(
+            kernel.evaluate(exponentiate=False),
+            row_param[:, 0] + 3*numpy.arange(9))
+
+    def test_max_operands(self):
+        mtx = numpy.linspace(0, 1, 20, dtype=numpy.float32).reshape(4, 5)
+        # Each term has two operands (coefficient and data),
+        # so 16 terms and output array exceed 32 operands
+        for nr_terms in (15, 16, 17):
+            kernel = UtilityKernel(numpy.empty_like(mtx))
+            for i in range(nr_terms):
+                kernel.add_linear(0.01 * i, mtx + i)
+            numpy.testing.assert_allclose(
+                kernel.evaluate(),
+                numpy.exp(sum(0.01*i*(mtx + i) for i in range(nr_terms))),
+                rtol=1e-5)
+
+    def test_empty_output(self):
+        mtx = numpy.ones((0, 5), dtype=numpy.float32)
+        kernel = UtilityKernel(numpy.empty_like(mtx))
+        kernel.add_linear(0.5, mtx)
+        kernel.add_power(-0.8, mtx)
+        self.assertEqual(kernel.evaluate().shape, (0, 5))
+        # Constant-only utility, e.g., for an origin without tours
+        kernel = UtilityKernel(numpy.empty(0))
+        kernel.add_linear(0.5)
+        self.assertEqual(kernel.evaluate().shape, (0,))
@@ -0,0 +1,113 @@
+import numpy
+import pandas
+import shutil
+import tempfile
+import unittest
+from datahandling.zonedata import (
+    BaseZoneData, ZoneData, ZoneDataError, input_digest, validated_path)
+import parameters.zone as param
+import os
+
+TEST_DATA_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "test_data")
+INTERNAL_ZONES = [102, 103, 244, 1063, 1531, 2703, 2741, 6272, 6291, 19071]
+EXTERNAL_ZONES = [31102, 31500]
+
+
+class ZoneDataTest(unittest.TestCase):
+    def test_get_data(self):
+        zi = numpy.array(INTERNAL_ZONES + EXTERNAL_ZONES)
+        zd = BaseZoneData(os.path.join(TEST_DATA_PATH, "Base_input_data", "2018_zonedata"), zi)
+        bounds = slice(2, 8)
+        municipality = numpy.array(
+            [zd.zones[number].municipality for number in zd.zone_numbers])
+        own_municipality = municipality[:, numpy.newaxis] == municipality
+        numpy.testing.assert_array_equal(zd["own"], own_municipality)
+        numpy.testing.assert_array_equal(zd["other"], ~own_municipality)
+        own = zd.get_data("population_own", bounds)
+        numpy.testing.assert_array_equal(
+            own, (own_municipality * zd["population"].values)[bounds, :])
+        self.assertIs(zd.get_data("population_own", bounds), own)
+        numpy.testing.assert_array_equal(
+            zd.get_data("own_zone_area", bounds),
+            numpy.eye(len(zi) - 2)[bounds, :] * zd["zone_area"].values)
+        density = zd.get_data("car_density", bounds, generation=True)
+        self.assertIs(
+            zd.get_data("car_density", bounds, generation=True), density)
+        self.assertFalse(density.flags.writeable)
+        zd["car_density"] = 2 * zd["car_density"]
+        numpy.testing.assert_array_equal(
+            zd.get_data("car_density", bounds, generation=True), 2 * density)
+        # Data set directly also replaces cached data
+        zd._values["population"] = pandas.Series(1.0, zd.zone_numbers)
+        numpy.testing.assert_array_equal(
+            zd.get_data("population_own", bounds), zd["own"][bounds, :])
+
+    def test_validation(self):
+        zi = numpy.array(INTERNAL_ZONES + EXTERNAL_ZONES)
+        zd = BaseZoneData(os.path.join(TEST_DATA_PATH, "Base_input_data", "2018_zonedata"), zi)
+        data = pandas.Series([1.0, -1.0, numpy.inf, -2.0], [102, 103, 244, 1063])
+        with self.assertRaises(ZoneDataError) as cm:
+            zd["population"] = data
+        self.assertEqual(set(cm.exception.problems), {
+            "is not a finite number", "is negative"})
+        numpy.testing.assert_array_equal(
+            cm.exception.zones, [103, 244, 1063])
+        with self.assertRaises(ValueError):
+            zd.share["share_female"] = pandas.Series([0.5, 1.1], [102, 103])
+        with self.assertRaises(TypeError):
+            zd["population"] = pandas.Series([1.0, "x"], [102, 103])
+
+    def test_lenient_validation(self):
+        zi = numpy.array(INTERNAL_ZONES + EXTERNAL_ZONES)
+        cache_dir = param.zone_data_cache_dir
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            data_dir = os.path.join(tmp_dir, "zonedata")
+            os.mkdir(data_dir)
+            src = os.path.join(TEST_DATA_PATH, "Base_input_data", "2018_zonedata")
+            for file_name in os.listdir(src):
+                shutil.copy(os.path.join(src, file_name), data_dir)
+            param.zone_data_cache_dir = None
+            # Without cache directory, nothing is stored
+            BaseZoneData(data_dir, zi, "lenient")
+            self.assertListEqual(
+                sorted(os.listdir(data_dir)), sorted(os.listdir(src)))
+            param.zone_data_cache_dir = os.path.join(tmp_dir, "cache")
+            try:
+                self._check_lenient_validation(src, data_dir, zi)
+            finally:
+                param.zone_data_cache_dir = cache_dir
+
+    def _check_lenient_validation(self, src, data_dir, zi):
+        BaseZoneData(data_dir, zi, "lenient")
+        # Input data directory is not written to
+        self.assertListEqual(
+            sorted(os.listdir(data_dir)), sorted(os.listdir(src)))
+        validated = validated_path(data_dir, "BaseZoneData")
+        with open(validated) as f:
+            self.assertEqual(f.read(), input_digest(src, zi, "BaseZoneData"))
+        car_path = os.path.join(data_dir, "2016.car")
+        with open(car_path) as f:
+            lines = f.read().replace("102\t0\t0.256", "102\t0\t-0.256")
+        with open(car_path, "w") as f:
+            f.write(lines)
+        # Changed files are validated again
+        with self.assertRaises(ZoneDataError):
+            BaseZoneData(data_dir, zi, "lenient")
+        # Data validated as forecast zone data is checked as base data
+        ZoneData(data_dir, zi, "lenient")
+        with self.assertRaises(ZoneDataError):
+            BaseZoneData(data_dir, zi, "lenient")
+        # Checks are skipped for files marked as validated
+        with open(validated, "w") as f:
+            f.write(input_digest(data_dir, zi, "BaseZoneData"))
+        zd = BaseZoneData(data_dir, zi, "lenient")
+        self.assertLess(zd["car_density"][102], 0)
+        # Other directories with same files are not marked as validated
+        other_dir = os.path.join(os.path.dirname(data_dir), "other")
+        shutil.copytree(data_dir, other_dir)
+        with self.assertRaises(ZoneDataError):
+            BaseZoneData(other_dir, zi, "lenient")
+        with self.assertRaises(ZoneDataError):
+            BaseZoneData(data_dir, zi, "strict")
+        with self.assertRaises(ValueError):
+            BaseZoneData(data_dir, zi, "moderate")
@@ -1,16 +1,40 @@
-from collections import defaultdict
+from typing import Any, Dict, Tuple
 import numpy # type: ignore
 
+import utils.log as log
+from utils.memory import float_dtype
 import parameters.impedance_transformation as param
 from parameters.assignment import assignment_classes
 
 
 class ImpedanceTransformer:
+    """Transformer from time-period impedance to day impedance.
+
+    Day-weighted matrices are cached by time-period shares,
+    assignment class, matrix type and zone bounds, so that purposes
+    with identical specifications share the same (read-only) buffers.
+    The cache is valid for one set of time-period impedance matrices
+    and should be cleared between iterations with `clear_cache()`.
+    """
+
     def __init__(self):
-        pass
+        self._cache: Dict[Tuple, numpy.ndarray] = {}
+        self._impedance = None
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def clear_cache(self):
+        """Empty transform cache and log cache statistics."""
+        if self.cache_hits or self.cache_misses:
+            log.info("Impedance transform cache: {} hits, {} misses".format(
+                self.cache_hits, self.cache_misses))
+        self._cache = {}
+        self._impedance = None
+        self.cache_hits = 0
+        self.cache_misses = 0
 
     def transform(self, purpose, impedance):
-        """Perform transformation from time period dependent matrices 
+        """Perform transformation from time period dependent matrices
         to aggregate impedance matrices for specific travel purpose.
 
         Transform transit costs from (eur/month) to (eur/day).
@@ -22,37 +46,87 @@ class ImpedanceTransformer:
             Time period (aht/pt/iht) : dict
                 Type (time/cost/dist) : dict
                     Assignment class (car_work/transit/...) : numpy 2d matrix
-        Return 
+        Return
         ------
-        dict 
+        dict
             Mode (car/transit/bike/walk) : dict
-                Type (time/cost/dist) : numpy 2-d matrix
+                Type (time/cost/dist) : numpy 2-d matrix (read-only)
         """
+        if impedance is not self._impedance:
+            self.clear_cache()
+            self._impedance = impedance
         rows = purpose.bounds
         cols = (purpose.bounds if purpose.name == "hoo"
             else slice(0, purpose.zone_data.nr_zones))
         day_imp = {}
         impedance_share = param.impedance_share
         for mode in impedance_share[purpose.name]:
-            day_imp[mode] = defaultdict(float)
+            day_imp[mode] = {}
             if mode in param.divided_classes:
                 ass_class = "{}_{}".format(
                     mode, assignment_classes[purpose.name])
             else:
                 ass_class = mode
+            share = impedance_share[purpose.name][mode]
             for time_period in impedance:
                 for mtx_type in impedance[time_period]:
-                    if ass_class in impedance[time_period][mtx_type]:
-                        share = impedance_share[purpose.name][mode][time_period]
-                        imp = impedance[time_period][mtx_type][ass_class]
-                        day_imp[mode][mtx_type] += share[0] * imp[rows, cols]
-                        day_imp[mode][mtx_type] += share[1] * imp[cols, rows].T
+                    if (ass_class in impedance[time_period][mtx_type]
+                            and mtx_type not in day_imp[mode]):
+                        day_imp[mode][mtx_type] = self._day_impedance(
+                            impedance, share, ass_class, mtx_type, rows, cols)
         # transit cost to eur per day
         trips_month = (param.transit_trips_per_month
             [purpose.area][assignment_classes[purpose.name]])
-        trips_per_month = numpy.full_like(
-            day_imp["transit"]["cost"], trips_month[0])
-        for i in range(1, len(purpose.sub_bounds)):
-            trips_per_month[purpose.sub_bounds[i], :] = trips_month[i]
-        day_imp["transit"]["cost"] /= trips_per_month
+        day_imp["transit"]["cost"] = self._per_day_cost(
+            day_imp["transit"]["cost"], trips_month, purpose.sub_bounds)
         return day_imp
+
+    def _day_impedance(self,
+                       impedance: Dict[str, Dict[str, Dict[str, numpy.ndarray]]],
+                       share: Dict[str, Tuple[float, float]],
+                       ass_class: str,
+                       mtx_type: str,
+                       rows: slice,
+                       cols: slice) -> numpy.ndarray:
+        """Get (cached) time-period weighted impedance matrix."""
+        time_periods = [tp for tp in impedance
+            if ass_class in impedance[tp][mtx_type]]
+        key = (tuple((tp, tuple(share[tp])) for tp in time_periods),
+               ass_class, mtx_type,
+               (rows.start, rows.stop), (cols.start, cols.stop))
+        try:
+            day_imp = self._cache[key]
+            self.cache_hits += 1
+        except KeyError:
+            day_imp = numpy.zeros(
+                (rows.stop - rows.start, cols.stop - cols.start),
+                float_dtype())
+            for tp in time_periods:
+                imp = impedance[tp][mtx_type][ass_class]
+                day_imp += share[tp][0] * imp[rows, cols]
+                day_imp += share[tp][1] * imp[cols, rows].T
+            self._cache[key] = self._read_only(day_imp)
+            self.cache_misses += 1
+        return day_imp
+
+    def _per_day_cost(self,
+                      cost: numpy.ndarray,
+                      trips_month: Tuple[float, ...],
+                      sub_bounds: list) -> numpy.ndarray:
+        """Get (cached) transit cost matrix divided by trips per month."""
+        key: Tuple[Any, ...] = (
+            id(cost), tuple(trips_month),
+            tuple((bounds.start, bounds.stop) for bounds in sub_bounds))
+        try:
+            return self._cache[key]
+        except KeyError:
+            trips_per_month = numpy.full_like(cost, trips_month[0])
+            for i in range(1, len(sub_bounds)):
+                trips_per_month[sub_bounds[i], :] = trips_month[i]
+            day_cost = self._read_only(cost / trips_per_month)
+            self._cache[key] = day_cost
+            return day_cost
+
+    def _read_only(self, mtx: numpy.ndarray) -> numpy.ndarray:
+        mtx.flags.writeable = False
+        return mtx
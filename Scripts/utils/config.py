@@ -62,6 +62,10 @@ class Config:
         self.SAVE_MATRICES_IN_EMME = False
         self.DELETE_STRATEGY_FILES = False
         self.USE_FIXED_TRANSIT_COST = False
+        self.SEC_DEST_BACKEND = None
+        self.RESULT_FORMAT = "txt"
+        self.VALIDATION = None
+        self.ZONE_DATA_CACHE_DIR = None
         for key in config.pop("OPTIONAL_FLAGS"):
             self.__dict__[key] = True
         for key in config:
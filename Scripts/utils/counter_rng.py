@@ -0,0 +1,90 @@
+from typing import Optional
+import os
+import zlib
+import numpy # type: ignore
+
+import utils.log as log
+
+
+# Constants of the SplitMix64 generator
+_GOLDEN_GAMMA = numpy.uint64(0x9E3779B97F4A7C15)
+_MIX_1 = numpy.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = numpy.uint64(0x94D049BB133111EB)
+
+
+def _mix(x: numpy.ndarray) -> numpy.ndarray:
+    """Scramble array of 64-bit integers (SplitMix64 finalizer)."""
+    x = x ^ (x >> numpy.uint64(30))
+    x = x * _MIX_1
+    x = x ^ (x >> numpy.uint64(27))
+    x = x * _MIX_2
+    return x ^ (x >> numpy.uint64(31))
+
+
+class CounterRNG:
+    """Counter-based random number generator.
+
+    A draw is a pure function of the seed, the kind of draw and the
+    integer keys identifying the drawing agent (e.g., person and tour).
+    Hence draws do not depend on the order in which agents are handled,
+    and any partitioning of agents between workers gives the same result.
+
+    Parameters
+    ----------
+    seed : int (optional)
+        Seed common to all streams.
+        If None, a random seed is drawn and logged,
+        so that the run can be repeated.
+    """
+
+    def __init__(self, seed: Optional[int] = None):
+        if seed is None:
+            seed = int.from_bytes(os.urandom(8), "little")
+            log.info("Random seed for population draws: {}".format(seed))
+        self.seed = seed
+        self._seed = _mix(numpy.array([seed], numpy.uint64))
+
+    def _hash(self, kind: str, keys) -> numpy.ndarray:
+        kind_key = numpy.uint64(zlib.crc32(kind.encode()))
+        h = _mix(self._seed ^ kind_key)
+        for key in keys:
+            h = _mix((h ^ numpy.asarray(key).astype(numpy.uint64))
+                     + _GOLDEN_GAMMA)
+        return h
+
+    def uniform(self, kind: str, *keys) -> numpy.ndarray:
+        """Get uniform draws from interval [0, 1).
+
+        Parameters
+        ----------
+        kind : str
+            Name of draw (sex/car_use/mode/...)
+        *keys : int or numpy.ndarray
+            Keys of drawing agents, broadcast against each other
+
+        Returns
+        -------
+        numpy.ndarray
+            Draws, shape broadcast from `keys`
+        """
+        return (self._hash(kind, keys) >> numpy.uint64(11)) * 2.0**-53
+
+    def standard_normal(self, kind: str, *keys) -> numpy.ndarray:
+        """Get draws from standard normal distribution.
+
+        Parameters
+        ----------
+        kind : str
+            Name of draw (income/...)
+        *keys : int or numpy.ndarray
+            Keys of drawing agents, broadcast against each other
+
+        Returns
+        -------
+        numpy.ndarray
+            Draws, shape broadcast from `keys`
+        """
+        # Box-Muller transform
+        u = 1 - self.uniform(kind, *keys, 0)
+        v = self.uniform(kind, *keys, 1)
+        return numpy.sqrt(-2 * numpy.log(u)) * numpy.cos(2 * numpy.pi * v)
@@ -1,34 +1,104 @@
+from typing import Optional, Tuple, Union
 import numpy # type: ignore
+import pandas # type: ignore
 
 import parameters.tour_generation as param
+import utils.log as log
+from utils.memory import float_dtype
 
 
-def fratar(target_vect, trips, max_iter=10):
+def fratar(target_vect: Union[numpy.ndarray, pandas.Series],
+           trips: pandas.DataFrame,
+           max_iter: Optional[int] = None,
+           attraction: Optional[Union[numpy.ndarray, pandas.Series]] = None
+          ) -> pandas.DataFrame:
     """Perform fratar adjustment of matrix.
 
     Parameters
     ----------
     target_vect : numpy/pandas array
-        Production/attraction target
+        Production (and attraction) target
     trips : pandas DataFrame
         Seed trip matrix
-    max_iter (optional) : int
-        Maximum iterations, default is 10
+    max_iter : int (optional)
+        Maximum iterations, default is set in parameters
+    attraction : numpy/pandas array (optional)
+        Attraction target, if different from production target
     
     Returns
     -------
     pandas DataFrame 
         Fratared trip matrix
     """
-    # Run 2D balancing
-    for _ in range(0, max_iter):
-        colsum = trips.sum("columns")
-        colsum[colsum == 0] = 1
-        trips = trips.mul(target_vect/colsum, "index")
-        rowsum = trips.sum("index")
-        rowsum[rowsum == 0] = 1
-        trips = trips.mul(target_vect/rowsum, "columns")
-    return trips
+    b = param.freight_balancing
+    if max_iter is None:
+        max_iter = int(b["max_iterations"])
+    tolerance = float(b["tolerance"])
+    # Balancing is done in double precision, as tolerance may not be
+    # reachable with single precision sums
+    mtx = trips.to_numpy(dtype=numpy.float64, copy=True)
+    iterations, residual = balance(
+        mtx, target_vect, target_vect if attraction is None else attraction,
+        max_iter, tolerance)
+    msg = "Fratar balancing: {} iterations, max relative error {:.2e}".format(
+        iterations, residual)
+    if residual >= tolerance:
+        log.warn(msg + ", tolerance {:.0e} not reached".format(tolerance))
+    else:
+        log.info(msg)
+    return pandas.DataFrame(
+        mtx.astype(float_dtype(), copy=False), trips.index, trips.columns)
+
+def balance(trips: numpy.ndarray,
+            production: Union[numpy.ndarray, pandas.Series],
+            attraction: Union[numpy.ndarray, pandas.Series],
+            max_iter: int,
+            tolerance: float) -> Tuple[int, float]:
+    """Balance matrix in place with iterative proportional fitting.
+
+    Rows and columns are scaled in turn, at least once, until relative
+    errors of both row and column sums are under tolerance.
+
+    Parameters
+    ----------
+    trips : numpy.ndarray
+        Seed trip matrix, which is balanced in place
+    production : numpy/pandas array
+        Production target (row sums)
+    attraction : numpy/pandas array
+        Attraction target (column sums)
+    max_iter : int
+        Maximum iterations
+    tolerance : float
+        Max relative error in row and column sums
+
+    Returns
+    -------
+    int
+        Number of iterations run
+    float
+        Max relative error in row and column sums
+    """
+    production = numpy.asarray(production, trips.dtype)
+    attraction = numpy.asarray(attraction, trips.dtype)
+    iterations = 0
+    residual = numpy.inf
+    while iterations < max(max_iter, 1) and residual >= tolerance:
+        row_sums = trips.sum(1)
+        row_sums[row_sums == 0] = 1
+        trips *= (production / row_sums)[:, numpy.newaxis]
+        col_sums = trips.sum(0)
+        col_sums[col_sums == 0] = 1
+        trips *= attraction / col_sums
+        iterations += 1
+        residual = max(_max_rel_error(trips.sum(1), production),
+                       _max_rel_error(trips.sum(0), attraction))
+    return iterations, residual
+
+def _max_rel_error(sums: numpy.ndarray, target: numpy.ndarray) -> float:
+    error = numpy.abs(sums - target)
+    numpy.divide(error, target, out=error, where=(target != 0))
+    return float(error.max()) if error.size > 0 else 0.0
 
 def calibrate(calib_base, production_base, production_forecast):
     """Calibrate a forecast according to calibrated base matrix.
@@ -0,0 +1,56 @@
+import sys
+from typing import Optional
+import numpy # type: ignore
+try:
+    import resource
+    _use_resource = True
+except ImportError:
+    # Not available on Windows
+    _use_resource = False
+
+import parameters.assignment as param
+
+
+def float_dtype() -> numpy.dtype:
+    """Floating point type of demand model matrices.
+
+    Set by `float_precision` in `parameters.assignment`.
+    """
+    return numpy.dtype(param.float_precision)
+
+
+def peak_memory() -> Optional[float]:
+    """Get peak memory use of this process so far.
+
+    Returns
+    -------
+    float or None
+        Peak resident set size (MB), or None if it cannot be measured
+    """
+    if _use_resource:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes and macOS bytes
+        return peak / (2**20 if sys.platform == "darwin" else 2**10)
+    elif sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD),
+                ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        if ctypes.windll.psapi.GetProcessMemoryInfo(
+                ctypes.windll.kernel32.GetCurrentProcess(),
+                ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize / 2**20
+    return None
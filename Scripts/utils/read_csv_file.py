@@ -1,19 +1,57 @@
-from decimal import DivisionByZero
-from itertools import groupby
+import hashlib
+import json
 import os
-from typing import Optional
+from typing import Dict, Optional, Tuple, Union
 import pandas
 import numpy # type: ignore
 
+import parameters.zone as param
 import utils.log as log
 
 
+# Version of cached data format, change to invalidate old cache files
+CACHE_VERSION = 2
+
+# SHA-256 digests of file contents, keyed by path, size and modification time
+_file_digests: Dict[Tuple[str, int, int], bytes] = {}
+
+
+def file_digest(path: str) -> bytes:
+    """Get SHA-256 digest of file contents.
+
+    Digests are stored for the rest of the run,
+    so each unchanged file is read for hashing only once.
+
+    Parameters
+    ----------
+    path : str
+        Path to file
+
+    Returns
+    -------
+    bytes
+        Digest of file contents
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    if key not in _file_digests:
+        with open(path, "rb") as f:
+            _file_digests[key] = hashlib.sha256(f.read()).digest()
+    return _file_digests[key]
+
+
 def read_csv_file(data_dir: str, 
                   file_end: str, 
                   zone_numbers: Optional[numpy.ndarray] = None, 
                   dtype: Optional[numpy.dtype] = None, 
                   squeeze: bool=False) -> pandas.DataFrame:
     """Read (zone) data from space-separated file.
+
+    If `zone_data_cache_dir` is set in `parameters.zone`,
+    parsed, validated and mapped numeric data is cached there,
+    with content hash of input files and arguments as key.
+    Hence unchanged files are parsed only once.
     
     Parameters
     ----------
@@ -47,6 +85,81 @@ def read_csv_file(data_dir: str,
         msg = "No {} file found in folder {}".format(file_end, data_dir)
         # This error should not be logged, as it is sometimes excepted
         raise NameError(msg)
+    map_path = os.path.join(data_dir, "zone_mapping.txt")
+    cache_path = None
+    if param.zone_data_cache_dir is not None:
+        h = hashlib.sha256(repr(
+            (CACHE_VERSION, file_end, str(dtype), squeeze)).encode())
+        paths = [path]
+        if zone_numbers is not None:
+            h.update(numpy.asarray(zone_numbers, numpy.int64).tobytes())
+            if os.path.exists(map_path):
+                paths.append(map_path)
+        for file_path in paths:
+            h.update(file_digest(file_path))
+        cache_dir = param.zone_data_cache_dir
+        cache_path = os.path.join(cache_dir, h.hexdigest() + ".npz")
+        if os.path.exists(cache_path):
+            try:
+                return _load_cache(cache_path)
+            except (OSError, ValueError, KeyError):
+                log.debug("Could not read cache file {}".format(cache_path))
+    data = _parse_file(path, map_path, file_end, zone_numbers, dtype, squeeze)
+    if cache_path is not None:
+        # Write to temporary file first, so that simultaneous model runs
+        # never read partial files
+        tmp_path = "{}.{}.tmp.npz".format(cache_path[:-4], os.getpid())
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            if _save_cache(tmp_path, data):
+                os.replace(tmp_path, cache_path)
+        except OSError:
+            log.debug("Could not write cache file {}".format(cache_path))
+    return data
+
+
+def _save_cache(path: str,
+                data: Union[pandas.DataFrame, pandas.Series]) -> bool:
+    """Save numeric data to npz file, return False if not numeric."""
+    is_series = isinstance(data, pandas.Series)
+    columns = [data] if is_series else [data[c] for c in data.columns]
+    arrays = {"index": data.index.values}
+    for i, column in enumerate(columns):
+        arrays["col_{}".format(i)] = column.values
+    if any(a.dtype.kind not in "biuf" for a in arrays.values()):
+        # Text columns and mixed types would need pickling
+        return False
+    labels = [data.name] if is_series else list(data.columns)
+    meta = {
+        "series": is_series,
+        "labels": labels,
+        "index_name": data.index.name,
+    }
+    try:
+        arrays["meta"] = numpy.array(json.dumps(meta))
+    except TypeError:
+        return False
+    numpy.savez(path, **arrays)
+    return True
+
+
+def _load_cache(path: str) -> Union[pandas.DataFrame, pandas.Series]:
+    with numpy.load(path, allow_pickle=False) as f:
+        meta = json.loads(str(f["meta"]))
+        index = pandas.Index(f["index"], name=meta["index_name"])
+        columns = [f["col_{}".format(i)] for i in range(len(meta["labels"]))]
+    if meta["series"]:
+        return pandas.Series(columns[0], index, name=meta["labels"][0])
+    return pandas.DataFrame(
+        dict(zip(meta["labels"], columns)), index, columns=meta["labels"])
+
+
+def _parse_file(path: str,
+                map_path: str,
+                file_end: str,
+                zone_numbers: Optional[numpy.ndarray],
+                dtype: Optional[numpy.dtype],
+                squeeze: bool) -> pandas.DataFrame:
     header: Optional[str] = None if squeeze else "infer"
     data: pandas.DataFrame = pandas.read_csv(
         path, delim_whitespace=True, squeeze=squeeze, keep_default_na=False,
@@ -71,14 +184,13 @@ def read_csv_file(data_dir: str,
         if not data.index.is_monotonic:
             data.sort_index(inplace=True)
             log.warn("File {} is not sorted in ascending order".format(path))
-        map_path = os.path.join(data_dir, "zone_mapping.txt")
         if os.path.exists(map_path):
             log_path = map_path
             mapping = pandas.read_csv(map_path, delim_whitespace=True).squeeze()
             if "total" in data.columns:
                 # If file contains total and shares of total,
                 # shares are aggregated as averages with total as weight
-                data = data.groupby(mapping).agg(avg, weights=data["total"])
+                data = weighted_avg(data, mapping, "total")
             elif "detach" in data.columns:
                 funcs = dict.fromkeys(data.columns, "sum")
                 funcs["detach"] = "mean"
@@ -89,12 +201,12 @@ def read_csv_file(data_dir: str,
         else:
             log_path = path
         if data.index.size != zone_numbers.size or (data.index != zone_numbers).any():
-            for i in data.index:
-                if int(i) not in zone_numbers:
-                    msg = "Zone number {} from file {} not found in network".format(
-                        i, log_path)
-                    log.error(msg)
-                    raise IndexError(msg)
+            not_found = ~numpy.isin(data.index.astype(int), zone_numbers)
+            if not_found.any():
+                msg = "Zone number {} from file {} not found in network".format(
+                    data.index[not_found][0], log_path)
+                log.error(msg)
+                raise IndexError(msg)
             for i in zone_numbers:
                 if i not in data.index:
                     if log_path == map_path and i in mapping.array:
@@ -117,10 +229,44 @@ def read_csv_file(data_dir: str,
             raise ValueError(msg)
     return data
 
-def avg (data, weights):
-    if data.name == weights.name:
-        return sum(data)
-    try:
-        return numpy.average(data, weights=weights[data.index])
-    except ZeroDivisionError:
-        return 0
+def weighted_avg(data: pandas.DataFrame,
+                 mapping: pandas.Series,
+                 weights: str) -> pandas.DataFrame:
+    """Aggregate data to groups as weighted averages.
+
+    Parameters
+    ----------
+    data : pandas.DataFrame
+        Data to be aggregated
+    mapping : pandas.Series
+        Group (e.g., model zone) for each index value in data,
+        data rows not found in mapping are left out
+    weights : str
+        Name of column used as weights, which is aggregated as sum
+
+    Returns
+    -------
+    pandas.DataFrame
+        Aggregated data with groups as index (in ascending order),
+        average is zero for groups with zero weight
+    """
+    groups = mapping.reindex(data.index)
+    is_mapped = groups.notna().values
+    codes, index = pandas.factorize(groups[is_mapped], sort=True)
+    # Reindexing adds NaN for unmapped rows, which makes groups float
+    index = index.astype(mapping.dtype)
+    w = data[weights].values[is_mapped].astype(float)
+    weight_sums = numpy.bincount(codes, w, len(index))
+    aggregated = {}
+    for column in data.columns:
+        if column == weights:
+            aggregated[column] = weight_sums.astype(data[column].dtype)
+        else:
+            sums = numpy.bincount(
+                codes, w * data[column].values[is_mapped], len(index))
+            aggregated[column] = numpy.divide(
+                sums, weight_sums, out=numpy.zeros_like(sums),
+                where=(weight_sums != 0))
+    return pandas.DataFrame(
+        aggregated, pandas.Index(index, name=mapping.name),
+        columns=data.columns)
@@ -163,6 +163,10 @@ class AreaAggregator(ZoneIntervals):
                 if is_in(self._intervals[area], zone_number):
                     self.mapping[zone_number] = area
                     break
+        keys = list(self.keys)
+        self._area_index = pandas.Series(
+            [keys.index(area) for area in self.mapping.values()],
+            list(self.mapping))
 
 
 class MatrixAggregator(AreaAggregator):
@@ -185,6 +189,22 @@ class MatrixAggregator(AreaAggregator):
         """
         self.matrix.at[self.mapping[orig], self.mapping[dest]] += 1
 
+    def add_many(self, origs, dests):
+        """Add several individual tours to aggregated matrix.
+
+        Parameters
+        ----------
+        origs : numpy.ndarray
+            Tour origin zone numbers
+        dests : numpy.ndarray
+            Tour destination zone numbers
+        """
+        n = len(self.matrix)
+        i = self._area_index.loc[origs].values
+        j = self._area_index.loc[dests].values
+        self.matrix += numpy.bincount(
+            i*n + j, minlength=n*n).reshape(n, n)
+
     def aggregate(self, matrix):
         """Aggregate (tour demand) matrix to larger areas.
 
@@ -222,6 +242,17 @@ class ArrayAggregator(AreaAggregator):
         """
         self.array.at[self.mapping[zone]] += 1
 
+    def add_many(self, zones):
+        """Add several individual tours to aggregated array.
+
+        Parameters
+        ----------
+        zones : numpy.ndarray
+            Zone numbers
+        """
+        self.array += numpy.bincount(
+            self._area_index.loc[zones].values, minlength=len(self.array))
+
     def aggregate(self, array):
         """Aggregate (tour demand) array to larger areas.
 